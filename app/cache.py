@@ -0,0 +1,195 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from bson.objectid import ObjectId
+
+from app.recipe_shema import RecipeRecord
+
+
+class _UserRecipesEntry:
+    """Cached recipes of one user with their expiration times.
+    Recipes are kept in order of caching, so the ones expiring first are at the beginning.
+    """
+    __slots__ = ('recipes',)
+
+    def __init__(self):
+        self.recipes: dict[ObjectId, tuple[float, RecipeRecord]] = {}
+
+    def drop_expired_recipes(self, now: float) -> None:
+        while self.recipes:
+            recipe_id, (expires_at, _) = next(iter(self.recipes.items()))
+            if expires_at > now:
+                return
+            del self.recipes[recipe_id]
+
+
+class RecipesCache:
+    """
+    In-process LRU cache of user recipes with TTL.
+    Holds recipes of at most `max_users` users and at most `max_recipes_per_user`
+    recipes of each user. Recipe expires `ttl` seconds after it was read from DB,
+    so changes made by other bot processes become visible after that time.
+    Changes made by this process update cached recipes without prolonging their time.
+    """
+
+    def __init__(
+        self,
+        max_users: int,
+        max_recipes_per_user: int,
+        ttl: float,
+        timer: Callable[[], float] = time.monotonic
+    ):
+        self.max_users = max_users
+        self.max_recipes_per_user = max_recipes_per_user
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._timer = timer
+        self._entries: OrderedDict[int, _UserRecipesEntry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get_entry(self, user_id: int) -> Optional[_UserRecipesEntry]:
+        """Return entry of user without expired recipes and mark it as recently used."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        entry.drop_expired_recipes(self._timer())
+        if not entry.recipes:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def _get_or_create_entry(self, user_id: int) -> _UserRecipesEntry:
+        """Return entry of user for writing, evicting least recently used users."""
+        entry = self._get_entry(user_id)
+        if entry is None:
+            entry = _UserRecipesEntry()
+            self._entries[user_id] = entry
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return entry
+
+    def get_recipe(self, user_id: int, recipe_id: ObjectId) -> Optional[RecipeRecord]:
+        """Return cached recipe.
+
+        Args:
+            user_id (int): id of user in db.
+            recipe_id (ObjectId): id of recipe in db.
+
+        Returns:
+            Optional[RecipeRecord]: recipe. None if recipe is not cached.
+        """
+        entry = self._get_entry(user_id)
+        cached_recipe = None if entry is None else entry.recipes.get(recipe_id)
+        recipe = None if cached_recipe is None else cached_recipe[1]
+        if recipe is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return recipe
+
+    def has_recipes(self, user_id: int) -> bool:
+        """Check if any recipe of user is cached.
+        False doesn't mean that user has no recipes.
+
+        Args:
+            user_id (int): id of user in db.
+
+        Returns:
+            bool: True if there is cached recipe. Otherwise False.
+        """
+        entry = self._get_entry(user_id)
+        has_cached_recipes = entry is not None and bool(entry.recipes)
+        if has_cached_recipes:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return has_cached_recipes
+
+    def put_recipes(self, user_id: int, recipes: Iterable[RecipeRecord]) -> None:
+        """Add or replace recipes of user.
+
+        Args:
+            user_id (int): id of user in db.
+            recipes (Iterable[RecipeRecord]): actual state of recipes.
+        """
+        entry = self._get_or_create_entry(user_id)
+        expires_at = self._timer() + self.ttl
+        for recipe in recipes:
+            entry.recipes.pop(recipe.id, None)
+            entry.recipes[recipe.id] = (expires_at, recipe)
+            if len(entry.recipes) > self.max_recipes_per_user:
+                del entry.recipes[next(iter(entry.recipes))]
+
+    def put_recipe(self, user_id: int, recipe: RecipeRecord) -> None:
+        """Add or replace recipe of user.
+
+        Args:
+            user_id (int): id of user in db.
+            recipe (RecipeRecord): actual state of recipe.
+        """
+        self.put_recipes(user_id, [recipe])
+
+    def put_missing_recipes(self, user_id: int, recipes: Iterable[RecipeRecord]) -> None:
+        """Add recipes of user that are not cached yet, keeping cached ones.
+        Used for reads that may be served by a lagging secondary,
+        so they don't replace fresher recipes written through by this process.
+
+        Args:
+            user_id (int): id of user in db.
+            recipes (Iterable[RecipeRecord]): possibly stale state of recipes.
+        """
+        entry = self._get_entry(user_id)
+        if entry is not None:
+            recipes = [recipe for recipe in recipes if recipe.id not in entry.recipes]
+        self.put_recipes(user_id, recipes)
+
+    def update_recipe(self, user_id: int, recipe_id: ObjectId, update: dict) -> None:
+        """Update fields of cached recipe if it is cached.
+
+        Args:
+            user_id (int): id of user in db.
+            recipe_id (ObjectId): id of recipe in db.
+            update (dict): new values of recipe fields.
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None and recipe_id in entry.recipes:
+            expires_at, recipe = entry.recipes[recipe_id]
+            entry.recipes[recipe_id] = (expires_at, recipe._replace(**update))
+
+    def remove_recipe(self, user_id: int, recipe_id: ObjectId) -> None:
+        """Remove recipe of user from cache.
+
+        Args:
+            user_id (int): id of user in db.
+            recipe_id (ObjectId): id of recipe in db.
+        """
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry.recipes.pop(recipe_id, None)
+
+    def mark_all_unused(self, user_id: int, tag: Optional[str] = None) -> None:
+        """Mark all cached recipes of user as unused.
+
+        Args:
+            user_id (int): id of user in db.
+            tag (Optional[str]): mark only recipes with this tag.
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        for recipe_id, (expires_at, recipe) in entry.recipes.items():
+            if recipe.is_used and (tag is None or tag in recipe.tags):
+                entry.recipes[recipe_id] = (expires_at, recipe._replace(is_used=False))
+
+    def invalidate(self, user_id: int) -> None:
+        """Remove all cached recipes of user.
+
+        Args:
+            user_id (int): id of user in db.
+        """
+        self._entries.pop(user_id, None)
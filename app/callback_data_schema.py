@@ -1,9 +1,12 @@
-from typing import Union
+import base64
+import binascii
+import struct
+from typing import Optional
 
-from aiogram.types.callback_query import CallbackQuery
 from bson import json_util
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel
 
 
 class ActionCallbackData(BaseModel):
@@ -39,24 +42,99 @@ class DeleteRecipeCallbackData(ActionCallbackData, RecipeIdCallbackData):
     action: str = 'delete'
 
 
-def is_valid_schema_for_callback(
-    callback: CallbackQuery,
-    schema: Union[ActionCallbackData, RecipeIdCallbackData]
+class NextRecipesPageCallbackData(ActionCallbackData, RecipeIdCallbackData):
+    """ID is the last recipe of current page."""
+    action: str = 'next_page'
 
-) -> bool:
-    """Check whether callback query matched to schema.
+
+class PreviousRecipesPageCallbackData(ActionCallbackData, RecipeIdCallbackData):
+    """ID is the first recipe of current page."""
+    action: str = 'previous_page'
+
+
+class NextSearchPageCallbackData(ActionCallbackData, RecipeIdCallbackData):
+    """ID is the last recipe of current page of search results. Query is kept in FSM storage bucket."""
+    action: str = 'next_search_page'
+
+
+class PreviousSearchPageCallbackData(ActionCallbackData, RecipeIdCallbackData):
+    """ID is the first recipe of current page of search results. Query is kept in FSM storage bucket."""
+    action: str = 'previous_search_page'
+
+
+# Compact callback data is `version | action tag | ObjectId` packed into 14 bytes
+# and encoded with urlsafe base64 without padding (19 chars).
+# Tags must never be reused because old buttons stay in chats forever.
+COMPACT_CALLBACK_DATA_VERSION = 1
+COMPACT_CALLBACK_DATA_HEADER = struct.Struct('BB')
+ACTION_TAGS = {
+    'detail': 1,
+    'use': 2,
+    'unuse': 3,
+    'delete': 4,
+    'next_page': 5,
+    'previous_page': 6,
+    'next_search_page': 7,
+    'previous_search_page': 8,
+}
+_TAG_ACTIONS = {tag: action for action, tag in ACTION_TAGS.items()}
+
+
+def encode_callback_data(callback_data: RecipeIdCallbackData) -> str:
+    """Encode callback data in compact binary format.
+
+    Args:
+        callback_data (RecipeIdCallbackData): callback data with action and recipe id.
+
+    Returns:
+        str: callback data for telegram button.
+    """
+    header = COMPACT_CALLBACK_DATA_HEADER.pack(COMPACT_CALLBACK_DATA_VERSION,
+                                               ACTION_TAGS[callback_data.action])
+    return base64.urlsafe_b64encode(header + callback_data.id.binary).rstrip(b'=').decode()
+
+
+def _decode_compact_callback_data(raw_data: str) -> Optional[dict]:
+    """Decode callback data encoded by `encode_callback_data`.
+
+    Args:
+        raw_data (str): data of telegram callback query.
+
+    Returns:
+        Optional[dict]: callback data fields. None if data is malformed.
+    """
+    padding = '=' * (-len(raw_data) % 4)
+    try:
+        packed_data = base64.urlsafe_b64decode(raw_data + padding)
+    except (binascii.Error, ValueError):
+        return None
+    header_size = COMPACT_CALLBACK_DATA_HEADER.size
+    if len(packed_data) != header_size + 12:
+        return None
+    version, action_tag = COMPACT_CALLBACK_DATA_HEADER.unpack_from(packed_data)
+    if version != COMPACT_CALLBACK_DATA_VERSION or action_tag not in _TAG_ACTIONS:
+        return None
+    return {'action': _TAG_ACTIONS[action_tag], 'id': ObjectId(packed_data[header_size:])}
+
+
+def decode_callback_data(raw_data: Optional[str]) -> Optional[dict]:
+    """Decode callback data of any supported format.
+    Buttons created before compact format contain extended JSON.
 
     Args:
-        callback (CallbackQuery): telegram callback query.
-        schema (ActionCallbackData | RecipeIdCallbackData): one of the shemes
+        raw_data (Optional[str]): data of telegram callback query.
 
     Returns:
-        bool: True if callback is formed by schema. Otherwise False.
+        Optional[dict]: callback data fields. None if data is malformed.
     """
-    raw_data = callback.data
+    if not raw_data:
+        return None
+    if not raw_data.startswith('{'):
+        return _decode_compact_callback_data(raw_data)
     try:
-        callback_data = schema.parse_raw(raw_data)
-    except ValidationError:
-        return False
-    is_same_action = (schema.__fields__['action'].default == callback_data.action)
-    return is_same_action
+        payload = json_util.loads(raw_data)
+    except (ValueError, TypeError, InvalidId):
+        return None
+    if not isinstance(payload, dict):
+        return None
+    return payload
@@ -0,0 +1,80 @@
+from typing import Awaitable, Callable, Optional
+
+from aiogram.types.callback_query import CallbackQuery
+from pydantic import ValidationError
+
+from app.callback_data_schema import ActionCallbackData, decode_callback_data
+from app.context import current_handler_name, current_recipe_id
+
+
+CallbackHandler = Callable[[CallbackQuery, ActionCallbackData], Awaitable]
+
+
+class CallbackRouter:
+    """
+    Routes callback queries to handlers by action of callback data.
+    Callback data is decoded once per update and the decoded schema instance
+    is passed to the handler, so handlers don't have to parse it again.
+    """
+
+    def __init__(self):
+        self._routes: dict[str, tuple[type[ActionCallbackData], CallbackHandler]] = {}
+
+    def handler(self, schema: type[ActionCallbackData]) -> Callable[[CallbackHandler], CallbackHandler]:
+        """Register handler for callback data schema.
+
+        Args:
+            schema (type[ActionCallbackData]): callback data schema with default action.
+
+        Raises:
+            ValueError: raises if handler for this action is already registered.
+
+        Returns:
+            Callable[[CallbackHandler], CallbackHandler]: decorator.
+        """
+        action = schema.__fields__['action'].default
+
+        def decorator(callback_handler: CallbackHandler) -> CallbackHandler:
+            if action in self._routes:
+                raise ValueError(f'Handler for action {action} is already registered')
+            self._routes[action] = (schema, callback_handler)
+            return callback_handler
+        return decorator
+
+    def parse(self, raw_data: str) -> Optional[tuple[ActionCallbackData, CallbackHandler]]:
+        """Decode callback data and find handler for it.
+
+        Args:
+            raw_data (str): data of telegram callback query.
+
+        Returns:
+            Optional[tuple[ActionCallbackData, CallbackHandler]]: callback data and its handler.
+                None if callback data is malformed or there is no handler for its action.
+        """
+        payload = decode_callback_data(raw_data)
+        if payload is None:
+            return None
+        route = self._routes.get(payload.get('action'))
+        if route is None:
+            return None
+        schema, callback_handler = route
+        try:
+            callback_data = schema.parse_obj(payload)
+        except ValidationError:
+            return None
+        return callback_data, callback_handler
+
+    async def dispatch(self, callback_query: CallbackQuery):
+        """Handle callback query by registered handler.
+        Should be registered as the only callback query handler of dispatcher.
+
+        Args:
+            callback_query (CallbackQuery): telegram callback query.
+        """
+        parsed_callback = self.parse(callback_query.data)
+        if parsed_callback is None:
+            return None
+        callback_data, callback_handler = parsed_callback
+        current_handler_name.set(callback_handler.__name__)
+        current_recipe_id.set(str(callback_data.id) if hasattr(callback_data, 'id') else None)
+        return await callback_handler(callback_query, callback_data)
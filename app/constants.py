@@ -1 +1,34 @@
 MAXIMUM_COUNT_OF_RETURNED_RECIPES = 100
+RECIPES_PAGE_SIZE = 20
+# Key of `/find` query in FSM bucket of user. Bucket is apart from FSM data,
+# so the query isn't reset by `state.finish()` of `/add` and `/import` dialogs.
+SEARCH_QUERY_BUCKET_KEY = 'search_query'
+MAXIMUM_RANDOM_DRAW_ATTEMPTS = 5
+# Recipes are counted again if counters of user were changed by writes while recipes were counted.
+MAXIMUM_USER_STATS_COUNT_ATTEMPTS = 3
+# Max count of recipes drawn by one `/random N`.
+MAXIMUM_RANDOM_RECIPES_COUNT = 20
+MAXIMUM_RECIPE_TAGS_COUNT = 10
+# `sample` draws by Mongo `$sample`, `weighted` draws from in-process sampler weighted by recency of use.
+SAMPLE_DRAW_ENGINE = 'sample'
+WEIGHTED_DRAW_ENGINE = 'weighted'
+# Weight of recipe used just now. Weight of recipes which weren't used recently is 1.
+MINIMUM_RECENCY_WEIGHT = 0.1
+# Count of rendered recipe buttons and detail markups kept in memory.
+RENDERED_KEYBOARDS_CACHE_SIZE = 10000
+
+PER_USER_STORAGE_MODE = 'per_user'
+SHARED_STORAGE_MODE = 'shared'
+
+MIGRATION_BATCH_SIZE = 500
+
+IMPORT_BATCH_SIZE = 500
+# Bots can't download files bigger than 20 MB.
+MAXIMUM_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+
+EXPORT_BATCH_SIZE = 500
+JSON_EXPORT_FORMAT = 'json'
+CSV_EXPORT_FORMAT = 'csv'
+
+MEMORY_FSM_STORAGE = 'memory'
+REDIS_FSM_STORAGE = 'redis'
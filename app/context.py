@@ -0,0 +1,10 @@
+from contextvars import ContextVar
+from typing import Optional
+
+
+UNKNOWN_HANDLER_NAME = 'unknown'
+
+# Name of the handler processing current update. Set by middlewares and callback router.
+current_handler_name: ContextVar[str] = ContextVar('current_handler_name', default=UNKNOWN_HANDLER_NAME)
+# Id of the recipe from callback data of current update.
+current_recipe_id: ContextVar[Optional[str]] = ContextVar('current_recipe_id', default=None)
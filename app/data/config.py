@@ -1,22 +1,145 @@
 import os
+from collections.abc import Callable
 
 
-TG_TOKEN = os.environ['TG_TOKEN']
+# Required settings are read from environment on first access, see `__getattr__`,
+# so modules can be imported by tests and tools without production environment.
+_REQUIRED_SETTINGS_ENV_NAMES = {
+    'TG_TOKEN': 'TG_TOKEN',
+    'WEBHOOK_HOST': 'WEBHOOK_HOST',
+    'WEBHOOK_PATH': 'WEBHOOK_PATH',
+    'WEBHOOK_PORT': 'WEBHOOK_PORT',
+    'WEBAPP_HOST': 'WEBAPP_HOST',
+    'WEBAPP_PORT': 'WEBAPP_PORT',
+    'MONGO_USER': 'MONGO_USER',
+    'MONGO_PASSWORD': 'MONGO_PASSWORD',
+    'MONGO_HOST': 'MONGO_HOST',
+    'MONGO_PORT': 'MONGO_PORT',
+    'MONGO_RECIPE_DB_NAME': 'MONGO_RECIPE_DB',
+}
+_DERIVED_SETTINGS: dict[str, Callable[[], str]] = {
+    'WEBHOOK_URL': lambda: f"https://{_get('WEBHOOK_HOST')}:{_get('WEBHOOK_PORT')}{_get('WEBHOOK_PATH')}",
+    'MONGO_URI': lambda: f"mongodb://{_get('MONGO_USER')}:{_get('MONGO_PASSWORD')}"
+                         f"@{_get('MONGO_HOST')}:{_get('MONGO_PORT')}",
+}
 
-WEBHOOK_HOST = os.environ['WEBHOOK_HOST']
-WEBHOOK_PATH = os.environ['WEBHOOK_PATH']
-WEBHOOK_PORT = os.environ['WEBHOOK_PORT']
-WEBHOOK_URL = f"https://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}"
 
-WEBAPP_HOST = os.environ['WEBAPP_HOST']
-WEBAPP_PORT = os.environ['WEBAPP_PORT']
+def __getattr__(name: str) -> str:
+    """Read required setting on first access and keep it as module attribute.
+
+    Args:
+        name (str): name of setting.
+
+    Raises:
+        KeyError: raises if environment variable of setting is not set.
+        AttributeError: raises if there is no such setting.
+
+    Returns:
+        str: value of setting.
+    """
+    if name in _REQUIRED_SETTINGS_ENV_NAMES:
+        value = os.environ[_REQUIRED_SETTINGS_ENV_NAMES[name]]
+    elif name in _DERIVED_SETTINGS:
+        value = _DERIVED_SETTINGS[name]()
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def _get(name: str) -> str:
+    return globals()[name] if name in globals() else __getattr__(name)
+
 
 WEBHOOK_SSL_CERT = './webhook_cert.pem'
 WEBHOOK_SSL_PRIV = './webhook_pkey.pem'
 
-MONGO_USER = os.environ['MONGO_USER']
-MONGO_PASSWORD = os.environ['MONGO_PASSWORD']
-MONGO_HOST = os.environ['MONGO_HOST']
-MONGO_PORT = os.environ['MONGO_PORT']
-MONGO_RECIPE_DB_NAME = os.environ['MONGO_RECIPE_DB']
-MONGO_URI = f'mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}'
+# Seconds to wait for update handler before answering webhook request, the rest is done in background.
+WEBHOOK_RESPONSE_TIMEOUT = float(os.environ.get('WEBHOOK_RESPONSE_TIMEOUT', 1))
+# Seconds to finish background updates on shutdown. Must be less than stop timeout of container.
+WEBHOOK_DRAIN_TIMEOUT = float(os.environ.get('WEBHOOK_DRAIN_TIMEOUT', 20))
+# Count of Mongo connections opened before accepting updates.
+WEBHOOK_WARM_UP_CONNECTIONS = int(os.environ.get('WEBHOOK_WARM_UP_CONNECTIONS', 10))
+# Skip updates received while bot was stopped.
+SKIP_UPDATES = os.environ.get('SKIP_UPDATES', 'true').lower() == 'true'
+
+# `per_user` keeps a collection for each user, `shared` keeps all recipes in one collection.
+MONGO_STORAGE_MODE = os.environ.get('MONGO_STORAGE_MODE', 'per_user')
+MONGO_RECIPES_COLLECTION_NAME = os.environ.get('MONGO_RECIPES_COLLECTION', 'recipes')
+# Counters of total and used recipes of each user.
+MONGO_USER_STATS_COLLECTION_NAME = os.environ.get('MONGO_USER_STATS_COLLECTION', 'user_stats')
+
+# Connection pool of Mongo client. Motor runs every command in a thread of its executor,
+# so pool size bounds count of concurrent commands of the process.
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ['MONGO_MAX_IDLE_TIME_MS']) if 'MONGO_MAX_IDLE_TIME_MS' in os.environ else None
+# Milliseconds. Bound waiting for slow or unavailable Mongo, so handlers fail instead of hanging.
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 10000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+# Comma separated wire compressors, e.g. `zstd,snappy`. Their python packages must be installed.
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS') or None
+# Write concern: `majority` or count of nodes; journal is enabled with `true`. Server defaults if not set.
+MONGO_WRITE_CONCERN_W = os.environ.get('MONGO_WRITE_CONCERN_W')
+if MONGO_WRITE_CONCERN_W is not None and MONGO_WRITE_CONCERN_W.isdigit():
+    MONGO_WRITE_CONCERN_W = int(MONGO_WRITE_CONCERN_W)
+MONGO_JOURNAL = os.environ['MONGO_JOURNAL'].lower() == 'true' if 'MONGO_JOURNAL' in os.environ else None
+# Read preference of recipe list, detail and export reads, e.g. `secondaryPreferred`.
+# Other reads and all writes go to primary.
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+
+# `sample` (default) or `weighted`, see app.sampling.
+RANDOM_DRAW_ENGINE = os.environ.get('RANDOM_DRAW_ENGINE', 'sample')
+# Seconds. Recipes used within this period before the bag reset are drawn less often by `weighted` engine.
+RANDOM_DRAW_RECENCY_PERIOD = float(os.environ.get('RANDOM_DRAW_RECENCY_PERIOD', 14 * 24 * 60 * 60))
+
+RECIPES_CACHE_MAX_USERS = int(os.environ.get('RECIPES_CACHE_MAX_USERS', 10000))
+RECIPES_CACHE_MAX_RECIPES_PER_USER = int(os.environ.get('RECIPES_CACHE_MAX_RECIPES_PER_USER', 500))
+# Seconds. Bounds staleness when several bot processes share the DB.
+RECIPES_CACHE_TTL = float(os.environ.get('RECIPES_CACHE_TTL', 300))
+
+# `memory` keeps FSM state in process, `redis` shares it between bot processes.
+FSM_STORAGE = os.environ.get('FSM_STORAGE', 'memory')
+REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+REDIS_DB = int(os.environ.get('REDIS_DB', 0))
+REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD')
+REDIS_FSM_PREFIX = os.environ.get('REDIS_FSM_PREFIX', 'recipes_bot_fsm')
+
+MAXIMUM_CONCURRENT_EXPORTS = int(os.environ.get('MAXIMUM_CONCURRENT_EXPORTS', 4))
+
+# Telegram flood limits: about 30 messages per second overall and 1 per second in a chat.
+SEND_GLOBAL_RATE = float(os.environ.get('SEND_GLOBAL_RATE', 30))
+SEND_CHAT_RATE = float(os.environ.get('SEND_CHAT_RATE', 1))
+SEND_CHAT_BURST = float(os.environ.get('SEND_CHAT_BURST', 3))
+SEND_MAX_RETRIES = int(os.environ.get('SEND_MAX_RETRIES', 3))
+SEND_RETRY_BACKOFF = float(os.environ.get('SEND_RETRY_BACKOFF', 1))
+
+# Metrics are served by a separate http server on METRICS_PORT if it is set, never by the public webhook app.
+# Each webhook worker process has its own metrics, so worker N serves them on METRICS_PORT + N.
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ['METRICS_PORT']) if 'METRICS_PORT' in os.environ else None
+
+# Number of webhook worker process, it is set by `server.py --workers` for spawned workers.
+WEBHOOK_WORKER_NUMBER = int(os.environ['WEBHOOK_WORKER_NUMBER']) if 'WEBHOOK_WORKER_NUMBER' in os.environ else None
+# Count of webhook worker processes, it is set by `server.py --workers` for spawned workers.
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 1))
+
+# Seconds to remember ids of handled updates, redelivered updates are dropped.
+UPDATE_DEDUPLICATION_WINDOW = float(os.environ.get('UPDATE_DEDUPLICATION_WINDOW', 300))
+UPDATE_DEDUPLICATION_MAX_SIZE = int(os.environ.get('UPDATE_DEDUPLICATION_MAX_SIZE', 100000))
+
+# Spawned webhook worker N writes logs to its own file, e.g. `logs/recipe_bot.worker1.log`,
+# so workers don't rotate the same file concurrently.
+LOG_FILE = os.environ.get('LOG_FILE', 'logs/recipe_bot.log')
+LOG_ROTATION = os.environ.get('LOG_ROTATION', '5 MB')
+# Minimal level of records written to stderr, file gets all of them.
+LOG_STDERR_LEVEL = os.environ.get('LOG_STDERR_LEVEL', 'INFO')
+# Format and write log records in a background thread, so neither formatting nor I/O blocks the event loop.
+LOG_ENQUEUE = os.environ.get('LOG_ENQUEUE', 'true').lower() == 'true'
+# Write log records as JSON lines with structured fields.
+LOG_SERIALIZE = os.environ.get('LOG_SERIALIZE', 'true').lower() == 'true'
+# Seconds between full tracebacks of the same expected exception.
+LOG_EXCEPTION_SAMPLE_INTERVAL = float(os.environ.get('LOG_EXCEPTION_SAMPLE_INTERVAL', 60))
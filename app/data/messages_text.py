@@ -8,10 +8,26 @@ WELCOME_MESSAGE = 'Привет!\n' \
 
 EMPTY_RECIPES_LIST_MESSAGE = 'Список рецептов пуст. Чтобы добавить рецепт отправьте "/add"'
 SHOWN_RECIPES_MESSAGE = 'Список рецептов:'
-WRITE_RECIPE_NAME_MESSAGE = 'Напишите название рецепта'
+USED_RECIPES_STATS_MESSAGE = 'Использовано {used} из {total}'
+WRITE_RECIPE_NAME_MESSAGE = 'Напишите название рецепта. Можно добавить теги: "Омлет #завтрак #быстро"'
 ADDED_RECIPE_MESSAGE = 'Добавлен рецепт\n'
 SINGLE_SHOWN_RECIPE_MESSAGE = 'Рецепт:\n'
+SEVERAL_SHOWN_RECIPES_MESSAGE = 'Рецепты:'
+WRONG_RANDOM_RECIPES_COUNT_MESSAGE = 'Ошибка! Укажите количество рецептов от 1 до {maximum_count}' \
+                                     ' и тег, например "/random 7" или "/random 3 #завтрак".'
+NO_RECIPES_WITH_TAG_MESSAGE = 'Нет рецептов с тегом #{tag}. Чтобы добавить тег, напишите его' \
+                              ' после названия рецепта: "Омлет #{tag}"'
+RANDOM_DRAW_FAILED_MESSAGE = 'Не удалось выбрать рецепт, попробуйте еще раз.'
 ALL_RECIPES_MARKED_AS_UNUSED_MESSAGE = 'Все рецепты помечены как неиспользованные.'
+SEND_RECIPES_FOR_IMPORT_MESSAGE = 'Отправьте список рецептов, по одному в строке,' \
+                                  ' или файл .txt или .csv с названиями в первой колонке'
+IMPORTED_RECIPES_MESSAGE = 'Добавлено рецептов: '
+IMPORT_FILE_IS_TOO_LARGE_MESSAGE = 'Ошибка! Файл больше 20 МБ.'
+EMPTY_SEARCH_QUERY_MESSAGE = 'Напишите начало названия после команды, например "/find борщ".'
+FOUND_RECIPES_MESSAGE = 'Рецепты по запросу: '
+NOTHING_FOUND_MESSAGE = 'Ничего не найдено.'
+SEARCH_IS_EXPIRED_MESSAGE = 'Поиск устарел, повторите "/find".'
+UNKNOWN_EXPORT_FORMAT_MESSAGE = 'Ошибка! Доступные форматы: "/export json", "/export csv".'
 
 ERROR_THERE_IS_NO_RECIPE_CALLBACK_MESSAGE = 'Ошибка! Рецепт отсутствует.'
 RECIPE_DELETED_MESSAGE = 'Рецепт удален.'
@@ -19,6 +35,8 @@ RECIPE_DELETED_MESSAGE = 'Рецепт удален.'
 MARK_AS_UNUSED_RECIPE_BUTTON_TEXT = 'Пометить как неиспользованный'
 MARK_AS_USED_RECIPE_BUTTON_TEXT = 'Использовать рецепт'
 DELETE_RECIPE_BUTTON_TEXT = 'Удалить'
+PREVIOUS_PAGE_BUTTON_TEXT = '\u2B05 Назад'
+NEXT_PAGE_BUTTON_TEXT = 'Далее \u27A1'
 
 IS_USED_RECIPE_DETAILS_MESSAGE = 'Статус: Использован \U0001F373'
 IS_UNUSED_RECIPE_DETAILS_MESSAGE = 'Статус: Неиспользован'
@@ -1,18 +1,75 @@
-import os
-import random
+import asyncio
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterator, Iterable, Optional
 
 from bson.objectid import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from pymongo.collection import ReturnDocument
-
-from app.exceptions import UserHasNoRecipesError, UserHasNoSelectedRecipeError
-from app.recipe_shema import Recipe, RecipeWithId
-from app.constants import MAXIMUM_COUNT_OF_RETURNED_RECIPES
-from loader import db_connection
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+from app.cache import RecipesCache
+from app.sampling import UserSamplers, WeightedSampler, recency_weight
+from app.metrics import instrument_db_operation, register_gauge
+from app.exceptions import RandomRecipeDrawError, UserHasNoRecipesError, UserHasNoSelectedRecipeError
+from app.recipe_shema import Recipe, RecipeRecord, RecipesPage, UserStats, recipe_name_key
+from app.constants import (MAXIMUM_COUNT_OF_RETURNED_RECIPES, MAXIMUM_RANDOM_DRAW_ATTEMPTS,
+                           MAXIMUM_USER_STATS_COUNT_ATTEMPTS,
+                           MINIMUM_RECENCY_WEIGHT, WEIGHTED_DRAW_ENGINE,
+                           RECIPES_PAGE_SIZE, SHARED_STORAGE_MODE, IMPORT_BATCH_SIZE,
+                           EXPORT_BATCH_SIZE, MIGRATION_BATCH_SIZE)
+from app.data.config import (MONGO_STORAGE_MODE, MONGO_RECIPES_COLLECTION_NAME, MONGO_USER_STATS_COLLECTION_NAME,
+                             MONGO_READ_PREFERENCE,
+                             RECIPES_CACHE_MAX_USERS, RECIPES_CACHE_MAX_RECIPES_PER_USER,
+                             RECIPES_CACHE_TTL, RANDOM_DRAW_ENGINE, RANDOM_DRAW_RECENCY_PERIOD)
+from loader import app_context
+
+
+recipes_cache = RecipesCache(max_users=RECIPES_CACHE_MAX_USERS,
+                             max_recipes_per_user=RECIPES_CACHE_MAX_RECIPES_PER_USER,
+                             ttl=RECIPES_CACHE_TTL)
+register_gauge('bot_recipes_cache_hits', 'Count of recipes cache hits', lambda: recipes_cache.hits)
+register_gauge('bot_recipes_cache_misses', 'Count of recipes cache misses', lambda: recipes_cache.misses)
+register_gauge('bot_recipes_cache_users', 'Count of users in recipes cache', lambda: len(recipes_cache))
+# Samplers of unused recipes of users for `weighted` draw engine.
+recipe_samplers: UserSamplers[ObjectId] = UserSamplers(max_users=RECIPES_CACHE_MAX_USERS, ttl=RECIPES_CACHE_TTL)
+register_gauge('bot_recipe_samplers_users', 'Count of users with recipe sampler', lambda: len(recipe_samplers))
+
+
+SHARED_COLLECTION_INDEXES = [
+    [('user_id', ASCENDING), ('is_used', ASCENDING)],
+    # Keyset pagination of user recipes.
+    [('user_id', ASCENDING), ('_id', ASCENDING)],
+    # Deduplication of imported recipes.
+    [('user_id', ASCENDING), ('name', ASCENDING)],
+    # Prefix search of user recipes with keyset pagination.
+    [('user_id', ASCENDING), ('name_key', ASCENDING), ('_id', ASCENDING)],
+    # Draws and resets of recipes with tag. Multikey index, an entry per tag.
+    [('user_id', ASCENDING), ('tags', ASCENDING), ('is_used', ASCENDING)],
+]
+# Per user collections are created lazily, so their indexes are created on first use.
+PER_USER_COLLECTION_INDEXES = [
+    [('name', ASCENDING)],
+    [('name_key', ASCENDING), ('_id', ASCENDING)],
+    [('tags', ASCENDING), ('is_used', ASCENDING)],
+]
+_users_with_indexes: set[int] = set()
+_users_with_name_keys: set[int] = set()
+# Greatest code point. Strings starting with prefix are less than prefix followed by it.
+MAXIMUM_CHARACTER = '\U0010ffff'
+# Fields of `RecipeRecord` read from DB, `_id` is returned by default.
+RECIPE_PROJECTION = {'name': True, 'is_used': True, 'tags': True}
+# List, detail and export views tolerate replication lag, so they can be read from secondaries.
+# Existence checks, counters and random draws are followed by writes and are read from primary.
+VIEW_READ_PREFERENCE = make_read_preference(read_pref_mode_from_name(MONGO_READ_PREFERENCE), None)
 
 
 def _dispatch_user_id(user_id: int) -> AsyncIOMotorCollection:
     """Return user Mongo collection.
+    In shared storage mode all users have the same collection,
+    so queries must be scoped with `_user_filter`.
 
     Args:
         user_id (int): id of user in db.
@@ -20,27 +77,223 @@ def _dispatch_user_id(user_id: int) -> AsyncIOMotorCollection:
     Returns:
         AsyncIOMotorCollection: user Mongo collection.
     """
+    if MONGO_STORAGE_MODE == SHARED_STORAGE_MODE:
+        return app_context.db_connection[MONGO_RECIPES_COLLECTION_NAME]
     user_id = str(user_id)
-    return db_connection[user_id]
+    return app_context.db_connection[user_id]
+
+
+def _dispatch_user_id_for_view(user_id: int) -> AsyncIOMotorCollection:
+    """Return user Mongo collection for list, detail and export reads with `MONGO_READ_PREFERENCE`.
+
+    Args:
+        user_id (int): id of user in db.
+
+    Returns:
+        AsyncIOMotorCollection: user Mongo collection.
+    """
+    return _dispatch_user_id(user_id).with_options(read_preference=VIEW_READ_PREFERENCE)
+
+
+def _user_filter(user_id: int, filter: dict = {}) -> dict:
+    """Scope mongoDB filter to user recipes.
+
+    Args:
+        user_id (int): id of user in db.
+        filter (dict): mongoDB filter.
+
+    Returns:
+        dict: mongoDB filter which matches only user recipes.
+    """
+    if MONGO_STORAGE_MODE == SHARED_STORAGE_MODE:
+        return {'user_id': user_id, **filter}
+    return dict(filter)
+
+
+def _tag_filter(tag: Optional[str], filter: dict) -> dict:
+    """Narrow mongoDB filter to recipes with tag.
+
+    Args:
+        tag (Optional[str]): normalized tag. None matches all recipes.
+        filter (dict): mongoDB filter.
+
+    Returns:
+        dict: mongoDB filter.
+    """
+    if tag is None:
+        return filter
+    return {**filter, 'tags': tag}
+
+
+def _user_document(user_id: int, document: dict) -> dict:
+    """Prepare recipe document for insertion into user collection.
+
+    Args:
+        user_id (int): id of user in db.
+        document (dict): recipe document.
+
+    Returns:
+        dict: recipe document with owner if it is required by storage mode.
+    """
+    if MONGO_STORAGE_MODE == SHARED_STORAGE_MODE:
+        return {**document, 'user_id': user_id}
+    return document
+
+
+def _user_stats_collection() -> AsyncIOMotorCollection:
+    """Return Mongo collection with counters of user recipes.
+    Document of user is `{'_id': user_id, 'total': int, 'used': int}`.
+    Document created by increment before recipes were counted also has `'counted': False`,
+    its counters hold only changes since then.
+    """
+    return app_context.db_connection[MONGO_USER_STATS_COLLECTION_NAME]
+
+
+async def _increment_user_stats(user_id: int, total: int = 0, used: int = 0) -> None:
+    """Shift counters of user recipes.
+    Missing counters are created, so change isn't lost while `get_user_stats` counts recipes.
+
+    Args:
+        user_id (int): id of user in db.
+        total (int): change of count of all recipes.
+        used (int): change of count of used recipes.
+    """
+    increments = {counter: value for counter, value in (('total', total), ('used', used)) if value}
+    if increments:
+        await _user_stats_collection().update_one({'_id': user_id},
+                                                  {'$inc': increments, '$setOnInsert': {'counted': False}},
+                                                  upsert=True)
+
+
+@instrument_db_operation
+async def create_shared_collection_indexes() -> None:
+    """Create indexes of shared recipes collection."""
+    recipes_collection = app_context.db_connection[MONGO_RECIPES_COLLECTION_NAME]
+    for index in SHARED_COLLECTION_INDEXES:
+        await recipes_collection.create_index(index)
 
 
-async def add_recipe_by_name(user_id: int, recipe_name: str) -> None:
+@instrument_db_operation
+async def ensure_indexes() -> None:
+    """Create indexes required by storage mode.
+    Should be called once on startup.
+
+    Raises:
+        ValueError: raises if `MONGO_STORAGE_MODE` or `RANDOM_DRAW_ENGINE` is unknown.
+    """
+    # Connection checks storage settings when it is built, so they are checked on startup in any mode.
+    app_context.db_connection
+    if MONGO_STORAGE_MODE == SHARED_STORAGE_MODE:
+        await create_shared_collection_indexes()
+
+
+@instrument_db_operation
+async def warm_up_connections(connections_count: int) -> None:
+    """Open connections of Mongo pool by concurrent pings,
+    so the first updates don't wait for connection handshakes.
+
+    Args:
+        connections_count (int): count of concurrent pings.
+    """
+    await asyncio.gather(*(app_context.db_connection.command('ping') for _ in range(connections_count)))
+
+
+@instrument_db_operation
+async def _ensure_user_indexes(user_id: int) -> None:
+    """Create indexes of per user collection once per process.
+
+    Args:
+        user_id (int): id of user in db.
+    """
+    if MONGO_STORAGE_MODE == SHARED_STORAGE_MODE or user_id in _users_with_indexes:
+        return
+    user_collection = _dispatch_user_id(user_id)
+    for index in PER_USER_COLLECTION_INDEXES:
+        await user_collection.create_index(index)
+    _users_with_indexes.add(user_id)
+
+
+@instrument_db_operation
+async def add_recipe_by_name(user_id: int, recipe_name: str, tags: Iterable[str] = ()) -> None:
     """Add new recipe to user in DB.
 
     Args:
         user_id (int): id of user in db.
         recipe_name (str): text name of recipe.
+        tags (Iterable[str]): normalized tags of recipe.
     """
     user_collection = _dispatch_user_id(user_id)
-    recipe = Recipe(name=recipe_name)
-    await user_collection.insert_one(recipe.dict())
+    recipe = Recipe(name=recipe_name, tags=list(tags))
+    insert_result = await user_collection.insert_one(_user_document(user_id, recipe.dict()))
+    recipes_cache.put_recipe(user_id, RecipeRecord(insert_result.inserted_id, recipe.name, recipe.is_used,
+                                                   tuple(recipe.tags)))
+    recipe_samplers.put(user_id, insert_result.inserted_id, 1.0)
+    await _increment_user_stats(user_id, total=1)
+
+
+@instrument_db_operation
+async def add_recipes_by_names(user_id: int, recipe_names: Iterable[str]) -> int:
+    """Add new recipes without tags to user in DB skipping names that user already has.
+
+    Args:
+        user_id (int): id of user in db.
+        recipe_names (Iterable[str]): text names of recipes.
 
+    Returns:
+        int: count of added recipes.
+    """
+    return await add_recipes_with_tags(user_id, ((recipe_name, []) for recipe_name in recipe_names))
+
+
+@instrument_db_operation
+async def add_recipes_with_tags(user_id: int, recipes: Iterable[tuple[str, list[str]]]) -> int:
+    """Add new recipes to user in DB skipping names that user already has.
+    Recipes are consumed lazily and inserted by batches, one `insert_many` per batch.
+    Tags of the first recipe with the same name are kept.
+
+    Args:
+        user_id (int): id of user in db.
+        recipes (Iterable[tuple[str, list[str]]]): text names of recipes with their normalized tags.
 
+    Returns:
+        int: count of added recipes.
+    """
+    user_collection = _dispatch_user_id(user_id)
+    await _ensure_user_indexes(user_id)
+    recipes = iter(recipes)
+    seen_names = set()
+    added_count = 0
+    while batch := list(islice(recipes, IMPORT_BATCH_SIZE)):
+        tags_by_name = {}
+        for recipe_name, tags in batch:
+            if recipe_name not in seen_names:
+                seen_names.add(recipe_name)
+                tags_by_name[recipe_name] = tags
+        existing_names_filter = _user_filter(user_id, {'name': {'$in': list(tags_by_name)}})
+        existing_documents = user_collection.find(filter=existing_names_filter,
+                                                  projection={'_id': False, 'name': True})
+        existing_names = {document['name'] async for document in existing_documents}
+        new_recipes = [Recipe(name=recipe_name, tags=list(tags)) for recipe_name, tags in tags_by_name.items()
+                       if recipe_name not in existing_names]
+        if not new_recipes:
+            continue
+        documents = [_user_document(user_id, recipe.dict()) for recipe in new_recipes]
+        insert_result = await user_collection.insert_many(documents, ordered=False)
+        recipes_cache.put_recipes(user_id, (RecipeRecord(recipe_id, recipe.name, recipe.is_used, tuple(recipe.tags))
+                                            for recipe_id, recipe in zip(insert_result.inserted_ids, new_recipes)))
+        for recipe_id in insert_result.inserted_ids:
+            recipe_samplers.put(user_id, recipe_id, 1.0)
+        added_count += len(insert_result.inserted_ids)
+        await _increment_user_stats(user_id, total=len(insert_result.inserted_ids))
+    return added_count
+
+
+@instrument_db_operation
 async def _list_user_recipes_by_filter(
     user_id: int,
     filter: dict = {},
     count: int = MAXIMUM_COUNT_OF_RETURNED_RECIPES
-) -> list[RecipeWithId]:
+) -> list[RecipeRecord]:
     """Return list of filtered user recipes.
 
     Args:
@@ -49,17 +302,21 @@ async def _list_user_recipes_by_filter(
         count (int): max count of returned recipes.
 
     Returns:
-        list[RecipeWithId]: list of user recipes from DB.
+        list[RecipeRecord]: list of user recipes from DB.
     """
-    user_collection = _dispatch_user_id(user_id)
-    cursor = await user_collection.find(filter=filter).to_list(count)
-    return [RecipeWithId(**document) for document in cursor]
+    user_collection = _dispatch_user_id_for_view(user_id)
+    cursor = await user_collection.find(filter=_user_filter(user_id, filter),
+                                        projection=RECIPE_PROJECTION).to_list(count)
+    recipes = [RecipeRecord.from_document(document) for document in cursor]
+    recipes_cache.put_missing_recipes(user_id, recipes)
+    return recipes
 
 
+@instrument_db_operation
 async def list_user_recipes(
     user_id: int,
     count: int = MAXIMUM_COUNT_OF_RETURNED_RECIPES
-) -> list[RecipeWithId]:
+) -> list[RecipeRecord]:
     """Return list of user recipes.
 
     Args:
@@ -67,12 +324,170 @@ async def list_user_recipes(
         count (int): max count of returned recipes.
 
     Returns:
-        list[RecipeWithId]: list of user recipes from DB.
+        list[RecipeRecord]: list of user recipes from DB.
     """
     return await _list_user_recipes_by_filter(user_id, count=count)
 
 
-async def find_recipe_by_id(user_id: int, recipe_id: ObjectId) -> RecipeWithId:
+async def iterate_user_recipes(
+    user_id: int,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[RecipeRecord]:
+    """Iterate over all user recipes ordered by id.
+    Recipes are fetched by batches, so memory usage doesn't depend on count of recipes.
+
+    Args:
+        user_id (int): id of user in db.
+        batch_size (int): count of recipes fetched by one round trip.
+
+    Yields:
+        AsyncIterator[RecipeRecord]: user recipes from DB.
+    """
+    user_collection = _dispatch_user_id_for_view(user_id)
+    cursor = user_collection.find(filter=_user_filter(user_id), projection=RECIPE_PROJECTION)
+    cursor = cursor.sort('_id', ASCENDING).batch_size(batch_size)
+    async for document in cursor:
+        yield RecipeRecord.from_document(document)
+
+
+@instrument_db_operation
+async def list_user_recipes_page(
+    user_id: int,
+    after: Optional[ObjectId] = None,
+    before: Optional[ObjectId] = None,
+    count: int = RECIPES_PAGE_SIZE
+) -> RecipesPage:
+    """Return page of user recipes ordered by id.
+    Page is selected by keyset cursor, so only one page is fetched from DB.
+
+    Args:
+        user_id (int): id of user in db.
+        after (Optional[ObjectId]): return recipes following recipe with this id.
+        before (Optional[ObjectId]): return recipes preceding recipe with this id.
+        count (int): max count of recipes on page.
+
+    Returns:
+        RecipesPage: page of user recipes.
+    """
+    user_collection = _dispatch_user_id_for_view(user_id)
+    if before is not None:
+        page_filter = _user_filter(user_id, {'_id': {'$lt': before}})
+        sort_direction = DESCENDING
+    else:
+        page_filter = _user_filter(user_id, {} if after is None else {'_id': {'$gt': after}})
+        sort_direction = ASCENDING
+    # One extra recipe shows whether there is a page further in this direction.
+    cursor = user_collection.find(filter=page_filter, projection=RECIPE_PROJECTION)
+    cursor = cursor.sort('_id', sort_direction).limit(count + 1)
+    documents = await cursor.to_list(count + 1)
+    has_more = len(documents) > count
+    recipes = [RecipeRecord.from_document(document) for document in documents[:count]]
+    recipes_cache.put_missing_recipes(user_id, recipes)
+    if before is not None:
+        recipes.reverse()
+        return RecipesPage(recipes=recipes, has_previous=has_more, has_next=True)
+    return RecipesPage(recipes=recipes, has_previous=after is not None, has_next=has_more)
+
+
+@instrument_db_operation
+async def _ensure_name_keys(user_id: int) -> None:
+    """Set search keys of recipes added before search was introduced, once per process.
+
+    Args:
+        user_id (int): id of user in db.
+    """
+    if user_id in _users_with_name_keys:
+        return
+    user_collection = _dispatch_user_id(user_id)
+    documents = user_collection.find(filter=_user_filter(user_id, {'name_key': {'$exists': False}}),
+                                     projection={'name': True})
+    requests = []
+    async for document in documents.batch_size(MIGRATION_BATCH_SIZE):
+        requests.append(UpdateOne({'_id': document['_id']},
+                                  {'$set': {'name_key': recipe_name_key(document['name'])}}))
+        if len(requests) >= MIGRATION_BATCH_SIZE:
+            await user_collection.bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        await user_collection.bulk_write(requests, ordered=False)
+    _users_with_name_keys.add(user_id)
+
+
+async def _find_recipe_name_key(user_id: int, recipe_id: ObjectId) -> Optional[str]:
+    """Return search key of recipe, from cache if recipe is cached.
+
+    Args:
+        user_id (int): id of user in db.
+        recipe_id (ObjectId): id of recipe in db.
+
+    Returns:
+        Optional[str]: search key. None if there is no such recipe.
+    """
+    cached_recipe = recipes_cache.get_recipe(user_id, recipe_id)
+    if cached_recipe is not None:
+        return recipe_name_key(cached_recipe.name)
+    user_collection = _dispatch_user_id(user_id)
+    recipe_db_document = await user_collection.find_one(filter=_user_filter(user_id, {'_id': recipe_id}),
+                                                        projection={'name_key': True})
+    return None if recipe_db_document is None else recipe_db_document['name_key']
+
+
+@instrument_db_operation
+async def search_recipes(
+    user_id: int,
+    query: str,
+    after: Optional[ObjectId] = None,
+    before: Optional[ObjectId] = None,
+    count: int = RECIPES_PAGE_SIZE
+) -> RecipesPage:
+    """Return page of user recipes whose names start with query, ignoring case.
+    Recipes are ordered by name. The query is a range scan of `name_key` index,
+    and the page is selected by keyset cursor, so only one page is fetched from DB.
+
+    Args:
+        user_id (int): id of user in db.
+        query (str): beginning of recipe name.
+        after (Optional[ObjectId]): return recipes following recipe with this id.
+        before (Optional[ObjectId]): return recipes preceding recipe with this id.
+        count (int): max count of recipes on page.
+
+    Returns:
+        RecipesPage: page of found recipes.
+    """
+    await _ensure_user_indexes(user_id)
+    await _ensure_name_keys(user_id)
+    query_key = recipe_name_key(query)
+    cursor_id = before if before is not None else after
+    cursor_key = None if cursor_id is None else await _find_recipe_name_key(user_id, cursor_id)
+    if cursor_key is None:
+        # Recipe of page border is deleted, so search starts from the beginning.
+        after = before = None
+        page_filter = {'name_key': {'$gte': query_key, '$lt': query_key + MAXIMUM_CHARACTER}}
+        sort_direction = ASCENDING
+    elif before is not None:
+        page_filter = {'name_key': {'$gte': query_key, '$lte': cursor_key},
+                       '$or': [{'name_key': {'$lt': cursor_key}}, {'_id': {'$lt': before}}]}
+        sort_direction = DESCENDING
+    else:
+        page_filter = {'name_key': {'$gte': max(query_key, cursor_key), '$lt': query_key + MAXIMUM_CHARACTER},
+                       '$or': [{'name_key': {'$gt': cursor_key}}, {'_id': {'$gt': after}}]}
+        sort_direction = ASCENDING
+    user_collection = _dispatch_user_id_for_view(user_id)
+    # One extra recipe shows whether there is a page further in this direction.
+    cursor = user_collection.find(filter=_user_filter(user_id, page_filter), projection=RECIPE_PROJECTION)
+    cursor = cursor.sort([('name_key', sort_direction), ('_id', sort_direction)]).limit(count + 1)
+    documents = await cursor.to_list(count + 1)
+    has_more = len(documents) > count
+    recipes = [RecipeRecord.from_document(document) for document in documents[:count]]
+    recipes_cache.put_missing_recipes(user_id, recipes)
+    if before is not None:
+        recipes.reverse()
+        return RecipesPage(recipes=recipes, has_previous=has_more, has_next=True)
+    return RecipesPage(recipes=recipes, has_previous=after is not None, has_next=has_more)
+
+
+@instrument_db_operation
+async def find_recipe_by_id(user_id: int, recipe_id: ObjectId) -> RecipeRecord:
     """Find recipe in db and return it.
 
     Args:
@@ -83,16 +498,22 @@ async def find_recipe_by_id(user_id: int, recipe_id: ObjectId) -> RecipeWithId:
         UserHasNoSelectedRecipeError: raises if user has no this recipe.
 
     Returns:
-        RecipeWithId: recipe
+        RecipeRecord: recipe
     """
-    user_collection = _dispatch_user_id(user_id)
-    recipe_id_filter = {'_id': recipe_id}
-    recipe_db_document = await user_collection.find_one(filter=recipe_id_filter)
+    cached_recipe = recipes_cache.get_recipe(user_id, recipe_id)
+    if cached_recipe is not None:
+        return cached_recipe
+    user_collection = _dispatch_user_id_for_view(user_id)
+    recipe_id_filter = _user_filter(user_id, {'_id': recipe_id})
+    recipe_db_document = await user_collection.find_one(filter=recipe_id_filter, projection=RECIPE_PROJECTION)
     if recipe_db_document is None:
         raise UserHasNoSelectedRecipeError
-    return RecipeWithId(**recipe_db_document)
+    recipe = RecipeRecord.from_document(recipe_db_document)
+    recipes_cache.put_missing_recipes(user_id, [recipe])
+    return recipe
 
 
+@instrument_db_operation
 async def remove_recipe_by_id(user_id: int, recipe_id: ObjectId) -> None:
     """Remove recipe for user.
 
@@ -101,10 +522,111 @@ async def remove_recipe_by_id(user_id: int, recipe_id: ObjectId) -> None:
         recipe_id (ObjectId): id of recipe in db
     """
     user_collection = _dispatch_user_id(user_id)
-    recipe_id_filter = {'_id': recipe_id}
-    await user_collection.delete_one(filter=recipe_id_filter)
+    recipe_id_filter = _user_filter(user_id, {'_id': recipe_id})
+    recipe_db_document = await user_collection.find_one_and_delete(filter=recipe_id_filter,
+                                                                   projection={'is_used': True})
+    recipes_cache.remove_recipe(user_id, recipe_id)
+    recipe_samplers.remove(user_id, recipe_id)
+    if recipe_db_document is not None:
+        await _increment_user_stats(user_id, total=-1, used=-int(recipe_db_document['is_used']))
+
+
+async def _find_user_stats(user_id: int) -> Optional[UserStats]:
+    """Read counters of user recipes.
+
+    Args:
+        user_id (int): id of user in db.
+
+    Returns:
+        Optional[UserStats]: counts of user recipes. None if counters are not created yet.
+    """
+    user_stats_document = await _user_stats_collection().find_one({'_id': user_id, 'counted': {'$ne': False}},
+                                                                  projection={'_id': False})
+    if user_stats_document is None:
+        return None
+    return UserStats(**user_stats_document)
+
+
+async def _count_user_stats(user_id: int) -> UserStats:
+    """Count all and used user recipes.
+
+    Args:
+        user_id (int): id of user in db.
+
+    Returns:
+        UserStats: counts of user recipes.
+    """
+    user_collection = _dispatch_user_id(user_id)
+    return UserStats(total=await user_collection.count_documents(_user_filter(user_id)),
+                     used=await user_collection.count_documents(_user_filter(user_id, {'is_used': True})))
+
+
+async def _save_counted_user_stats(user_id: int, user_stats: UserStats, counters_document: Optional[dict]) -> bool:
+    """Replace counters of user by counted values if counters weren't changed since they were read.
+
+    Args:
+        user_id (int): id of user in db.
+        user_stats (UserStats): counted values.
+        counters_document (Optional[dict]): not counted counters read before counting. None if they were missing.
+
+    Returns:
+        bool: True if saved. False if counters were changed, so recipes must be counted again.
+    """
+    if counters_document is None:
+        try:
+            await _user_stats_collection().insert_one({'_id': user_id, **user_stats.dict()})
+        except DuplicateKeyError:
+            return False
+        return True
+    unchanged_filter = {'_id': user_id, 'counted': False}
+    for counter in ('total', 'used'):
+        unchanged_filter[counter] = counters_document[counter] if counter in counters_document else {'$exists': False}
+    update_result = await _user_stats_collection().update_one(unchanged_filter, {'$set': user_stats.dict(),
+                                                                                 '$unset': {'counted': ''}})
+    return update_result.modified_count == 1
+
+
+async def _has_user_recipe_matching(user_id: int, filter: dict) -> bool:
+    """Check if user has at least one recipe matching filter without loading recipes.
+
+    Args:
+        user_id (int): id of user in db.
+        filter (dict): mongoDB filter.
+
+    Returns:
+        bool: True if has. Otherwise False
+    """
+    user_collection = _dispatch_user_id(user_id)
+    recipe_db_document = await user_collection.find_one(filter=_user_filter(user_id, filter),
+                                                        projection={'_id': True})
+    return recipe_db_document is not None
+
 
+@instrument_db_operation
+async def get_user_stats(user_id: int) -> UserStats:
+    """Return counts of all and used user recipes.
+    Counters are read from one document. If user has no counted counters yet,
+    recipes are counted and counters are created. Writes made while recipes are counted
+    change counters, so recipes are counted again then.
 
+    Args:
+        user_id (int): id of user in db.
+
+    Returns:
+        UserStats: counts of user recipes.
+    """
+    for _ in range(MAXIMUM_USER_STATS_COUNT_ATTEMPTS):
+        counters_document = await _user_stats_collection().find_one({'_id': user_id})
+        if counters_document is not None and counters_document.get('counted', True):
+            return UserStats(total=counters_document['total'], used=counters_document['used'])
+        user_stats = await _count_user_stats(user_id)
+        if await _save_counted_user_stats(user_id, user_stats, counters_document):
+            return user_stats
+    # Counters stay not counted and the next call counts recipes again.
+    return user_stats
+
+
+@instrument_db_operation
 async def does_user_have_recipes(user_id: int) -> bool:
     """Checks if user has any recipe.
 
@@ -114,9 +636,15 @@ async def does_user_have_recipes(user_id: int) -> bool:
     Returns:
         bool: True if has. Otherwise False
     """
-    return bool(await list_user_recipes(user_id))
+    if recipes_cache.has_recipes(user_id):
+        return True
+    user_stats = await _find_user_stats(user_id)
+    if user_stats is not None:
+        return user_stats.total > 0
+    return await _has_user_recipe_matching(user_id, {})
 
 
+@instrument_db_operation
 async def does_user_have_used_recipes(user_id: int) -> bool:
     """Checks if the user has used recipes.
 
@@ -126,87 +654,351 @@ async def does_user_have_used_recipes(user_id: int) -> bool:
     Returns:
         bool: True if has. Otherwise False
     """
-    used_recipes_filter = {'is_used': True}
-    used_recipes = await _list_user_recipes_by_filter(user_id,
-                                                      filter=used_recipes_filter)
-    return bool(used_recipes)
+    user_stats = await _find_user_stats(user_id)
+    if user_stats is not None:
+        return user_stats.used > 0
+    return await _has_user_recipe_matching(user_id, {'is_used': True})
+
 
+@instrument_db_operation
+async def _sample_unused_recipe_id(user_id: int, tag: Optional[str] = None) -> Optional[ObjectId]:
+    """Pick id of random non used recipe on the Mongo side.
+
+    Args:
+        user_id (int): id of user in db.
+        tag (Optional[str]): pick only recipes with this tag.
 
-async def take_random_recipe(user_id: int) -> RecipeWithId:
+    Returns:
+        Optional[ObjectId]: id of random non used recipe. None if there is no such recipes.
+    """
+    pipeline = [
+        {'$match': _user_filter(user_id, _tag_filter(tag, {'is_used': False}))},
+        {'$sample': {'size': 1}},
+        {'$project': {'_id': 1}}
+    ]
+    user_collection = _dispatch_user_id(user_id)
+    sampled_documents = await user_collection.aggregate(pipeline).to_list(1)
+    if not sampled_documents:
+        return None
+    return sampled_documents[0]['_id']
+
+
+def _recipe_weight(recipe_db_document: dict, now: datetime) -> float:
+    """Return weight of unused recipe for `weighted` draw engine.
+
+    Args:
+        recipe_db_document (dict): Mongo document of recipe with `used_at` field if recipe was used.
+        now (datetime): current UTC time.
+
+    Returns:
+        float: weight of recipe.
+    """
+    return recency_weight(recipe_db_document.get('used_at'), now, RANDOM_DRAW_RECENCY_PERIOD, MINIMUM_RECENCY_WEIGHT)
+
+
+@instrument_db_operation
+async def _load_recipe_sampler(user_id: int) -> WeightedSampler[ObjectId]:
+    """Build sampler of unused user recipes by one scan and keep it for next draws.
+
+    Args:
+        user_id (int): id of user in db.
+
+    Returns:
+        WeightedSampler[ObjectId]: sampler of ids of non used recipes.
+    """
+    user_collection = _dispatch_user_id(user_id)
+    cursor = user_collection.find(filter=_user_filter(user_id, {'is_used': False}), projection={'used_at': True})
+    now = datetime.utcnow()
+    weighted_ids = [(document['_id'], _recipe_weight(document, now))
+                    async for document in cursor.batch_size(EXPORT_BATCH_SIZE)]
+    sampler = WeightedSampler.from_weights(weighted_ids)
+    recipe_samplers.set(user_id, sampler)
+    return sampler
+
+
+async def _draw_unused_recipe_id(user_id: int, tag: Optional[str] = None) -> Optional[ObjectId]:
+    """Pick id of random non used recipe by `RANDOM_DRAW_ENGINE`.
+    The `weighted` engine scans recipes only when sampler of user is not built yet or is empty,
+    then each draw takes O(log n) without round trips. Empty sampler can miss recipes reset
+    or added by other bot processes, so it is reloaded to confirm that the bag is empty before it is reset.
+    Sampler covers the whole bag, so recipes with tag are always picked by `$sample`.
+
+    Args:
+        user_id (int): id of user in db.
+        tag (Optional[str]): pick only recipes with this tag.
+
+    Returns:
+        Optional[ObjectId]: id of random non used recipe. None if there is no such recipes.
+    """
+    if RANDOM_DRAW_ENGINE != WEIGHTED_DRAW_ENGINE or tag is not None:
+        return await _sample_unused_recipe_id(user_id, tag)
+    sampler = recipe_samplers.get(user_id)
+    if sampler is None or not len(sampler):
+        sampler = await _load_recipe_sampler(user_id)
+    return sampler.draw()
+
+
+@instrument_db_operation
+async def take_random_recipe(user_id: int, tag: Optional[str] = None) -> RecipeRecord:
     """Find random non used recipe for user. And then use and return.
 
+    With `sample` engine the recipe is sampled and marked as used on the Mongo side,
+    so usually it costs two round trips: `$sample` aggregation and conditional update.
+    With `weighted` engine the recipe is drawn from in-process sampler,
+    so only the conditional update is needed. If drawn recipe was already used,
+    sampler is stale and is reloaded before the next attempt.
+    The bag is reset only if there is no unused recipes.
+    With tag only recipes with this tag are drawn and reset, so each tag has its own cycle.
+
     Args:
         user_id (int): id of user in db.
+        tag (Optional[str]): normalized tag of drawn recipe.
 
     Raises:
-        UserHasNoRecipesError: raises if there is no any recipes for this user in db
+        UserHasNoRecipesError: raises if there is no any recipes for this user (with this tag) in db
+        RandomRecipeDrawError: raises if drawn recipes were taken by concurrent updates
+            `MAXIMUM_RANDOM_DRAW_ATTEMPTS` times in a row.
 
     Returns:
-        RecipeWithId: used recipe
+        RecipeRecord: used recipe
     """
-    if not (await does_user_have_recipes(user_id)):
+    if tag is not None:
+        await _ensure_user_indexes(user_id)
+    user_collection = _dispatch_user_id(user_id)
+    as_used_update = {'$set': {'is_used': True, 'used_at': datetime.utcnow()}}
+    is_bag_reset = False
+    for _ in range(MAXIMUM_RANDOM_DRAW_ATTEMPTS):
+        random_recipe_id = await _draw_unused_recipe_id(user_id, tag)
+        if random_recipe_id is None:
+            if is_bag_reset or not (await _reset_used_recipes(user_id, tag)):
+                raise UserHasNoRecipesError(f'User {user_id} has no recipes')
+            is_bag_reset = True
+            continue
+        # Recipe can be taken by concurrent update between sampling and update.
+        not_used_recipe_filter = _user_filter(user_id, {'_id': random_recipe_id, 'is_used': False})
+        recipe_db_document = await user_collection.find_one_and_update(filter=not_used_recipe_filter,
+                                                                       update=as_used_update,
+                                                                       projection=RECIPE_PROJECTION,
+                                                                       return_document=ReturnDocument.AFTER)
+        if recipe_db_document is not None:
+            recipe_samplers.remove(user_id, random_recipe_id)
+            recipe = RecipeRecord.from_document(recipe_db_document)
+            recipes_cache.put_recipe(user_id, recipe)
+            await _increment_user_stats(user_id, used=1)
+            return recipe
+        # Sampler can hold many recipes used by other bot processes, so it is reloaded
+        # and doesn't waste the rest of attempts.
+        recipe_samplers.invalidate(user_id)
+    raise RandomRecipeDrawError(f'Failed to take random recipe for user {user_id}')
+
+
+async def _draw_unused_recipes(
+    user_id: int,
+    count: int,
+    excluded_ids: list[ObjectId],
+    tag: Optional[str] = None
+) -> list[RecipeRecord]:
+    """Pick distinct random non used recipes by `RANDOM_DRAW_ENGINE` by one query.
+    Recipes with tag are always picked by `$sample`. Sampler with less than `count` recipes
+    is reloaded, because it can miss recipes reset or added by other bot processes.
+
+    Args:
+        user_id (int): id of user in db.
+        count (int): max count of picked recipes.
+        excluded_ids (list[ObjectId]): ids of recipes which must not be picked.
+        tag (Optional[str]): pick only recipes with this tag.
+
+    Returns:
+        list[RecipeRecord]: picked recipes. Less than `count` if there is not enough non used recipes.
+    """
+    user_collection = _dispatch_user_id(user_id)
+    if RANDOM_DRAW_ENGINE != WEIGHTED_DRAW_ENGINE or tag is not None:
+        not_used_filter = _tag_filter(tag, {'is_used': False, '_id': {'$nin': excluded_ids}})
+        pipeline = [
+            {'$match': _user_filter(user_id, not_used_filter)},
+            {'$sample': {'size': count}},
+            {'$project': RECIPE_PROJECTION}
+        ]
+        documents = await user_collection.aggregate(pipeline).to_list(count)
+    else:
+        sampler = recipe_samplers.get(user_id)
+        if sampler is None or len(sampler) - sum(recipe_id in sampler for recipe_id in excluded_ids) < count:
+            sampler = await _load_recipe_sampler(user_id)
+        for recipe_id in excluded_ids:
+            sampler.remove(recipe_id)
+        drawn_ids = []
+        # Drawn recipes are used by the caller, so they leave the sampler.
+        while len(drawn_ids) < count and len(sampler):
+            recipe_id = sampler.draw()
+            sampler.remove(recipe_id)
+            drawn_ids.append(recipe_id)
+        if not drawn_ids:
+            return []
+        drawn_recipes_filter = _user_filter(user_id, {'_id': {'$in': drawn_ids}, 'is_used': False})
+        documents = await user_collection.find(filter=drawn_recipes_filter,
+                                               projection=RECIPE_PROJECTION).to_list(count)
+    # `$sample` can return a document twice.
+    unique_documents = {document['_id']: document for document in documents}
+    return [RecipeRecord.from_document(document) for document in unique_documents.values()]
+
+
+@instrument_db_operation
+async def take_random_recipes(user_id: int, count: int, tag: Optional[str] = None) -> list[RecipeRecord]:
+    """Find distinct random non used recipes for user. And then use and return them.
+
+    Recipes are picked by one query and marked as used by one `update_many`.
+    If there is less than `count` non used recipes, all of them are taken,
+    the bag is reset and the rest is picked from the other recipes.
+    So it returns `count` recipes, or all user recipes if user has less.
+    With tag only recipes with this tag are drawn and reset.
+
+    Args:
+        user_id (int): id of user in db.
+        count (int): count of recipes.
+        tag (Optional[str]): normalized tag of drawn recipes.
+
+    Raises:
+        UserHasNoRecipesError: raises if there is no any recipes for this user (with this tag) in db
+
+    Returns:
+        list[RecipeRecord]: used recipes
+    """
+    if tag is not None:
+        await _ensure_user_indexes(user_id)
+    recipes = await _draw_unused_recipes(user_id, count, [], tag)
+    if len(recipes) < count and await _reset_used_recipes(user_id, tag):
+        recipes += await _draw_unused_recipes(user_id, count - len(recipes), [recipe.id for recipe in recipes], tag)
+    if not recipes:
         raise UserHasNoRecipesError(f'User {user_id} has no recipes')
-    not_used_recipes_filter = {'is_used': False}
-    unused_recipes = await _list_user_recipes_by_filter(user_id, not_used_recipes_filter)
-    if not unused_recipes:
-        await unuse_all_recipes(user_id)
-        unused_recipes = await _list_user_recipes_by_filter(user_id, not_used_recipes_filter)
-    random_recipe = random.choice(unused_recipes)
-    return await take_recipe_by_id(user_id, random_recipe.id)
+    recipe_ids = [recipe.id for recipe in recipes]
+    user_collection = _dispatch_user_id(user_id)
+    not_used_recipes_filter = _user_filter(user_id, {'_id': {'$in': recipe_ids}, 'is_used': False})
+    as_used_update = {'$set': {'is_used': True, 'used_at': datetime.utcnow()}}
+    update_result = await user_collection.update_many(filter=not_used_recipes_filter, update=as_used_update)
+    # Recipes taken by concurrent update are returned too, they are used anyway.
+    recipes = [recipe._replace(is_used=True) for recipe in recipes]
+    recipes_cache.put_recipes(user_id, recipes)
+    if update_result.modified_count < len(recipe_ids):
+        # Sampler holds recipes used by other bot processes.
+        recipe_samplers.invalidate(user_id)
+    for recipe_id in recipe_ids:
+        recipe_samplers.remove(user_id, recipe_id)
+    await _increment_user_stats(user_id, used=update_result.modified_count)
+    return recipes
+
+
+@instrument_db_operation
+async def _reset_used_recipes(user_id: int, tag: Optional[str] = None) -> bool:
+    """Mark all used recipes of user as unused.
 
+    Args:
+        user_id (int): id of user in db.
+        tag (Optional[str]): reset only recipes with this tag.
 
+    Returns:
+        bool: True if any recipe was marked as unused. Otherwise False.
+    """
+    user_collection = _dispatch_user_id(user_id)
+    used_recipes_filter = _user_filter(user_id, _tag_filter(tag, {'is_used': True}))
+    as_unused_update = {'$set': {'is_used': False}}
+    update_result = await user_collection.update_many(filter=used_recipes_filter,
+                                                      update=as_unused_update)
+    if tag is None:
+        recipes_cache.mark_all_unused(user_id)
+    elif update_result.modified_count:
+        recipes_cache.mark_all_unused(user_id, tag)
+    # Sampler is rebuilt with weights of reset recipes on the next draw.
+    recipe_samplers.invalidate(user_id)
+    await _increment_user_stats(user_id, used=-update_result.modified_count)
+    return update_result.modified_count > 0
+
+
+@instrument_db_operation
 async def unuse_all_recipes(user_id: int) -> None:
     """Unuse all recipes for user.
+    The update is no-op if there is no used recipes, so counters are not touched then.
 
     Args:
         user_id (int): id of user in db.
     """
-    user_collection = _dispatch_user_id(user_id)
-    as_unused_update = {'$set': {'is_used': False}}
-    all_recipes_filter = {}
-    if (await does_user_have_used_recipes(user_id)):
-        await user_collection.update_many(filter=all_recipes_filter, update=as_unused_update)
+    await _reset_used_recipes(user_id)
 
 
-async def take_recipe_by_id(user_id: int, recipe_id: ObjectId) -> RecipeWithId:
-    """Use and return updated user recipe.
+async def _set_recipe_used_state(user_id: int, recipe_id: ObjectId, is_used: bool) -> RecipeRecord:
+    """Atomically set `is_used` of recipe and return updated recipe.
+    The recipe is updated and read by one `find_one_and_update`. If the state is actually changed,
+    counters of user recipes are shifted by a second round trip: they are kept in another collection,
+    so a state change costs two Mongo operations, and a repeated action costs one.
 
     Args:
         user_id (int): id of user in db.
         recipe_id (ObjectId): id of recipe in db.
+        is_used (bool): new state of recipe.
 
     Raises:
         UserHasNoSelectedRecipeError: raises if there is no recipe for this user in db.
 
     Returns:
-        RecipeWithId: unused recipe
+        RecipeRecord: updated recipe
     """
     user_collection = _dispatch_user_id(user_id)
-    recipe_id_filter = {'_id': recipe_id}
-    as_used_update = {'$set': {'is_used': True}}
+    recipe_id_filter = _user_filter(user_id, {'_id': recipe_id})
+    now = datetime.utcnow()
+    state_update = {'is_used': True, 'used_at': now} if is_used else {'is_used': False}
     recipe_db_document = await user_collection.find_one_and_update(filter=recipe_id_filter,
-                                                                   update=as_used_update,
-                                                                   return_document=ReturnDocument.AFTER)
+                                                                   update={'$set': state_update},
+                                                                   projection={**RECIPE_PROJECTION, 'used_at': True},
+                                                                   return_document=ReturnDocument.BEFORE)
     if recipe_db_document is None:
+        recipes_cache.remove_recipe(user_id, recipe_id)
+        recipe_samplers.remove(user_id, recipe_id)
         raise UserHasNoSelectedRecipeError
-    recipe = RecipeWithId(**recipe_db_document)
+    recipe = RecipeRecord.from_document(recipe_db_document)._replace(is_used=is_used)
+    recipes_cache.put_recipe(user_id, recipe)
+    if is_used:
+        recipe_samplers.remove(user_id, recipe_id)
+    else:
+        recipe_samplers.put(user_id, recipe_id, _recipe_weight(recipe_db_document, now))
+    if recipe_db_document['is_used'] != is_used:
+        await _increment_user_stats(user_id, used=1 if is_used else -1)
     return recipe
 
 
-async def unuse_and_find_recipe_by_id(user_id: int, recipe_id: ObjectId) -> RecipeWithId:
+@instrument_db_operation
+async def take_recipe_by_id(user_id: int, recipe_id: ObjectId) -> RecipeRecord:
+    """Use and return updated user recipe.
+
+    Args:
+        user_id (int): id of user in db.
+        recipe_id (ObjectId): id of recipe in db.
+
+    Raises:
+        UserHasNoSelectedRecipeError: raises if there is no recipe for this user in db.
+
+    Returns:
+        RecipeRecord: used recipe
+    """
+    return await _set_recipe_used_state(user_id, recipe_id, is_used=True)
+
+
+@instrument_db_operation
+async def unuse_and_find_recipe_by_id(user_id: int, recipe_id: ObjectId) -> RecipeRecord:
     """Unuse and return updated user recipe.
 
     Args:
         user_id (int): id of user in db.
         recipe_id (ObjectId): id of recipe in db.
 
+    Raises:
+        UserHasNoSelectedRecipeError: raises if there is no recipe for this user in db.
+
     Returns:
-        RecipeWithId: unused recipe
+        RecipeRecord: unused recipe
     """
-    await unuse_recipe_by_id(user_id, recipe_id)
-    return await find_recipe_by_id(user_id, recipe_id)
+    return await _set_recipe_used_state(user_id, recipe_id, is_used=False)
 
 
+@instrument_db_operation
 async def unuse_recipe_by_id(user_id: int, recipe_id: ObjectId) -> None:
     """Unuse recipe by id in DB.
 
@@ -215,7 +1007,15 @@ async def unuse_recipe_by_id(user_id: int, recipe_id: ObjectId) -> None:
         recipe_id (ObjectId): id of recipe in db.
     """
     user_collection = _dispatch_user_id(user_id)
-    recipe_id_filter = {'_id': recipe_id}
+    used_recipe_filter = _user_filter(user_id, {'_id': recipe_id, 'is_used': True})
     as_unused_update = {'$set': {'is_used': False}}
-    await user_collection.update_one(filter=recipe_id_filter,
-                                     update=as_unused_update)
+    update_result = await user_collection.update_one(filter=used_recipe_filter,
+                                                     update=as_unused_update)
+    if update_result.modified_count:
+        recipes_cache.update_recipe(user_id, recipe_id, {'is_used': False})
+        # Time of use isn't read by this update, so sampler is rebuilt on the next draw.
+        recipe_samplers.invalidate(user_id)
+        await _increment_user_stats(user_id, used=-1)
+    else:
+        # Recipe is already unused or removed.
+        recipes_cache.remove_recipe(user_id, recipe_id)
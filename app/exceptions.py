@@ -6,3 +6,8 @@ class UserHasNoRecipesError(Exception):
 class UserHasNoSelectedRecipeError(Exception):
     """There is no selected recipe of user in DB"""
     pass
+
+
+class RandomRecipeDrawError(Exception):
+    """Random recipe was not taken, because concurrent updates took drawn recipes first"""
+    pass
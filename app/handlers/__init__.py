@@ -1,5 +1,5 @@
-from app.handlers.callback_query_handlers import dp
-from app.handlers.message_handlers import dp
+from app.handlers import callback_query_handlers, error_handlers, message_handlers  # noqa: F401
+from loader import dp
 
 
 __all__ = ['dp']
@@ -1,23 +1,31 @@
-from functools import partial
-
 from aiogram.types import ParseMode
 
 from app import db
 from app.callback_data_schema import (DeleteRecipeCallbackData,
+                                      NextRecipesPageCallbackData,
+                                      NextSearchPageCallbackData,
+                                      PreviousRecipesPageCallbackData,
+                                      PreviousSearchPageCallbackData,
                                       RecipeDetailsCallbackData,
                                       UnuseRecipeCallbackData,
-                                      UseRecipeCallbackData,
-                                      is_valid_schema_for_callback)
-
+                                      UseRecipeCallbackData)
+from app.callback_router import CallbackRouter
+from app.constants import SEARCH_QUERY_BUCKET_KEY
 from app.exceptions import UserHasNoSelectedRecipeError
-from app.keyboards.layouts import create_recipe_details_layout
-from app.data.messages_text import ERROR_THERE_IS_NO_RECIPE_CALLBACK_MESSAGE, RECIPE_DELETED_MESSAGE
-from loader import dp, bot, logger
+from app.keyboards.layouts import create_recipe_details_layout, create_user_stats_line
+from app.keyboards.markups import recipes_page_inline_keyboard_markup
+from app.recipe_shema import RecipesPage
+from app.data.messages_text import (ERROR_THERE_IS_NO_RECIPE_CALLBACK_MESSAGE, RECIPE_DELETED_MESSAGE,
+                                    EMPTY_RECIPES_LIST_MESSAGE, SHOWN_RECIPES_MESSAGE,
+                                    FOUND_RECIPES_MESSAGE, NOTHING_FOUND_MESSAGE, SEARCH_IS_EXPIRED_MESSAGE)
+from loader import dp, bot, exception_log_sampler
+
 
+router = CallbackRouter()
 
-@dp.callback_query_handler(partial(is_valid_schema_for_callback, schema=RecipeDetailsCallbackData))
-async def show_recipe_details(callback_query):
-    recipe_callback_data = RecipeDetailsCallbackData.parse_raw(callback_query.data)
+
+@router.handler(RecipeDetailsCallbackData)
+async def show_recipe_details(callback_query, recipe_callback_data):
     # TODO: (1) (this is how identical fragments are marked)
     # I don't know how to abstract this block.
     # I don't want to check if recipe is exists each time.
@@ -29,11 +37,10 @@ async def show_recipe_details(callback_query):
     try:
         recipe = await db.find_recipe_by_id(callback_query.from_user.id,
                                             recipe_callback_data.id)
-    except UserHasNoSelectedRecipeError:
-        logger.exception(
-            f"user {callback_query.from_user.id} clicked on already"
-            "deleted recipe with id {recipe_callback_data.id}"
-            )
+    except UserHasNoSelectedRecipeError as error:
+        exception_log_sampler.exception(error, 'clicked on already deleted recipe',
+                                        user_id=callback_query.from_user.id,
+                                        recipe_id=str(recipe_callback_data.id))
         await callback_query.answer(text=ERROR_THERE_IS_NO_RECIPE_CALLBACK_MESSAGE)
         await callback_query.message.delete()
     else:
@@ -43,18 +50,16 @@ async def show_recipe_details(callback_query):
                                     **recipe_details_layout)
 
 
-@dp.callback_query_handler(partial(is_valid_schema_for_callback, schema=UseRecipeCallbackData))
-async def use_recipe(callback_query):
-    recipe_callback_data = UseRecipeCallbackData.parse_raw(callback_query.data)
+@router.handler(UseRecipeCallbackData)
+async def use_recipe(callback_query, recipe_callback_data):
     recipe_id = recipe_callback_data.id
     # TODO: (1)
     try:
         recipe = await db.take_recipe_by_id(callback_query.from_user.id, recipe_id)
-    except UserHasNoSelectedRecipeError:
-        logger.exception(
-            f"user {callback_query.from_user.id} clicked on already"
-            "deleted recipe with id {recipe_callback_data.id}"
-            )
+    except UserHasNoSelectedRecipeError as error:
+        exception_log_sampler.exception(error, 'clicked on already deleted recipe',
+                                        user_id=callback_query.from_user.id,
+                                        recipe_id=str(recipe_callback_data.id))
         await callback_query.answer(text=ERROR_THERE_IS_NO_RECIPE_CALLBACK_MESSAGE)
         await callback_query.message.delete()
     else:
@@ -65,18 +70,16 @@ async def use_recipe(callback_query):
                                     **recipe_details_layout)
 
 
-@dp.callback_query_handler(partial(is_valid_schema_for_callback, schema=UnuseRecipeCallbackData))
-async def unuse_recipe(callback_query):
-    recipe_callback_data = UnuseRecipeCallbackData.parse_raw(callback_query.data)
+@router.handler(UnuseRecipeCallbackData)
+async def unuse_recipe(callback_query, recipe_callback_data):
     recipe_id = recipe_callback_data.id
     # TODO: (1)
     try:
         recipe = await db.unuse_and_find_recipe_by_id(callback_query.from_user.id, recipe_id)
-    except UserHasNoSelectedRecipeError:
-        logger.exception(
-            f"user {callback_query.from_user.id} clicked on already"
-            "deleted recipe with id {recipe_callback_data.id}"
-            )
+    except UserHasNoSelectedRecipeError as error:
+        exception_log_sampler.exception(error, 'clicked on already deleted recipe',
+                                        user_id=callback_query.from_user.id,
+                                        recipe_id=str(recipe_callback_data.id))
         await callback_query.answer(text=ERROR_THERE_IS_NO_RECIPE_CALLBACK_MESSAGE)
         await callback_query.message.delete()
     else:
@@ -87,9 +90,8 @@ async def unuse_recipe(callback_query):
                                     **recipe_details_layout)
 
 
-@dp.callback_query_handler(partial(is_valid_schema_for_callback, schema=DeleteRecipeCallbackData))
-async def delete_recipe(callback_query):
-    recipe_callback_data = DeleteRecipeCallbackData.parse_raw(callback_query.data)
+@router.handler(DeleteRecipeCallbackData)
+async def delete_recipe(callback_query, recipe_callback_data):
     await db.remove_recipe_by_id(callback_query.from_user.id, recipe_callback_data.id)
     answer = RECIPE_DELETED_MESSAGE
     await bot.edit_message_text(text=answer,
@@ -97,3 +99,72 @@ async def delete_recipe(callback_query):
                                 message_id=callback_query.message.message_id,
                                 inline_message_id=callback_query.inline_message_id,
                                 parse_mode=ParseMode.MARKDOWN)
+
+
+async def _show_recipes_page(callback_query, recipes_page: RecipesPage):
+    if not recipes_page.recipes:
+        # Recipes of requested page were deleted, so start from the beginning.
+        recipes_page = await db.list_user_recipes_page(callback_query.from_user.id)
+    if not recipes_page.recipes:
+        await bot.edit_message_text(text=EMPTY_RECIPES_LIST_MESSAGE,
+                                    chat_id=callback_query.from_user.id,
+                                    message_id=callback_query.message.message_id)
+        return
+    user_stats = await db.get_user_stats(callback_query.from_user.id)
+    markup = recipes_page_inline_keyboard_markup(recipes_page)
+    await bot.edit_message_text(text=f'{SHOWN_RECIPES_MESSAGE}\n{create_user_stats_line(user_stats)}',
+                                chat_id=callback_query.from_user.id,
+                                message_id=callback_query.message.message_id,
+                                reply_markup=markup)
+
+
+@router.handler(NextRecipesPageCallbackData)
+async def show_next_recipes_page(callback_query, page_callback_data):
+    recipes_page = await db.list_user_recipes_page(callback_query.from_user.id,
+                                                   after=page_callback_data.id)
+    await _show_recipes_page(callback_query, recipes_page)
+
+
+@router.handler(PreviousRecipesPageCallbackData)
+async def show_previous_recipes_page(callback_query, page_callback_data):
+    recipes_page = await db.list_user_recipes_page(callback_query.from_user.id,
+                                                   before=page_callback_data.id)
+    await _show_recipes_page(callback_query, recipes_page)
+
+
+async def _show_search_page(callback_query, after=None, before=None):
+    user_id = callback_query.from_user.id
+    search_bucket = await dp.storage.get_bucket(chat=callback_query.message.chat.id, user=callback_query.from_user.id)
+    search_query = search_bucket.get(SEARCH_QUERY_BUCKET_KEY)
+    # Only the last query is kept, so pages of older searches can't be shown.
+    if search_query is None or callback_query.message.text != f'{FOUND_RECIPES_MESSAGE}{search_query}':
+        await callback_query.answer(text=SEARCH_IS_EXPIRED_MESSAGE)
+        return
+    recipes_page = await db.search_recipes(user_id, search_query, after=after, before=before)
+    if not recipes_page.recipes:
+        # Recipes of requested page were deleted, so start from the beginning.
+        recipes_page = await db.search_recipes(user_id, search_query)
+    if not recipes_page.recipes:
+        await bot.edit_message_text(text=NOTHING_FOUND_MESSAGE,
+                                    chat_id=user_id,
+                                    message_id=callback_query.message.message_id)
+        return
+    markup = recipes_page_inline_keyboard_markup(recipes_page, NextSearchPageCallbackData,
+                                                 PreviousSearchPageCallbackData)
+    await bot.edit_message_text(text=f'{FOUND_RECIPES_MESSAGE}{search_query}',
+                                chat_id=user_id,
+                                message_id=callback_query.message.message_id,
+                                reply_markup=markup)
+
+
+@router.handler(NextSearchPageCallbackData)
+async def show_next_search_page(callback_query, page_callback_data):
+    await _show_search_page(callback_query, after=page_callback_data.id)
+
+
+@router.handler(PreviousSearchPageCallbackData)
+async def show_previous_search_page(callback_query, page_callback_data):
+    await _show_search_page(callback_query, before=page_callback_data.id)
+
+
+dp.register_callback_query_handler(router.dispatch)
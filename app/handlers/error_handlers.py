@@ -0,0 +1,20 @@
+from aiogram.utils.exceptions import MessageNotModified
+
+from app.context import current_handler_name
+from app.metrics import HANDLER_ERRORS
+from loader import dp
+
+
+@dp.errors_handler()
+async def count_handler_error(update, exception):
+    if isinstance(exception, MessageNotModified):
+        return None
+    HANDLER_ERRORS.labels(current_handler_name.get()).inc()
+    # Error is not handled here, so dispatcher raises it as before.
+    return None
+
+
+@dp.errors_handler(exception=MessageNotModified)
+async def ignore_not_modified_message(update, exception):
+    # Repeated tap on a button edits message to the same content, it is not an error.
+    return True
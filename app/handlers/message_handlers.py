@@ -1,14 +1,36 @@
+import io
+import tempfile
+
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from aiogram.types import ParseMode
+from aiogram.dispatcher.webhook import SendMessage
+from aiogram.types import ContentType, Document, InputFile, ParseMode
 
 from app import db
-from app.exceptions import UserHasNoRecipesError
-from app.keyboards.markups import recipes_list_inline_keyboard_markup
+from app.callback_data_schema import NextSearchPageCallbackData, PreviousSearchPageCallbackData
+from app.constants import (MAXIMUM_IMPORT_FILE_SIZE, MAXIMUM_RANDOM_RECIPES_COUNT, MAXIMUM_RECIPE_TAGS_COUNT,
+                           CSV_EXPORT_FORMAT, JSON_EXPORT_FORMAT, SEARCH_QUERY_BUCKET_KEY)
+from app.exceptions import RandomRecipeDrawError, UserHasNoRecipesError
+from app.keyboards.layouts import create_user_stats_line
+from app.keyboards.markups import recipes_list_inline_keyboard_markup, recipes_page_inline_keyboard_markup
 from app.data.messages_text import (WELCOME_MESSAGE, EMPTY_RECIPES_LIST_MESSAGE,
                                     SHOWN_RECIPES_MESSAGE, WRITE_RECIPE_NAME_MESSAGE,
                                     ADDED_RECIPE_MESSAGE, SINGLE_SHOWN_RECIPE_MESSAGE,
-                                    ALL_RECIPES_MARKED_AS_UNUSED_MESSAGE)
-from loader import dp, logger
+                                    ALL_RECIPES_MARKED_AS_UNUSED_MESSAGE, SEND_RECIPES_FOR_IMPORT_MESSAGE,
+                                    IMPORTED_RECIPES_MESSAGE, IMPORT_FILE_IS_TOO_LARGE_MESSAGE,
+                                    UNKNOWN_EXPORT_FORMAT_MESSAGE, SEVERAL_SHOWN_RECIPES_MESSAGE,
+                                    WRONG_RANDOM_RECIPES_COUNT_MESSAGE, EMPTY_SEARCH_QUERY_MESSAGE,
+                                    FOUND_RECIPES_MESSAGE, NOTHING_FOUND_MESSAGE, NO_RECIPES_WITH_TAG_MESSAGE,
+                                    RANDOM_DRAW_FAILED_MESSAGE)
+from app.recipe_shema import normalize_recipe_tag, recipe_name_key, split_recipe_tags
+from app.recipes_export import write_recipes_csv, write_recipes_json
+from app.recipes_import import is_csv_file_name, parse_recipe_names, parse_recipes_from_csv
+from loader import app_context, bot, dp, exception_log_sampler
+
+
+recipes_export_writers = {
+    JSON_EXPORT_FORMAT: write_recipes_json,
+    CSV_EXPORT_FORMAT: write_recipes_csv,
+}
 
 
 class AddNewRecipeStates(StatesGroup):
@@ -16,49 +38,166 @@ class AddNewRecipeStates(StatesGroup):
     recipe_name = State()
 
 
+class ImportRecipesStates(StatesGroup):
+    """Finite state machine for bulk recipes import processing"""
+    recipe_names = State()
+
+
 @dp.message_handler(commands=['start', 'help'])
 async def start(message):
     welcome_message = WELCOME_MESSAGE
-    await message.answer(welcome_message)
+    return SendMessage(message.chat.id, welcome_message)
 
 
 @dp.message_handler(commands=['list'])
 async def show_recipes_list(message):
-    recipes = await db.list_user_recipes(message.chat.id)
-    if not recipes:
-        await message.answer(text=EMPTY_RECIPES_LIST_MESSAGE)
-    else:
-        markup = recipes_list_inline_keyboard_markup(recipes)
-        await message.answer(text=SHOWN_RECIPES_MESSAGE, reply_markup=markup)
+    recipes_page = await db.list_user_recipes_page(message.chat.id)
+    if not recipes_page.recipes:
+        return SendMessage(message.chat.id, EMPTY_RECIPES_LIST_MESSAGE)
+    user_stats = await db.get_user_stats(message.chat.id)
+    markup = recipes_page_inline_keyboard_markup(recipes_page)
+    return SendMessage(message.chat.id, f'{SHOWN_RECIPES_MESSAGE}\n{create_user_stats_line(user_stats)}',
+                       reply_markup=markup)
+
+
+@dp.message_handler(commands=['find'])
+async def find_recipes(message):
+    query = message.get_args().strip()
+    if not recipe_name_key(query):
+        return SendMessage(message.chat.id, EMPTY_SEARCH_QUERY_MESSAGE)
+    recipes_page = await db.search_recipes(message.chat.id, query)
+    if not recipes_page.recipes:
+        return SendMessage(message.chat.id, NOTHING_FOUND_MESSAGE)
+    # Compact callback data holds only recipe id, so page buttons read the query from FSM storage.
+    await dp.storage.update_bucket(chat=message.chat.id, user=message.from_user.id,
+                                   bucket={SEARCH_QUERY_BUCKET_KEY: query})
+    markup = recipes_page_inline_keyboard_markup(recipes_page, NextSearchPageCallbackData,
+                                                 PreviousSearchPageCallbackData)
+    return SendMessage(message.chat.id, f'{FOUND_RECIPES_MESSAGE}{query}', reply_markup=markup)
 
 
 @dp.message_handler(commands=['add'])
 async def add_recipe(message):
     await AddNewRecipeStates.recipe_name.set()
-    await message.answer(WRITE_RECIPE_NAME_MESSAGE)
+    return SendMessage(message.chat.id, WRITE_RECIPE_NAME_MESSAGE)
 
 
 @dp.message_handler(state=AddNewRecipeStates.recipe_name)
 async def process_recipe_name(message, state):
-    await db.add_recipe_by_name(message.chat.id, message.text)
-    await message.answer(f'{ADDED_RECIPE_MESSAGE}`{message.text}`', parse_mode=ParseMode.MARKDOWN)
+    recipe_name, tags = split_recipe_tags(message.text, MAXIMUM_RECIPE_TAGS_COUNT)
+    await db.add_recipe_by_name(message.chat.id, recipe_name, tags)
+    await state.finish()
+    text = f'{ADDED_RECIPE_MESSAGE}`{recipe_name}`'
+    if tags:
+        text += '\n`' + ' '.join(f'#{tag}' for tag in tags) + '`'
+    return SendMessage(message.chat.id, text, parse_mode=ParseMode.MARKDOWN)
+
+
+@dp.message_handler(commands=['import'])
+async def import_recipes(message):
+    await ImportRecipesStates.recipe_names.set()
+    return SendMessage(message.chat.id, SEND_RECIPES_FOR_IMPORT_MESSAGE)
+
+
+async def _import_recipes_from_document(user_id: int, document: Document) -> int:
+    """Download document to temporary file and import recipes from it line by line.
+
+    Args:
+        user_id (int): id of user in db.
+        document (Document): uploaded text or csv file.
+
+    Returns:
+        int: count of added recipes.
+    """
+    with tempfile.TemporaryFile() as downloaded_file:
+        await bot.download_file_by_id(document.file_id, destination=downloaded_file)
+        lines = io.TextIOWrapper(downloaded_file, encoding='utf-8', errors='replace', newline='')
+        if is_csv_file_name(document.file_name):
+            return await db.add_recipes_with_tags(user_id, parse_recipes_from_csv(lines))
+        return await db.add_recipes_by_names(user_id, parse_recipe_names(lines))
+
+
+@dp.message_handler(state=ImportRecipesStates.recipe_names,
+                    content_types=[ContentType.TEXT, ContentType.DOCUMENT])
+async def process_imported_recipes(message, state):
     await state.finish()
+    if message.document is None:
+        recipe_names = parse_recipe_names(message.text.splitlines())
+        added_count = await db.add_recipes_by_names(message.chat.id, recipe_names)
+    elif (message.document.file_size or 0) > MAXIMUM_IMPORT_FILE_SIZE:
+        return SendMessage(message.chat.id, IMPORT_FILE_IS_TOO_LARGE_MESSAGE)
+    else:
+        added_count = await _import_recipes_from_document(message.chat.id, message.document)
+    return SendMessage(message.chat.id, f'{IMPORTED_RECIPES_MESSAGE}{added_count}')
+
+
+@dp.message_handler(commands=['export'])
+async def export_recipes(message):
+    export_format = message.get_args().strip().lower() or JSON_EXPORT_FORMAT
+    write_recipes = recipes_export_writers.get(export_format)
+    if write_recipes is None:
+        return SendMessage(message.chat.id, UNKNOWN_EXPORT_FORMAT_MESSAGE)
+    async with app_context.export_semaphore:
+        with tempfile.TemporaryFile() as export_file:
+            text_export_file = io.TextIOWrapper(export_file, encoding='utf-8', newline='')
+            written_count = await write_recipes(db.iterate_user_recipes(message.chat.id), text_export_file)
+            if not written_count:
+                return SendMessage(message.chat.id, EMPTY_RECIPES_LIST_MESSAGE)
+            text_export_file.flush()
+            export_file.seek(0)
+            # Webhook response can't upload a file, so document is sent by API request.
+            await message.answer_document(InputFile(export_file, filename=f'recipes.{export_format}'))
+
+
+def _no_recipes_message(tag):
+    if tag is None:
+        return EMPTY_RECIPES_LIST_MESSAGE
+    return NO_RECIPES_WITH_TAG_MESSAGE.format(tag=tag)
 
 
 @dp.message_handler(commands=['random'])
 async def take_random_recipe(message):
+    """Handle `/random [N] [tag]`."""
+    args = message.get_args().split()
+    recipes_count_arg = args.pop(0) if args and args[0].isdigit() else None
+    tag = normalize_recipe_tag(args[0]) if len(args) == 1 else None
+    if len(args) > 1 or (args and not tag):
+        return SendMessage(message.chat.id,
+                           WRONG_RANDOM_RECIPES_COUNT_MESSAGE.format(maximum_count=MAXIMUM_RANDOM_RECIPES_COUNT))
+    if recipes_count_arg is not None:
+        return await take_several_random_recipes(message, recipes_count_arg, tag)
     try:
-        recipe = await db.take_random_recipe(message.chat.id)
-    except UserHasNoRecipesError:
-        logger.exception(f"user {message.chat.id} called /random without recipes")
-        await message.answer(text=EMPTY_RECIPES_LIST_MESSAGE)
-    else:
-        text = f'{SINGLE_SHOWN_RECIPE_MESSAGE}' \
-               f'*{recipe.name}*'
-        await message.answer(text=text, parse_mode=ParseMode.MARKDOWN)
+        recipe = await db.take_random_recipe(message.chat.id, tag)
+    except UserHasNoRecipesError as error:
+        exception_log_sampler.exception(error, 'called /random without recipes', user_id=message.chat.id)
+        return SendMessage(message.chat.id, _no_recipes_message(tag))
+    except RandomRecipeDrawError as error:
+        exception_log_sampler.exception(error, 'lost random draws to concurrent updates', user_id=message.chat.id)
+        return SendMessage(message.chat.id, RANDOM_DRAW_FAILED_MESSAGE)
+    user_stats = await db.get_user_stats(message.chat.id)
+    text = f'{SINGLE_SHOWN_RECIPE_MESSAGE}' \
+           f'*{recipe.name}*\n' \
+           f'{create_user_stats_line(user_stats)}'
+    return SendMessage(message.chat.id, text, parse_mode=ParseMode.MARKDOWN)
+
+
+async def take_several_random_recipes(message, recipes_count_arg: str, tag=None):
+    """Handle `/random N`: take N recipes at once and show them by buttons of one message."""
+    if not recipes_count_arg.isdigit() or not 1 <= int(recipes_count_arg) <= MAXIMUM_RANDOM_RECIPES_COUNT:
+        return SendMessage(message.chat.id,
+                           WRONG_RANDOM_RECIPES_COUNT_MESSAGE.format(maximum_count=MAXIMUM_RANDOM_RECIPES_COUNT))
+    try:
+        recipes = await db.take_random_recipes(message.chat.id, int(recipes_count_arg), tag)
+    except UserHasNoRecipesError as error:
+        exception_log_sampler.exception(error, 'called /random without recipes', user_id=message.chat.id)
+        return SendMessage(message.chat.id, _no_recipes_message(tag))
+    user_stats = await db.get_user_stats(message.chat.id)
+    markup = recipes_list_inline_keyboard_markup(recipes)
+    return SendMessage(message.chat.id, f'{SEVERAL_SHOWN_RECIPES_MESSAGE}\n{create_user_stats_line(user_stats)}',
+                       reply_markup=markup)
 
 
 @dp.message_handler(commands=['unuse_all'])
 async def unuse_all_recipes(message):
     await db.unuse_all_recipes(message.chat.id)
-    await message.answer(ALL_RECIPES_MARKED_AS_UNUSED_MESSAGE)
+    return SendMessage(message.chat.id, ALL_RECIPES_MARKED_AS_UNUSED_MESSAGE)
@@ -1,17 +1,18 @@
 from aiogram.types import ParseMode
 
 from app.keyboards.markups import recipe_details_markup
-from app.recipe_shema import RecipeWithId
+from app.recipe_shema import RecipeRecord, UserStats
 from app.data.messages_text import (IS_USED_RECIPE_DETAILS_MESSAGE,
                                     IS_UNUSED_RECIPE_DETAILS_MESSAGE,
-                                    SINGLE_SHOWN_RECIPE_MESSAGE)
+                                    SINGLE_SHOWN_RECIPE_MESSAGE,
+                                    USED_RECIPES_STATS_MESSAGE)
 
 
-def create_recipe_details_layout(recipe: RecipeWithId) -> dict:
+def create_recipe_details_layout(recipe: RecipeRecord) -> dict:
     """Create recipe details keyboard markup, text for message.
 
     Args:
-        recipe (RecipeWithId): recipe.
+        recipe (RecipeRecord): recipe.
 
     Returns:
         dict: actually kwargs for methods like
@@ -23,3 +24,15 @@ def create_recipe_details_layout(recipe: RecipeWithId) -> dict:
                    f'*{recipe.name}*\n' \
                    f'{is_used_status_line}'
     return dict(text=details_text, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+
+
+def create_user_stats_line(user_stats: UserStats) -> str:
+    """Create line with counts of used and all user recipes.
+
+    Args:
+        user_stats (UserStats): counts of user recipes.
+
+    Returns:
+        str: text line.
+    """
+    return USED_RECIPES_STATS_MESSAGE.format(used=user_stats.used, total=user_stats.total)
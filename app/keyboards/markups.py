@@ -1,15 +1,24 @@
+import functools
+
 from aiogram.types.inline_keyboard import (InlineKeyboardButton,
                                            InlineKeyboardMarkup)
+from bson.objectid import ObjectId
 from pydantic import BaseModel
 
 from app.callback_data_schema import (DeleteRecipeCallbackData,
+                                      NextRecipesPageCallbackData,
+                                      PreviousRecipesPageCallbackData,
                                       RecipeDetailsCallbackData,
                                       UnuseRecipeCallbackData,
-                                      UseRecipeCallbackData)
-from app.recipe_shema import RecipeWithId
+                                      UseRecipeCallbackData,
+                                      encode_callback_data)
+from app.constants import RENDERED_KEYBOARDS_CACHE_SIZE
+from app.recipe_shema import RecipeRecord, RecipesPage
 from app.data.messages_text import (MARK_AS_UNUSED_RECIPE_BUTTON_TEXT,
                                     MARK_AS_USED_RECIPE_BUTTON_TEXT,
-                                    DELETE_RECIPE_BUTTON_TEXT)
+                                    DELETE_RECIPE_BUTTON_TEXT,
+                                    NEXT_PAGE_BUTTON_TEXT,
+                                    PREVIOUS_PAGE_BUTTON_TEXT)
 
 
 def create_inline_keyboard_button(
@@ -18,7 +27,7 @@ def create_inline_keyboard_button(
     callback_data: dict = {}
 ) -> InlineKeyboardMarkup:
     """Creates an inline bot keyboard button.
-    The json generated from the callback_class instance is written to the callback.
+    The compact data encoded from the callback_class instance is written to the callback.
 
     Args:
         button_text (str): button text.
@@ -29,7 +38,7 @@ def create_inline_keyboard_button(
         InlineKeyboardMarkup: telegram bot button.
     """
     callback_data = callback_class(**callback_data)
-    return InlineKeyboardButton(button_text, callback_data=callback_data.json())
+    return InlineKeyboardButton(button_text, callback_data=encode_callback_data(callback_data))
 
 
 def create_inline_markup_from_buttons(buttons: list[list[InlineKeyboardButton]]) -> InlineKeyboardMarkup:
@@ -47,18 +56,24 @@ def create_inline_markup_from_buttons(buttons: list[list[InlineKeyboardButton]])
     return inline_markup
 
 
-def recipe_details_markup(recipe: RecipeWithId) -> InlineKeyboardMarkup:
+def recipe_details_markup(recipe: RecipeRecord) -> InlineKeyboardMarkup:
     """Recipe details telegram bot keyboard markup.
+    Markup is cached and shared between calls, so it must not be modified.
 
     Args:
-        recipe (RecipeWithId): recipe.
+        recipe (RecipeRecord): recipe.
 
     Returns:
         InlineKeyboardMarkup: recipe details markup.
     """
+    return _recipe_details_markup(recipe.id, recipe.is_used)
+
+
+@functools.lru_cache(maxsize=RENDERED_KEYBOARDS_CACHE_SIZE)
+def _recipe_details_markup(recipe_id: ObjectId, is_used: bool) -> InlineKeyboardMarkup:
     buttons = []
-    id_data = {'id': recipe.id}
-    if recipe.is_used:
+    id_data = {'id': recipe_id}
+    if is_used:
         unuse_recipe_button = create_inline_keyboard_button(MARK_AS_UNUSED_RECIPE_BUTTON_TEXT,
                                                             UnuseRecipeCallbackData,
                                                             id_data)
@@ -74,21 +89,54 @@ def recipe_details_markup(recipe: RecipeWithId) -> InlineKeyboardMarkup:
     return markup
 
 
-def recipes_list_inline_keyboard_markup(recipes_list: list[RecipeWithId]) -> InlineKeyboardMarkup:
+def recipes_list_inline_keyboard_markup(recipes_list: list[RecipeRecord]) -> InlineKeyboardMarkup:
     """List of recipes telegram bot keyboard markup.
     Args:
-        recipes_list (list[RecipeWithId]): list of recipes.
+        recipes_list (list[RecipeRecord]): list of recipes.
 
     Returns:
         InlineKeyboardMarkup: markup with list of recipes.
     """
-    buttons = []
-    for current_recipe in recipes_list:
-        display_is_used_recipe = '\U0001F373' if current_recipe.is_used else ''
-        display_recipe_name = current_recipe.name + display_is_used_recipe
-
-        id_data = {'id': current_recipe.id}
-        recipe_button = create_inline_keyboard_button(display_recipe_name, RecipeDetailsCallbackData, id_data)
-        buttons.append([recipe_button])
+    buttons = [[_recipe_list_button(current_recipe.id, current_recipe.name, current_recipe.is_used)]
+               for current_recipe in recipes_list]
     markup = create_inline_markup_from_buttons(buttons)
     return markup
+
+
+@functools.lru_cache(maxsize=RENDERED_KEYBOARDS_CACHE_SIZE)
+def _recipe_list_button(recipe_id: ObjectId, name: str, is_used: bool) -> InlineKeyboardButton:
+    """Recipe button of list. Button is shared between markups, so it must not be modified."""
+    display_is_used_recipe = '\U0001F373' if is_used else ''
+    display_recipe_name = name + display_is_used_recipe
+    return create_inline_keyboard_button(display_recipe_name, RecipeDetailsCallbackData, {'id': recipe_id})
+
+
+def recipes_page_inline_keyboard_markup(
+    page: RecipesPage,
+    next_page_callback_class: BaseModel = NextRecipesPageCallbackData,
+    previous_page_callback_class: BaseModel = PreviousRecipesPageCallbackData
+) -> InlineKeyboardMarkup:
+    """Page of recipes telegram bot keyboard markup with navigation buttons.
+    Args:
+        page (RecipesPage): page of recipes.
+        next_page_callback_class (BaseModel): callback data schema of next page button.
+        previous_page_callback_class (BaseModel): callback data schema of previous page button.
+
+    Returns:
+        InlineKeyboardMarkup: markup with page of recipes.
+    """
+    markup = recipes_list_inline_keyboard_markup(page.recipes)
+    navigation_buttons = []
+    if page.has_previous:
+        first_recipe_id_data = {'id': page.recipes[0].id}
+        navigation_buttons.append(create_inline_keyboard_button(PREVIOUS_PAGE_BUTTON_TEXT,
+                                                                previous_page_callback_class,
+                                                                first_recipe_id_data))
+    if page.has_next:
+        last_recipe_id_data = {'id': page.recipes[-1].id}
+        navigation_buttons.append(create_inline_keyboard_button(NEXT_PAGE_BUTTON_TEXT,
+                                                                next_page_callback_class,
+                                                                last_recipe_id_data))
+    if navigation_buttons:
+        markup.row(*navigation_buttons)
+    return markup
@@ -0,0 +1,40 @@
+import time
+from typing import Callable
+
+from loguru import logger
+
+
+class ExceptionLogSampler:
+    """
+    Logs traceback of expected exception at most once per `interval` seconds for each
+    exception type. Other occurrences are logged as one line warnings without traceback,
+    and count of them is reported with the next traceback.
+    """
+
+    def __init__(self, interval: float, timer: Callable[[], float] = time.monotonic):
+        self.interval = interval
+        self._timer = timer
+        self._last_traceback_at: dict[type, float] = {}
+        self._suppressed_counts: dict[type, int] = {}
+
+    def exception(self, exception: BaseException, message: str, **fields) -> None:
+        """Log handled exception. Should be called in `except` block.
+
+        Args:
+            exception (BaseException): handled exception.
+            message (str): log message.
+            fields: structured fields of log record.
+        """
+        exception_type = type(exception)
+        now = self._timer()
+        last_traceback_at = self._last_traceback_at.get(exception_type)
+        bound_logger = logger.bind(**fields)
+        if last_traceback_at is not None and now - last_traceback_at < self.interval:
+            self._suppressed_counts[exception_type] = self._suppressed_counts.get(exception_type, 0) + 1
+            bound_logger.warning(f'{message} ({exception_type.__name__})')
+            return
+        self._last_traceback_at[exception_type] = now
+        suppressed_count = self._suppressed_counts.pop(exception_type, 0)
+        bound_logger.opt(exception=exception).error(
+            f'{message} ({suppressed_count} tracebacks of {exception_type.__name__} suppressed)'
+        )
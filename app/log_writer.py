@@ -0,0 +1,58 @@
+import queue
+import threading
+from typing import Optional
+
+from loguru import logger
+
+
+class BackgroundLogWriter:
+    """
+    Formats and writes log records in a background thread.
+    Loguru formats messages, tracebacks and JSON in the logging thread before calling a sink,
+    even with `enqueue=True`, so only raw records are queued here: they are taken by handler filter
+    before formatting. The consumer thread replays them to `writer_logger` with real sinks,
+    where formatting and I/O happen. It must be independent of the global logger,
+    e.g. `copy.deepcopy(logger)` made after `logger.remove()`.
+    """
+
+    def __init__(self, writer_logger):
+        self.writer_logger = writer_logger
+        self._queue: queue.SimpleQueue[Optional[dict]] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._consume, name='log-writer', daemon=True)
+        self._handler_id: Optional[int] = None
+
+    def start(self, level: str = 'DEBUG') -> None:
+        """Start consumer thread and route records of global logger to it.
+
+        Args:
+            level (str): minimal level of routed records.
+        """
+        self._thread.start()
+        # Filter returns False, so loguru never formats records for this handler and its sink isn't called.
+        self._handler_id = logger.add(lambda message: None, level=level, filter=self._put)
+
+    def stop(self) -> None:
+        """Stop routing records and wait until queued records are written."""
+        if self._handler_id is not None:
+            logger.remove(self._handler_id)
+            self._handler_id = None
+        self._queue.put(None)
+        self._thread.join()
+
+    def _put(self, record: dict) -> bool:
+        self._queue.put(record)
+        return False
+
+    def _consume(self) -> None:
+        while (record := self._queue.get()) is not None:
+            try:
+                self._write(record)
+            except Exception:
+                # Broken record must not stop logging of the others.
+                pass
+
+    def _write(self, record: dict) -> None:
+        # Patcher replaces record built by replay with the original one, so time, caller,
+        # bound fields and exception are logged as they were on the logging thread.
+        original_logger = self.writer_logger.patch(lambda replayed_record: replayed_record.update(record))
+        original_logger.log(record['level'].name, record['message'])
@@ -0,0 +1,139 @@
+import functools
+import threading
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import monitoring
+
+from app.context import UNKNOWN_HANDLER_NAME
+
+
+HANDLER_LATENCY = Histogram('bot_handler_latency_seconds', 'Latency of update handlers', ['handler'])
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Count of errors raised by update handlers', ['handler'])
+DUPLICATE_UPDATES = Counter('bot_duplicate_updates_total', 'Count of dropped duplicate updates', ['kind'])
+DB_OPERATION_LATENCY = Histogram('bot_db_operation_latency_seconds', 'Latency of app.db operations', ['operation'])
+DB_OPERATION_ERRORS = Counter('bot_db_operation_errors_total', 'Count of failed app.db operations', ['operation'])
+MONGO_ROUND_TRIPS = Counter('bot_mongo_round_trips_total', 'Count of Mongo commands by app.db operation',
+                            ['operation', 'command'])
+MONGO_COMMAND_LATENCY = Histogram('bot_mongo_command_latency_seconds', 'Latency of Mongo commands', ['command'])
+MONGO_COMMAND_ERRORS = Counter('bot_mongo_command_errors_total', 'Count of failed Mongo commands', ['command'])
+MONGO_POOL_CONNECTIONS = Gauge('bot_mongo_pool_connections', 'Count of open Mongo connections')
+MONGO_POOL_CHECKED_OUT = Gauge('bot_mongo_pool_checked_out', 'Count of Mongo connections in use')
+MONGO_POOL_WAITING = Gauge('bot_mongo_pool_waiting', 'Count of commands waiting for Mongo connection')
+MONGO_POOL_WAIT_LATENCY = Histogram('bot_mongo_pool_wait_seconds', 'Time of waiting for Mongo connection')
+MONGO_POOL_CHECKOUT_FAILURES = Counter('bot_mongo_pool_checkout_failures_total',
+                                       'Count of failed Mongo connection checkouts', ['reason'])
+MONGO_POOL_CLEARS = Counter('bot_mongo_pool_clears_total', 'Count of Mongo pool clears after server errors')
+
+UNKNOWN_LABEL = UNKNOWN_HANDLER_NAME
+
+# Outermost app.db operation of current task. Motor runs pymongo in threads with copied context,
+# so command listener sees it too.
+current_db_operation: ContextVar[Optional[str]] = ContextVar('current_db_operation', default=None)
+
+
+def instrument_db_operation(operation: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """Record latency, errors and Mongo round trips of app.db coroutine.
+
+    Args:
+        operation (Callable[..., Awaitable]): app.db coroutine function.
+
+    Returns:
+        Callable[..., Awaitable]: instrumented coroutine function.
+    """
+    operation_name = operation.__name__
+
+    @functools.wraps(operation)
+    async def instrumented_operation(*args, **kwargs):
+        # Round trips of nested operations are accounted to the outermost one.
+        token = current_db_operation.set(operation_name) if current_db_operation.get() is None else None
+        started_at = time.perf_counter()
+        try:
+            return await operation(*args, **kwargs)
+        except Exception:
+            DB_OPERATION_ERRORS.labels(operation_name).inc()
+            raise
+        finally:
+            DB_OPERATION_LATENCY.labels(operation_name).observe(time.perf_counter() - started_at)
+            if token is not None:
+                current_db_operation.reset(token)
+    return instrumented_operation
+
+
+class MongoCommandMetricsListener(monitoring.CommandListener):
+    """
+    Counts Mongo round trips and their latency.
+    """
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        MONGO_ROUND_TRIPS.labels(current_db_operation.get() or UNKNOWN_LABEL, event.command_name).inc()
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        MONGO_COMMAND_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        MONGO_COMMAND_LATENCY.labels(event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_ERRORS.labels(event.command_name).inc()
+
+
+class MongoPoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    Reports saturation of Mongo connection pools: open, used and awaited connections and checkout latency.
+    Checkout is started and finished in the same thread, so its start time is kept in thread local storage.
+    """
+
+    def __init__(self):
+        self._checkout = threading.local()
+
+    def _finish_checkout(self) -> None:
+        MONGO_POOL_WAITING.dec()
+        started_at = getattr(self._checkout, 'started_at', None)
+        if started_at is not None:
+            MONGO_POOL_WAIT_LATENCY.observe(time.perf_counter() - started_at)
+            self._checkout.started_at = None
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        MONGO_POOL_CLEARS.inc()
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        MONGO_POOL_CONNECTIONS.inc()
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        MONGO_POOL_CONNECTIONS.dec()
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        MONGO_POOL_WAITING.inc()
+        self._checkout.started_at = time.perf_counter()
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        self._finish_checkout()
+        MONGO_POOL_CHECKOUT_FAILURES.labels(event.reason).inc()
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        self._finish_checkout()
+        MONGO_POOL_CHECKED_OUT.inc()
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        MONGO_POOL_CHECKED_OUT.dec()
+
+
+def register_gauge(name: str, documentation: str, get_value: Callable[[], float]) -> None:
+    """Register gauge which is evaluated on each scrape.
+
+    Args:
+        name (str): metric name.
+        documentation (str): metric description.
+        get_value (Callable[[], float]): function returning current value.
+    """
+    Gauge(name, documentation).set_function(get_value)
@@ -0,0 +1,6 @@
+from app.middlewares.deduplication import DeduplicationMiddleware
+from app.middlewares.logs import LoggingMiddleware
+from app.middlewares.metrics import MetricsMiddleware
+
+
+__all__ = ['DeduplicationMiddleware', 'LoggingMiddleware', 'MetricsMiddleware']
@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from app.metrics import DUPLICATE_UPDATES
+
+
+CALLBACK_MESSAGE_KEY = 'deduplication_callback_message'
+
+
+class DeduplicationMiddleware(BaseMiddleware):
+    """
+    Drops repeated updates before they reach handlers, DB and Bot API.
+    Telegram redelivers webhook updates, so update id seen within `window` seconds is dropped.
+    Update which failed is forgotten, so its redelivery is processed again.
+    Callback queries of one message are processed one at a time, so a double tap
+    on a button is answered without action while the first tap is handled.
+    State is kept in process memory, at most `max_size` update ids.
+    """
+
+    def __init__(self, window: float, max_size: int, timer: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.window = window
+        self.max_size = max_size
+        self._timer = timer
+        self._seen_update_ids: OrderedDict[int, float] = OrderedDict()
+        self._callback_messages_in_progress: set[Hashable] = set()
+
+    def is_duplicate_update(self, update_id: int) -> bool:
+        """Check if update was seen within window and remember it.
+
+        Args:
+            update_id (int): id of telegram update.
+
+        Returns:
+            bool: True if update is duplicate. Otherwise False.
+        """
+        now = self._timer()
+        # Ids are remembered in order of arrival, so expired ones are at the beginning.
+        while self._seen_update_ids and next(iter(self._seen_update_ids.values())) <= now - self.window:
+            self._seen_update_ids.popitem(last=False)
+        if update_id in self._seen_update_ids:
+            return True
+        if len(self._seen_update_ids) >= self.max_size:
+            self._seen_update_ids.popitem(last=False)
+        self._seen_update_ids[update_id] = now
+        return False
+
+    def forget_update(self, update_id: int) -> None:
+        """Let update be processed again.
+
+        Args:
+            update_id (int): id of telegram update.
+        """
+        self._seen_update_ids.pop(update_id, None)
+
+    @staticmethod
+    def _callback_message_key(callback_query) -> Optional[Hashable]:
+        if callback_query.message is not None:
+            return callback_query.message.chat.id, callback_query.message.message_id
+        return callback_query.inline_message_id
+
+    async def on_pre_process_update(self, update, data):
+        if self.is_duplicate_update(update.update_id):
+            DUPLICATE_UPDATES.labels('update').inc()
+            raise CancelHandler()
+
+    async def on_post_process_update(self, update, results, data):
+        # Results are empty only if processing raised, handled update has result of dispatcher.
+        if not results:
+            self.forget_update(update.update_id)
+
+    async def on_pre_process_callback_query(self, callback_query, data):
+        key = self._callback_message_key(callback_query)
+        if key is None:
+            return
+        if key in self._callback_messages_in_progress:
+            DUPLICATE_UPDATES.labels('callback_query').inc()
+            # Telegram client shows progress on the button until the query is answered.
+            await callback_query.answer()
+            raise CancelHandler()
+        self._callback_messages_in_progress.add(key)
+        data[CALLBACK_MESSAGE_KEY] = key
+
+    async def on_post_process_callback_query(self, callback_query, results, data):
+        key = data.pop(CALLBACK_MESSAGE_KEY, None)
+        if key is not None:
+            self._callback_messages_in_progress.discard(key)
@@ -0,0 +1,39 @@
+import time
+
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from loguru import logger
+
+from app.context import current_handler_name, current_recipe_id
+
+
+HANDLER_LOG_STARTED_AT_KEY = 'logs_handler_started_at'
+
+
+class LoggingMiddleware(BaseMiddleware):
+    """
+    Logs handled messages and callback queries as structured events.
+    """
+
+    def _log_handled_update(self, user_id: int, data: dict) -> None:
+        started_at = data.pop(HANDLER_LOG_STARTED_AT_KEY, None)
+        # There is no started timer if update wasn't matched by any handler.
+        if started_at is None:
+            return
+        logger.bind(
+            user_id=user_id,
+            handler=current_handler_name.get(),
+            recipe_id=current_recipe_id.get(),
+            duration=time.perf_counter() - started_at
+        ).debug('update handled')
+
+    async def on_process_message(self, message, data):
+        data[HANDLER_LOG_STARTED_AT_KEY] = time.perf_counter()
+
+    async def on_post_process_message(self, message, results, data):
+        self._log_handled_update(message.chat.id, data)
+
+    async def on_process_callback_query(self, callback_query, data):
+        data[HANDLER_LOG_STARTED_AT_KEY] = time.perf_counter()
+
+    async def on_post_process_callback_query(self, callback_query, results, data):
+        self._log_handled_update(callback_query.from_user.id, data)
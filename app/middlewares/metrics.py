@@ -0,0 +1,39 @@
+import time
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from app.context import current_handler_name
+from app.metrics import HANDLER_LATENCY, UNKNOWN_LABEL
+
+
+HANDLER_STARTED_AT_KEY = 'metrics_handler_started_at'
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Records latency of message and callback query handlers.
+    """
+
+    def _start_handler_timer(self, data: dict) -> None:
+        handler = current_handler.get(None)
+        current_handler_name.set(getattr(handler, '__name__', UNKNOWN_LABEL))
+        data[HANDLER_STARTED_AT_KEY] = time.perf_counter()
+
+    def _observe_handler_latency(self, data: dict) -> None:
+        started_at = data.pop(HANDLER_STARTED_AT_KEY, None)
+        # There is no started timer if update wasn't matched by any handler.
+        if started_at is not None:
+            HANDLER_LATENCY.labels(current_handler_name.get()).observe(time.perf_counter() - started_at)
+
+    async def on_process_message(self, message, data):
+        self._start_handler_timer(data)
+
+    async def on_post_process_message(self, message, results, data):
+        self._observe_handler_latency(data)
+
+    async def on_process_callback_query(self, callback_query, data):
+        self._start_handler_timer(data)
+
+    async def on_post_process_callback_query(self, callback_query, results, data):
+        self._observe_handler_latency(data)
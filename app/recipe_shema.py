@@ -1,23 +1,111 @@
-from bson import json_util
+from typing import NamedTuple, Optional
+
 from bson.objectid import ObjectId
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, validator
+
+
+def recipe_name_key(name: str) -> str:
+    """Normalize recipe name for case insensitive prefix search.
+
+    Args:
+        name (str): recipe name or search query.
+
+    Returns:
+        str: search key.
+    """
+    return ' '.join(name.casefold().replace('ё', 'е').split())
+
+
+def normalize_recipe_tag(tag: str) -> str:
+    """Normalize tag written by user, with or without leading `#`.
+
+    Args:
+        tag (str): tag.
+
+    Returns:
+        str: normalized tag. Empty if there is no tag.
+    """
+    return tag.strip().lstrip('#').casefold()
+
+
+def split_recipe_tags(text: str, maximum_tags_count: Optional[int] = None) -> tuple[str, list[str]]:
+    """Split `#tag` words from recipe name, e.g. `Омлет #завтрак #быстро`.
+
+    Args:
+        text (str): recipe name with tags.
+        maximum_tags_count (Optional[int]): max count of kept tags, the rest is dropped.
+
+    Returns:
+        tuple[str, list[str]]: recipe name and unique normalized tags.
+            Text is returned as is if it has no tags or consists only of tags.
+    """
+    words = text.split()
+    name_words = [word for word in words if not (word.startswith('#') and normalize_recipe_tag(word))]
+    if not name_words or len(name_words) == len(words):
+        return text, []
+    tags = list(dict.fromkeys(normalize_recipe_tag(word) for word in words if word not in name_words))
+    return ' '.join(name_words), tags[:maximum_tags_count]
 
 
 class Recipe(BaseModel):
     """
-    Recipe. Consists of the name and usage flag fields.
+    Recipe. Consists of the name, its search key, tags and usage flag fields.
+    Validates recipes created from user input.
     """
     name: str
     is_used: bool = False
+    name_key: str = ''
+    tags: list[str] = []
 
+    @validator('name_key', always=True)
+    def set_name_key(cls, name_key: str, values: dict) -> str:
+        return recipe_name_key(values['name']) if 'name' in values else name_key
 
-class RecipeWithId(Recipe):
+
+class RecipeRecord(NamedTuple):
     """
-    Recipe with MongoDB index ID.
+    Recipe with MongoDB index ID read from DB.
+    Documents are written by the bot, so they are not validated again.
     """
-    id: ObjectId = Field(alias='_id')
+    id: ObjectId
+    name: str
+    is_used: bool = False
+    tags: tuple[str, ...] = ()
+
+    @classmethod
+    def from_document(cls, document: dict) -> 'RecipeRecord':
+        """Create recipe from Mongo document.
+
+        Args:
+            document (dict): Mongo document with `_id`, `name`, `is_used` and `tags` fields.
+
+        Returns:
+            RecipeRecord: recipe.
+        """
+        return cls(document['_id'], document['name'], document.get('is_used', False),
+                   tuple(document.get('tags', ())))
+
+    def to_document(self) -> dict:
+        """Return recipe as Mongo document.
+
+        Returns:
+            dict: Mongo document with `_id`, `name`, `is_used` and `tags` fields.
+        """
+        return {'_id': self.id, 'name': self.name, 'is_used': self.is_used, 'tags': list(self.tags)}
 
-    class Config:
-        arbitrary_types_allowed = True
-        json_dumps = json_util.dumps
-        json_loads = json_util.loads
+
+class UserStats(BaseModel):
+    """
+    Counts of user recipes.
+    """
+    total: int = 0
+    used: int = 0
+
+
+class RecipesPage(NamedTuple):
+    """
+    Page of user recipes with flags of neighbour pages existence.
+    """
+    recipes: list[RecipeRecord]
+    has_previous: bool = False
+    has_next: bool = False
@@ -0,0 +1,50 @@
+import csv
+from typing import AsyncIterable, TextIO
+
+from bson import json_util
+
+from app.recipe_shema import RecipeRecord
+
+
+CSV_EXPORT_HEADER = ('name', 'is_used', 'id', 'tags')
+
+
+async def write_recipes_json(recipes: AsyncIterable[RecipeRecord], file: TextIO) -> int:
+    """Incrementally write recipes as JSON array in MongoDB extended JSON format.
+
+    Args:
+        recipes (AsyncIterable[RecipeRecord]): recipes to export.
+        file (TextIO): destination file.
+
+    Returns:
+        int: count of written recipes.
+    """
+    written_count = 0
+    file.write('[')
+    async for recipe in recipes:
+        if written_count:
+            file.write(',')
+        file.write('\n')
+        file.write(json_util.dumps(recipe.to_document(), ensure_ascii=False))
+        written_count += 1
+    file.write('\n]\n')
+    return written_count
+
+
+async def write_recipes_csv(recipes: AsyncIterable[RecipeRecord], file: TextIO) -> int:
+    """Incrementally write recipes as CSV table. Tags are written as `#tag` words separated by spaces.
+
+    Args:
+        recipes (AsyncIterable[RecipeRecord]): recipes to export.
+        file (TextIO): destination file.
+
+    Returns:
+        int: count of written recipes.
+    """
+    written_count = 0
+    writer = csv.writer(file)
+    writer.writerow(CSV_EXPORT_HEADER)
+    async for recipe in recipes:
+        writer.writerow((recipe.name, int(recipe.is_used), str(recipe.id), ' '.join(f'#{tag}' for tag in recipe.tags)))
+        written_count += 1
+    return written_count
@@ -0,0 +1,72 @@
+import csv
+import itertools
+from typing import Iterable, Iterator
+
+from app.constants import MAXIMUM_RECIPE_TAGS_COUNT
+from app.recipe_shema import normalize_recipe_tag
+from app.recipes_export import CSV_EXPORT_HEADER
+
+
+def parse_recipe_names(lines: Iterable[str]) -> Iterator[str]:
+    """Lazily parse recipe names, one per line.
+
+    Args:
+        lines (Iterable[str]): lines of text.
+
+    Yields:
+        Iterator[str]: non empty recipe names.
+    """
+    for line in lines:
+        recipe_name = line.strip()
+        if recipe_name:
+            yield recipe_name
+
+
+def parse_recipe_tags(text: str) -> list[str]:
+    """Parse tags written by `/export csv` as `#tag` words separated by spaces.
+
+    Args:
+        text (str): tags column of csv.
+
+    Returns:
+        list[str]: unique normalized tags.
+    """
+    tags = dict.fromkeys(normalize_recipe_tag(word) for word in text.split())
+    return [tag for tag in tags if tag][:MAXIMUM_RECIPE_TAGS_COUNT]
+
+
+def parse_recipes_from_csv(lines: Iterable[str]) -> Iterator[tuple[str, list[str]]]:
+    """Lazily parse recipe names from the first column of csv.
+    If csv is written by `/export csv`, its header is skipped and tags are parsed from tags column.
+
+    Args:
+        lines (Iterable[str]): lines of csv file.
+
+    Yields:
+        Iterator[tuple[str, list[str]]]: non empty recipe names with their tags.
+    """
+    rows = (row for row in csv.reader(lines) if row)
+    first_row = next(rows, None)
+    if first_row is None:
+        return
+    if tuple(first_row) == CSV_EXPORT_HEADER:
+        tags_column = CSV_EXPORT_HEADER.index('tags')
+    else:
+        tags_column = None
+        rows = itertools.chain([first_row], rows)
+    for row in rows:
+        for recipe_name in parse_recipe_names(row[:1]):
+            tags = row[tags_column] if tags_column is not None and len(row) > tags_column else ''
+            yield recipe_name, parse_recipe_tags(tags)
+
+
+def is_csv_file_name(file_name: str) -> bool:
+    """Check if file should be parsed as csv.
+
+    Args:
+        file_name (str): name of uploaded file.
+
+    Returns:
+        bool: True if file has csv extension. Otherwise False.
+    """
+    return (file_name or '').lower().endswith('.csv')
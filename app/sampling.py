@@ -0,0 +1,307 @@
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Generic, Hashable, Iterable, Optional, TypeVar
+
+
+Key = TypeVar('Key', bound=Hashable)
+
+
+class FenwickTree:
+    """
+    Binary indexed tree over weights of slots.
+    Weight update, prefix sum and search of slot by prefix sum take O(log n).
+    """
+
+    def __init__(self, weights: Iterable[float] = ()):
+        self._weights: list[float] = list(weights)
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def _build(self) -> None:
+        """Rebuild tree from weights in O(n). Also drops accumulated float errors."""
+        self._tree = [0.0, *self._weights]
+        for index in range(1, len(self._tree)):
+            parent = index + (index & -index)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[index]
+        self._top_bit = 1 << (len(self._weights).bit_length() - 1) if self._weights else 0
+
+    def _add(self, slot: int, delta: float) -> None:
+        index = slot + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, count: int) -> float:
+        """Return sum of weights of first `count` slots.
+
+        Args:
+            count (int): count of slots.
+
+        Returns:
+            float: sum of weights.
+        """
+        total = 0.0
+        while count > 0:
+            total += self._tree[count]
+            count -= count & -count
+        return total
+
+    def get(self, slot: int) -> float:
+        return self._weights[slot]
+
+    def set(self, slot: int, weight: float) -> None:
+        """Set weight of slot.
+
+        Args:
+            slot (int): index of slot.
+            weight (float): non negative weight.
+        """
+        self._add(slot, weight - self._weights[slot])
+        self._weights[slot] = weight
+
+    def append(self, weight: float) -> int:
+        """Add new slot in O(log n).
+
+        Args:
+            weight (float): non negative weight.
+
+        Returns:
+            int: index of new slot.
+        """
+        self._weights.append(weight)
+        index = len(self._weights)
+        # Node of new slot covers weights of slots (index - lowbit(index), index].
+        covered_from = index - (index & -index)
+        self._tree.append(weight + self.prefix_sum(index - 1) - self.prefix_sum(covered_from))
+        if index >= self._top_bit * 2:
+            self._top_bit = index
+        return index - 1
+
+    def find(self, value: float) -> int:
+        """Find first slot whose cumulative weight exceeds value.
+
+        Args:
+            value (float): value in [0, total weight).
+
+        Returns:
+            int: index of slot. Index of the last slot if value is not less than total weight.
+        """
+        index = 0
+        bit = self._top_bit
+        while bit:
+            next_index = index + bit
+            if next_index < len(self._tree) and self._tree[next_index] <= value:
+                index = next_index
+                value -= self._tree[next_index]
+            bit >>= 1
+        return min(index, len(self._weights) - 1)
+
+    def rebuild(self) -> None:
+        self._build()
+
+
+class WeightedSampler(Generic[Key]):
+    """
+    Draws keys with probability proportional to their weights.
+    Keys are added, reweighted and removed in O(log n), draw takes O(log n).
+    Slots of removed keys are reused by new keys.
+    """
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self._rng = rng or random.Random()
+        self._tree = FenwickTree()
+        self._keys: list[Optional[Key]] = []
+        self._slots: dict[Key, int] = {}
+        self._free_slots: list[int] = []
+
+    @classmethod
+    def from_weights(
+        cls,
+        weighted_keys: Iterable[tuple[Key, float]],
+        rng: Optional[random.Random] = None
+    ) -> 'WeightedSampler[Key]':
+        """Build sampler of unique keys in O(n).
+
+        Args:
+            weighted_keys (Iterable[tuple[Key, float]]): keys with their positive weights.
+            rng (Optional[random.Random]): random generator.
+
+        Returns:
+            WeightedSampler[Key]: sampler.
+        """
+        sampler = cls(rng)
+        weights = []
+        for key, weight in weighted_keys:
+            sampler._slots[key] = len(sampler._keys)
+            sampler._keys.append(key)
+            weights.append(weight)
+        sampler._tree = FenwickTree(weights)
+        return sampler
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self._slots
+
+    @property
+    def total_weight(self) -> float:
+        return self._tree.prefix_sum(len(self._tree))
+
+    def put(self, key: Key, weight: float) -> None:
+        """Add key or change its weight.
+
+        Args:
+            key (Key): drawn key.
+            weight (float): positive weight.
+        """
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._tree.set(slot, weight)
+            return
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._tree.set(slot, weight)
+            self._keys[slot] = key
+        else:
+            slot = self._tree.append(weight)
+            self._keys.append(key)
+        self._slots[key] = slot
+
+    def remove(self, key: Key) -> None:
+        """Remove key if it is present.
+
+        Args:
+            key (Key): drawn key.
+        """
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        self._tree.set(slot, 0.0)
+        self._keys[slot] = None
+        self._free_slots.append(slot)
+
+    def draw(self) -> Optional[Key]:
+        """Draw random key. Key is not removed.
+
+        Returns:
+            Optional[Key]: drawn key. None if there is no keys.
+        """
+        if not self._slots:
+            return None
+        slot = self._tree.find(self._rng.random() * self.total_weight)
+        if self._tree.get(slot) <= 0:
+            # Float errors of many updates let draw hit an empty slot.
+            self._tree.rebuild()
+            slot = self._tree.find(self._rng.random() * self.total_weight)
+        key = self._keys[slot]
+        return key if key is not None else next(iter(self._slots))
+
+
+def recency_weight(
+    last_used_at: Optional[datetime],
+    now: datetime,
+    recency_period: float,
+    minimum_weight: float
+) -> float:
+    """Return weight of recipe which grows linearly from `minimum_weight` right after use
+    to 1 after `recency_period`. Recipes which were never used have weight 1.
+
+    Args:
+        last_used_at (Optional[datetime]): time of the last use.
+        now (datetime): current time.
+        recency_period (float): seconds after which recipe isn't considered recent.
+        minimum_weight (float): weight of recipe which was used just now.
+
+    Returns:
+        float: weight in [minimum_weight, 1].
+    """
+    if last_used_at is None or recency_period <= 0:
+        return 1.0
+    share = (now - last_used_at).total_seconds() / recency_period
+    return max(minimum_weight, min(1.0, share))
+
+
+class UserSamplers(Generic[Key]):
+    """
+    In-process LRU storage of samplers of users with TTL.
+    Sampler of user expires `ttl` seconds after it was built, so changes made
+    by other bot processes become visible after that time.
+    Updates of users without sampler are ignored.
+    """
+
+    def __init__(self, max_users: int, ttl: float, timer: Callable[[], float] = time.monotonic):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._timer = timer
+        self._samplers: OrderedDict[int, tuple[float, WeightedSampler[Key]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._samplers)
+
+    def get(self, user_id: int) -> Optional[WeightedSampler[Key]]:
+        """Return alive sampler of user and mark it as recently used.
+
+        Args:
+            user_id (int): id of user in db.
+
+        Returns:
+            Optional[WeightedSampler[Key]]: sampler. None if it isn't built or expired.
+        """
+        sampler_entry = self._samplers.get(user_id)
+        if sampler_entry is None:
+            return None
+        expires_at, sampler = sampler_entry
+        if expires_at <= self._timer():
+            del self._samplers[user_id]
+            return None
+        self._samplers.move_to_end(user_id)
+        return sampler
+
+    def set(self, user_id: int, sampler: WeightedSampler[Key]) -> None:
+        """Store sampler of user, evicting least recently used users.
+
+        Args:
+            user_id (int): id of user in db.
+            sampler (WeightedSampler[Key]): sampler of user.
+        """
+        self._samplers[user_id] = (self._timer() + self.ttl, sampler)
+        self._samplers.move_to_end(user_id)
+        while len(self._samplers) > self.max_users:
+            self._samplers.popitem(last=False)
+
+    def put(self, user_id: int, key: Key, weight: float) -> None:
+        """Add key to sampler of user if it is built.
+
+        Args:
+            user_id (int): id of user in db.
+            key (Key): drawn key.
+            weight (float): positive weight.
+        """
+        sampler_entry = self._samplers.get(user_id)
+        if sampler_entry is not None:
+            sampler_entry[1].put(key, weight)
+
+    def remove(self, user_id: int, key: Key) -> None:
+        """Remove key from sampler of user if it is built.
+
+        Args:
+            user_id (int): id of user in db.
+            key (Key): drawn key.
+        """
+        sampler_entry = self._samplers.get(user_id)
+        if sampler_entry is not None:
+            sampler_entry[1].remove(key)
+
+    def invalidate(self, user_id: int) -> None:
+        """Remove sampler of user.
+
+        Args:
+            user_id (int): id of user in db.
+        """
+        self._samplers.pop(user_id, None)
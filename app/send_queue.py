@@ -0,0 +1,217 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.utils.exceptions import NetworkError, RetryAfter
+
+
+EDIT_MESSAGE_TEXT_METHOD = 'editMessageText'
+
+SendRequest = Callable[[dict], Awaitable]
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Tokens are reserved in advance, so the bucket can go
+    into debt and every caller gets its own delay, which keeps callers in FIFO order.
+    """
+
+    def __init__(self, rate: float, capacity: float, timer: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._timer = timer
+        self._tokens = capacity
+        self._updated_at = timer()
+
+    def _refill(self) -> None:
+        now = self._timer()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def has_token(self) -> bool:
+        """Check if token can be used right now, without waiting."""
+        self._refill()
+        return self._tokens >= 1
+
+    def reserve(self) -> float:
+        """Reserve one token.
+
+        Returns:
+            float: seconds to wait before the token can be used.
+        """
+        self._refill()
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0
+        return -self._tokens / self.rate
+
+
+class _PendingEdit:
+    """Edit of message waiting for rate limiter. Only the latest data is sent."""
+    __slots__ = ('data', 'future')
+
+    def __init__(self, data: dict, future: asyncio.Future):
+        self.data = data
+        self.future = future
+
+
+class SendScheduler:
+    """
+    Schedules outgoing Telegram API requests with per chat and global token buckets.
+    Waiting edits of the same message are coalesced, so only the latest text is sent.
+    Requests failed by flood control or network errors are retried.
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: float,
+        max_retries: int,
+        retry_backoff: float,
+        max_chat_buckets: int = 10000,
+        timer: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable] = asyncio.sleep
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_chat_buckets = max_chat_buckets
+        self.queue_depth = 0
+        self.sent_count = 0
+        self.retried_count = 0
+        self.coalesced_count = 0
+        self._timer = timer
+        self._sleep = sleep
+        self._global_bucket = TokenBucket(global_rate, global_rate, timer)
+        self._chat_buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+        self._pending_edits: dict[tuple, _PendingEdit] = {}
+
+    def _get_chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst, self._timer)
+            self._chat_buckets[chat_id] = bucket
+            if len(self._chat_buckets) > self.max_chat_buckets:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _wait_for_tokens(self, chat_id) -> None:
+        self.queue_depth += 1
+        try:
+            chat_delay = self._get_chat_bucket(chat_id).reserve()
+            if chat_delay:
+                await self._sleep(chat_delay)
+            global_delay = self._global_bucket.reserve()
+            if global_delay:
+                await self._sleep(global_delay)
+        finally:
+            self.queue_depth -= 1
+
+    async def _send_with_retries(self, send: SendRequest, data: dict, retry: bool = True):
+        max_retries = self.max_retries if retry else 0
+        for attempt in range(max_retries + 1):
+            try:
+                result = await send(data)
+            except RetryAfter as error:
+                if attempt == max_retries:
+                    raise
+                delay = error.timeout
+            except NetworkError:
+                if attempt == max_retries:
+                    raise
+                delay = self.retry_backoff * 2 ** attempt
+            else:
+                self.sent_count += 1
+                return result
+            self.retried_count += 1
+            await self._sleep(delay)
+
+    def try_acquire(self, chat_id) -> bool:
+        """Take tokens for request sent outside of scheduler, e.g. inline in webhook reply.
+        Tokens are taken only if they are free right now, so waiting requests are not overtaken.
+
+        Args:
+            chat_id: id of chat of request. Requests without chat are not limited.
+
+        Returns:
+            bool: True if request can be sent now. False if it must be scheduled.
+        """
+        if chat_id is None:
+            return True
+        chat_bucket = self._get_chat_bucket(chat_id)
+        if not (chat_bucket.has_token() and self._global_bucket.has_token()):
+            return False
+        chat_bucket.reserve()
+        self._global_bucket.reserve()
+        self.sent_count += 1
+        return True
+
+    async def schedule(self, method: str, data: Optional[dict], send: SendRequest, retry: bool = True):
+        """Send request when rate limits allow it.
+        Requests without `chat_id` like `getUpdates` or `answerCallbackQuery` are sent immediately.
+
+        Args:
+            method (str): Telegram API method.
+            data (Optional[dict]): request parameters.
+            send (SendRequest): coroutine function sending request with given parameters.
+            retry (bool): whether failed request can be sent again.
+
+        Returns:
+            result of the request.
+        """
+        chat_id = None if data is None else data.get('chat_id')
+        if chat_id is None:
+            return await send(data)
+        if method != EDIT_MESSAGE_TEXT_METHOD or data.get('message_id') is None:
+            await self._wait_for_tokens(chat_id)
+            return await self._send_with_retries(send, data, retry)
+
+        edit_key = (chat_id, data['message_id'])
+        pending_edit = self._pending_edits.get(edit_key)
+        if pending_edit is not None:
+            pending_edit.data = data
+            self.coalesced_count += 1
+            return await asyncio.shield(pending_edit.future)
+        pending_edit = _PendingEdit(data, asyncio.get_running_loop().create_future())
+        self._pending_edits[edit_key] = pending_edit
+        try:
+            await self._wait_for_tokens(chat_id)
+        except BaseException:
+            # Coalesced waiters must not wait for the edit which will never be sent.
+            pending_edit.future.cancel()
+            raise
+        finally:
+            del self._pending_edits[edit_key]
+        try:
+            result = await self._send_with_retries(send, pending_edit.data, retry)
+        except Exception as error:
+            pending_edit.future.set_exception(error)
+            # Mark exception as retrieved when there is no coalesced waiters.
+            pending_edit.future.exception()
+            raise
+        pending_edit.future.set_result(result)
+        return result
+
+
+class ThrottledBot(Bot):
+    """
+    Bot which sends all API requests through `SendScheduler`.
+    """
+
+    def __init__(self, *args, scheduler: SendScheduler, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        send_request = super().request
+
+        async def send(request_data):
+            return await send_request(method, request_data, files, **kwargs)
+        # Uploaded files are streams which can't be read twice.
+        return await self.scheduler.schedule(method, data, send, retry=not files)
@@ -0,0 +1,134 @@
+import asyncio
+from typing import Awaitable
+
+from aiogram.dispatcher.webhook import WebhookRequestHandler
+from aiohttp import web
+from loguru import logger
+
+
+BACKGROUND_UPDATES_KEY = 'BACKGROUND_UPDATES'
+
+
+class BackgroundUpdates:
+    """
+    Tracks updates processed in background after webhook request is answered,
+    so they can be drained on shutdown.
+    """
+
+    def __init__(self, response_timeout: float):
+        self.response_timeout = response_timeout
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def start(self, coroutine: Awaitable) -> asyncio.Task:
+        """Run coroutine in tracked task.
+
+        Args:
+            coroutine (Awaitable): update processing.
+
+        Returns:
+            asyncio.Task: started task.
+        """
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def drain(self, timeout: float) -> int:
+        """Wait for tracked tasks and cancel tasks which are not finished in time.
+
+        Args:
+            timeout (float): seconds to wait.
+
+        Returns:
+            int: count of cancelled tasks.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # Finished updates can start sending of their responses, so wait until nothing is left.
+        while self._tasks and loop.time() < deadline:
+            await asyncio.wait(set(self._tasks), timeout=deadline - loop.time())
+        pending = set(self._tasks)
+        for task in pending:
+            task.cancel()
+        return len(pending)
+
+
+class BackgroundWebhookRequestHandler(WebhookRequestHandler):
+    """
+    Webhook request handler which answers Telegram after `response_timeout` seconds at most.
+    Fast updates are answered with response of handler inline in webhook reply,
+    if rate limiter of bot has free tokens for it. Otherwise and for slow updates
+    response is sent by API request, which waits for rate limiter.
+    """
+
+    def _get_background_updates(self) -> BackgroundUpdates:
+        return self.request.app[BACKGROUND_UPDATES_KEY]
+
+    async def process_update(self, update):
+        dispatcher = self.get_dispatcher()
+        background_updates = self._get_background_updates()
+        task = background_updates.start(dispatcher.updates_handler.notify(update))
+        # Unlike `asyncio.wait_for` it doesn't cancel processing on timeout or disconnection.
+        done, _ = await asyncio.wait({task}, timeout=background_updates.response_timeout)
+        if task in done:
+            return self._limit_inline_response(task.result())
+        task.add_done_callback(self.respond_via_request)
+        return None
+
+    def _limit_inline_response(self, results):
+        # Inline reply isn't an API request of bot, so it takes tokens of `SendScheduler` explicitly.
+        response = self.get_response(results)
+        if response is None:
+            return results
+        bot = self.get_dispatcher().bot
+        scheduler = getattr(bot, 'scheduler', None)
+        if scheduler is None or scheduler.try_acquire(response.get_response().get('chat_id')):
+            return results
+        self._get_background_updates().start(response.execute_response(bot))
+        return None
+
+    def respond_via_request(self, task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            # Error handlers of dispatcher are already notified.
+            logger.opt(exception=error).error('background update processing failed')
+            return
+        response = self.get_response(task.result())
+        if response is not None:
+            dispatcher = self.get_dispatcher()
+            self._get_background_updates().start(response.execute_response(dispatcher.bot))
+
+
+def setup_background_updates(
+    web_app: web.Application,
+    response_timeout: float,
+    drain_timeout: float
+) -> BackgroundUpdates:
+    """Configure web app for `BackgroundWebhookRequestHandler`.
+    Background updates are drained on shutdown, before bot session and FSM storage are closed,
+    so it must be called before webhook executor is set up.
+
+    Args:
+        web_app (web.Application): webhook web app.
+        response_timeout (float): seconds to wait for update before answering webhook request.
+        drain_timeout (float): seconds to wait for background updates on shutdown.
+
+    Returns:
+        BackgroundUpdates: tracker of background updates of web app.
+    """
+    background_updates = BackgroundUpdates(response_timeout)
+    web_app[BACKGROUND_UPDATES_KEY] = background_updates
+
+    async def drain_background_updates(app: web.Application) -> None:
+        logger.info(f'Draining {len(background_updates)} background updates.')
+        cancelled_count = await background_updates.drain(drain_timeout)
+        if cancelled_count:
+            logger.warning(f'Cancelled {cancelled_count} background updates on shutdown.')
+
+    web_app.on_shutdown.append(drain_background_updates)
+    return background_updates
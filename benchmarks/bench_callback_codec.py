@@ -0,0 +1,36 @@
+"""Compare compact callback data codec with extended JSON callback data.
+
+Run from the project root:
+    poetry run python -m benchmarks.bench_callback_codec
+"""
+import timeit
+
+from bson.objectid import ObjectId
+
+from app.callback_data_schema import (RecipeDetailsCallbackData,
+                                      decode_callback_data,
+                                      encode_callback_data)
+
+
+NUMBER_OF_RUNS = 10_000
+
+
+def main():
+    callback_data = RecipeDetailsCallbackData(id=ObjectId())
+    json_callback_data = callback_data.json()
+    compact_callback_data = encode_callback_data(callback_data)
+
+    cases = {
+        'json encode': lambda: callback_data.json(),
+        'compact encode': lambda: encode_callback_data(callback_data),
+        'json decode': lambda: RecipeDetailsCallbackData.parse_raw(json_callback_data),
+        'compact decode': lambda: RecipeDetailsCallbackData.parse_obj(decode_callback_data(compact_callback_data)),
+    }
+    print(f'json size: {len(json_callback_data)} bytes, compact size: {len(compact_callback_data)} bytes')
+    for case_name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=NUMBER_OF_RUNS, repeat=5))
+        print(f'{case_name:>15}: {seconds / NUMBER_OF_RUNS * 1e6:.2f} us per call')
+
+
+if __name__ == '__main__':
+    main()
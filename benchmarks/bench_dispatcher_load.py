@@ -0,0 +1,261 @@
+"""Replay synthetic Telegram updates through the dispatcher and measure throughput.
+
+Updates of simulated users are fed straight into `dp.process_update`. Bot API requests
+go to a local fake Bot API server, recipes are stored in Mongo from MONGO_* variables,
+so run a local mongod first:
+    docker run -d -p 27017:27017 -e MONGO_INITDB_ROOT_USERNAME=bench \\
+        -e MONGO_INITDB_ROOT_PASSWORD=bench mongo:5
+    MONGO_USER=bench MONGO_PASSWORD=bench MONGO_HOST=localhost MONGO_PORT=27017 \\
+        poetry run python -m benchmarks.bench_dispatcher_load --users 50
+
+Recipes of simulated users are removed after the run.
+Every simulated user sends its updates one by one, different users are concurrent.
+Responses returned by handlers are sent by API requests, as webhook does when rate limiter
+has no free tokens for inline reply, so they are measured and counted among Bot API requests.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import time
+from collections import defaultdict
+
+# Telegram and webhook settings are not used, but config requires them.
+# Rate limits of outgoing requests would measure the limiter instead of the bot.
+for _name, _value in {
+    'TG_TOKEN': '123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA',
+    'WEBHOOK_HOST': 'localhost', 'WEBHOOK_PATH': '/', 'WEBHOOK_PORT': '443',
+    'WEBAPP_HOST': 'localhost', 'WEBAPP_PORT': '8443',
+    'MONGO_RECIPE_DB': 'recipes_bot_load_test',
+    'SEND_GLOBAL_RATE': '1000000', 'SEND_CHAT_RATE': '1000000', 'SEND_CHAT_BURST': '1000000',
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from aiogram import Bot, Dispatcher, types  # noqa: E402
+from aiogram.bot.api import TelegramAPIServer  # noqa: E402
+from aiogram.dispatcher.webhook import BaseResponse  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from app import db  # noqa: E402
+from app.callback_data_schema import (DeleteRecipeCallbackData,  # noqa: E402
+                                      RecipeDetailsCallbackData,
+                                      UnuseRecipeCallbackData,
+                                      UseRecipeCallbackData,
+                                      encode_callback_data)
+from app.handlers import dp  # noqa: E402
+from app.metrics import MONGO_ROUND_TRIPS  # noqa: E402
+from loader import bot, io_loop  # noqa: E402
+
+
+# First id of simulated users. Far from real Telegram ids.
+FIRST_USER_ID = 10 ** 12
+
+# Relative frequency of update kinds in the stream.
+UPDATE_KIND_WEIGHTS = {
+    'random': 30,
+    'list': 15,
+    'add': 10,
+    'detail': 20,
+    'use': 10,
+    'unuse': 10,
+    'delete': 5,
+}
+CALLBACK_SCHEMAS = {
+    'detail': RecipeDetailsCallbackData,
+    'use': UseRecipeCallbackData,
+    'unuse': UnuseRecipeCallbackData,
+    'delete': DeleteRecipeCallbackData,
+}
+
+parser = argparse.ArgumentParser(description='Replay synthetic updates through the dispatcher')
+parser.add_argument('-u', '--users', type=int, default=20, help='count of simulated users')
+parser.add_argument('-n', '--updates-per-user', type=int, default=50, help='count of updates of each user')
+parser.add_argument('-r', '--recipes-per-user', type=int, default=30, help='count of recipes of each user')
+parser.add_argument('-s', '--seed', type=int, default=0, help='seed of update stream')
+
+
+class FakeBotAPI:
+    """
+    Local Bot API answering every request successfully.
+    """
+
+    def __init__(self):
+        self.requests_count = 0
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests_count += 1
+        method = request.match_info['method']
+        data = await request.post()
+        result = True
+        if method.startswith('send') or method.startswith('edit'):
+            chat_id = int(data['chat_id'])
+            result = {'message_id': next(self._message_ids), 'date': int(time.time()),
+                      'chat': {'id': chat_id, 'type': 'private'}, 'text': data.get('text', '')}
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self) -> TelegramAPIServer:
+        """Start server on a free local port.
+
+        Returns:
+            TelegramAPIServer: Bot API server endpoint for `Bot.server`.
+        """
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return TelegramAPIServer.from_base(f'http://127.0.0.1:{port}')
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+
+class SimulatedUser:
+    """
+    Generates updates of one user. Remembers ids of its recipes to click on them.
+    """
+
+    def __init__(self, user_id: int, recipe_ids: list, update_ids: itertools.count, rng: random.Random):
+        self.user_id = user_id
+        self.recipe_ids = recipe_ids
+        self._update_ids = update_ids
+        self._rng = rng
+        self._message_ids = itertools.count(1)
+
+    def _message(self, text: str) -> dict:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': self.user_id, 'type': 'private'},
+            'from': {'id': self.user_id, 'is_bot': False, 'first_name': 'Load'},
+            'text': text,
+        }
+
+    def _message_update(self, text: str) -> dict:
+        message = self._message(text)
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': next(self._update_ids), 'message': message}
+
+    def _callback_update(self, kind: str) -> dict:
+        recipe_id = self._rng.choice(self.recipe_ids)
+        if kind == 'delete':
+            self.recipe_ids.remove(recipe_id)
+        callback_data = encode_callback_data(CALLBACK_SCHEMAS[kind](id=recipe_id))
+        return {
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': str(next(self._update_ids)),
+                'from': {'id': self.user_id, 'is_bot': False, 'first_name': 'Load'},
+                'chat_instance': str(self.user_id),
+                'message': self._message('recipe'),
+                'data': callback_data,
+            },
+        }
+
+    def updates(self, count: int):
+        """Generate stream of updates.
+
+        Args:
+            count (int): count of user actions. Adding a recipe takes two updates.
+
+        Yields:
+            tuple[str, dict]: kind of update and update data.
+        """
+        kinds = list(UPDATE_KIND_WEIGHTS)
+        weights = list(UPDATE_KIND_WEIGHTS.values())
+        for action_number in range(count):
+            kind = self._rng.choices(kinds, weights)[0]
+            if kind in CALLBACK_SCHEMAS and not self.recipe_ids:
+                kind = 'add'
+            if kind == 'add':
+                yield 'add', self._message_update('/add')
+                yield 'add_name', self._message_update(f'load recipe {action_number}')
+            elif kind in CALLBACK_SCHEMAS:
+                yield kind, self._callback_update(kind)
+            else:
+                yield kind, self._message_update(f'/{kind}')
+
+
+def _count_mongo_round_trips() -> float:
+    return sum(sample.value for metric in MONGO_ROUND_TRIPS.collect()
+               for sample in metric.samples if sample.name.endswith('_total'))
+
+
+def _percentile(sorted_values: list, quantile: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(quantile * len(sorted_values)))]
+
+
+async def _seed_user(user_id: int, recipes_count: int) -> list:
+    await db.add_recipes_by_names(user_id, (f'recipe {number}' for number in range(recipes_count)))
+    return [recipe.id for recipe in await db.list_user_recipes(user_id)]
+
+
+async def _clean_user(user_id: int) -> None:
+    await db._dispatch_user_id(user_id).delete_many(db._user_filter(user_id))
+    await db._user_stats_collection().delete_one({'_id': user_id})
+    db.recipes_cache.invalidate(user_id)
+
+
+async def _replay(user: SimulatedUser, updates_count: int, latencies: dict) -> None:
+    for kind, update_data in user.updates(updates_count):
+        update = types.Update(**update_data)
+        started_at = time.perf_counter()
+        # Like polling and webhook, every update is processed in its own task, because
+        # state filter caches FSM state of update in context.
+        results = await asyncio.ensure_future(dp.process_update(update))
+        # Webhook answers with the first response of handlers, see `WebhookRequestHandler.get_response`.
+        response = next((result for result in results or () if isinstance(result, BaseResponse)), None)
+        if response is not None:
+            await response.execute_response(bot)
+        latencies[kind].append(time.perf_counter() - started_at)
+
+
+async def run(users_count: int, updates_per_user: int, recipes_per_user: int, seed: int) -> None:
+    fake_bot_api = FakeBotAPI()
+    bot.server = await fake_bot_api.start()
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    rng = random.Random(seed)
+    update_ids = itertools.count(1)
+    user_ids = range(FIRST_USER_ID, FIRST_USER_ID + users_count)
+    await db.ensure_indexes()
+    try:
+        recipe_ids = await asyncio.gather(*(_seed_user(user_id, recipes_per_user) for user_id in user_ids))
+        users = [SimulatedUser(user_id, ids, update_ids, random.Random(rng.random()))
+                 for user_id, ids in zip(user_ids, recipe_ids)]
+        latencies = defaultdict(list)
+        round_trips_before = _count_mongo_round_trips()
+        started_at = time.perf_counter()
+        await asyncio.gather(*(_replay(user, updates_per_user, latencies) for user in users))
+        elapsed = time.perf_counter() - started_at
+        round_trips = _count_mongo_round_trips() - round_trips_before
+    finally:
+        await asyncio.gather(*(_clean_user(user_id) for user_id in user_ids))
+        await fake_bot_api.stop()
+        await (await bot.get_session()).close()
+
+    all_latencies = sorted(itertools.chain.from_iterable(latencies.values()))
+    updates_count = len(all_latencies)
+    print(f'{updates_count} updates of {users_count} users in {elapsed:.2f} s: '
+          f'{updates_count / elapsed:.1f} updates/s, {round_trips / updates_count:.2f} Mongo ops per update, '
+          f'{fake_bot_api.requests_count / updates_count:.2f} Bot API requests per update')
+    print(f'{"kind":>10} {"count":>7} {"p50 ms":>8} {"p99 ms":>8}')
+    for kind, kind_latencies in sorted(latencies.items()) + [('all', all_latencies)]:
+        kind_latencies = sorted(kind_latencies)
+        print(f'{kind:>10} {len(kind_latencies):>7} {_percentile(kind_latencies, 0.5) * 1e3:>8.2f} '
+              f'{_percentile(kind_latencies, 0.99) * 1e3:>8.2f}')
+
+
+def main():
+    args = parser.parse_args()
+    io_loop.run_until_complete(run(args.users, args.updates_per_user, args.recipes_per_user, args.seed))
+
+
+if __name__ == '__main__':
+    main()
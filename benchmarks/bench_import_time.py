@@ -0,0 +1,57 @@
+"""Measure cold import time of application modules.
+
+Every module is imported in a new interpreter, like CLI tools and containers do on start.
+Required settings get dummy values, nothing is connected on import.
+
+Run from the project root:
+    poetry run python -m benchmarks.bench_import_time
+Pass several trees with `--roots` to compare them with the same interpreter, e.g. with a worktree
+of an older commit. Imports of trees alternate, so load of the machine affects them equally.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+MODULES = ['app.data.config', 'app.db', 'loader', 'app.handlers', 'server']
+IMPORT_SCRIPT = 'import time; started_at = time.perf_counter(); import {module}; ' \
+                'print(time.perf_counter() - started_at)'
+DUMMY_ENVIRONMENT = {
+    'TG_TOKEN': '123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA',
+    'WEBHOOK_HOST': 'localhost', 'WEBHOOK_PATH': '/', 'WEBHOOK_PORT': '443',
+    'WEBAPP_HOST': 'localhost', 'WEBAPP_PORT': '8443',
+    'MONGO_USER': 'user', 'MONGO_PASSWORD': 'password', 'MONGO_HOST': 'localhost', 'MONGO_PORT': '27017',
+    'MONGO_RECIPE_DB': 'recipes_bot_import_time',
+    'LOG_FILE': os.devnull,
+}
+
+
+parser = argparse.ArgumentParser(description='Measure cold import time of application modules')
+parser.add_argument('-n', '--runs', type=int, default=15, help='count of imports of each module')
+parser.add_argument('-r', '--roots', type=str, nargs='+', default=['.'], help='project roots to import modules from')
+
+
+def _measure_import(module: str, root: str) -> float:
+    environment = {**DUMMY_ENVIRONMENT, **os.environ}
+    output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT.format(module=module)], cwd=root,
+                            env=environment, capture_output=True, text=True, check=True).stdout
+    return float(output)
+
+
+def main():
+    args = parser.parse_args()
+    print(f'Python {sys.version.split()[0]}, {args.runs} runs')
+    for module in MODULES:
+        seconds = {root: [] for root in args.roots}
+        for _ in range(args.runs):
+            for root in args.roots:
+                seconds[root].append(_measure_import(module, root))
+        for root, root_seconds in seconds.items():
+            print(f'{module:>16} {root}: min {min(root_seconds) * 1e3:.1f} ms, '
+                  f'median {statistics.median(root_seconds) * 1e3:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
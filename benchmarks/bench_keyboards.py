@@ -0,0 +1,59 @@
+"""Measure rendering of recipe keyboards.
+
+Cold runs render buttons of new recipes, warm runs render the same recipes again,
+like repeated list views and detail toggles do.
+
+Run from the project root:
+    poetry run python -m benchmarks.bench_keyboards
+"""
+import json
+import timeit
+
+from bson.objectid import ObjectId
+
+from app.constants import MAXIMUM_COUNT_OF_RETURNED_RECIPES
+from app.keyboards import markups
+from app.keyboards.markups import recipe_details_markup, recipes_list_inline_keyboard_markup
+from app.recipe_shema import RecipeRecord
+
+
+NUMBER_OF_RUNS = 200
+
+
+def _clear_rendering_cache():
+    for cached_function in (getattr(markups, '_recipe_list_button', None),
+                            getattr(markups, '_recipe_details_markup', None)):
+        if cached_function is not None:
+            cached_function.cache_clear()
+
+
+def _cold(render):
+    def run():
+        _clear_rendering_cache()
+        return render()
+    return run
+
+
+def main():
+    recipes = [RecipeRecord(id=ObjectId(), name=f'recipe {number}', is_used=bool(number % 2))
+               for number in range(MAXIMUM_COUNT_OF_RETURNED_RECIPES)]
+
+    def render_list():
+        return json.dumps(recipes_list_inline_keyboard_markup(recipes).to_python())
+
+    def render_details():
+        return [json.dumps(recipe_details_markup(recipe).to_python()) for recipe in recipes]
+
+    cases = {
+        f'list of {len(recipes)} cold': _cold(render_list),
+        f'list of {len(recipes)} warm': render_list,
+        f'{len(recipes)} details cold': _cold(render_details),
+        f'{len(recipes)} details warm': render_details,
+    }
+    for case_name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=NUMBER_OF_RUNS, repeat=5))
+        print(f'{case_name:>20}: {seconds / NUMBER_OF_RUNS * 1e3:.3f} ms per call')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Measure `take_random_recipe` by `sample` and `weighted` draw engines against Mongo.
+
+For every bag size a user is seeded with recipes, then each engine takes `--draws` random recipes,
+so draws include conditional updates and bag resets like in the bot. `sample` engine runs `$sample`
+aggregation on every draw. `weighted` engine scans the bag once to build sampler, the first draw
+is reported separately, and then draws in process. Recipes are stored in Mongo from MONGO_* variables,
+so run a local mongod first:
+    docker run -d -p 27017:27017 -e MONGO_INITDB_ROOT_USERNAME=bench \\
+        -e MONGO_INITDB_ROOT_PASSWORD=bench mongo:5
+    MONGO_USER=bench MONGO_PASSWORD=bench MONGO_HOST=localhost MONGO_PORT=27017 \\
+        poetry run python -m benchmarks.bench_random_draw
+
+Recipes of the simulated user are removed after the run.
+"""
+import argparse
+import os
+import time
+
+# Telegram and webhook settings are not used, but config requires them.
+for _name, _value in {
+    'TG_TOKEN': '123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA',
+    'WEBHOOK_HOST': 'localhost', 'WEBHOOK_PATH': '/', 'WEBHOOK_PORT': '443',
+    'WEBAPP_HOST': 'localhost', 'WEBAPP_PORT': '8443',
+    'MONGO_RECIPE_DB': 'recipes_bot_load_test',
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from app import db  # noqa: E402
+from app.constants import SAMPLE_DRAW_ENGINE, WEIGHTED_DRAW_ENGINE  # noqa: E402
+from app.metrics import MONGO_ROUND_TRIPS  # noqa: E402
+from loader import io_loop  # noqa: E402
+
+
+# Id of simulated user. Far from real Telegram ids.
+USER_ID = 10 ** 12
+
+parser = argparse.ArgumentParser(description='Measure random recipe draws by both engines')
+parser.add_argument('-b', '--bag-sizes', type=int, nargs='+', default=[10, 1000, 10000],
+                    help='counts of recipes of user')
+parser.add_argument('-n', '--draws', type=int, default=200, help='count of draws by each engine')
+
+
+def _count_mongo_round_trips() -> float:
+    return sum(sample.value for metric in MONGO_ROUND_TRIPS.collect()
+               for sample in metric.samples if sample.name.endswith('_total'))
+
+
+def _percentile(sorted_values: list, quantile: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(quantile * len(sorted_values)))]
+
+
+async def _clean_user() -> None:
+    await db._dispatch_user_id(USER_ID).delete_many(db._user_filter(USER_ID))
+    await db._user_stats_collection().delete_one({'_id': USER_ID})
+    db.recipes_cache.invalidate(USER_ID)
+    db.recipe_samplers.invalidate(USER_ID)
+
+
+async def _measure_engine(engine: str, bag_size: int, draws: int) -> None:
+    db.RANDOM_DRAW_ENGINE = engine
+    await db.unuse_all_recipes(USER_ID)
+    db.recipe_samplers.invalidate(USER_ID)
+    latencies = []
+    round_trips_before = _count_mongo_round_trips()
+    for _ in range(draws):
+        started_at = time.perf_counter()
+        await db.take_random_recipe(USER_ID)
+        latencies.append(time.perf_counter() - started_at)
+    round_trips = _count_mongo_round_trips() - round_trips_before
+    first_latency = latencies[0]
+    latencies.sort()
+    print(f'{bag_size:>7} {engine:>9} {first_latency * 1e3:>9.2f} {_percentile(latencies, 0.5) * 1e3:>8.2f} '
+          f'{_percentile(latencies, 0.99) * 1e3:>8.2f} {round_trips / draws:>9.2f}')
+
+
+async def run(bag_sizes: list[int], draws: int) -> None:
+    await db.ensure_indexes()
+    print(f'{"recipes":>7} {"engine":>9} {"first ms":>9} {"p50 ms":>8} {"p99 ms":>8} {"ops/draw":>9}')
+    try:
+        for bag_size in bag_sizes:
+            await _clean_user()
+            await db.add_recipes_by_names(USER_ID, (f'recipe {number}' for number in range(bag_size)))
+            for engine in (SAMPLE_DRAW_ENGINE, WEIGHTED_DRAW_ENGINE):
+                await _measure_engine(engine, bag_size, draws)
+    finally:
+        await _clean_user()
+
+
+def main():
+    args = parser.parse_args()
+    io_loop.run_until_complete(run(args.bag_sizes, args.draws))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,164 @@
 import asyncio
+import atexit
+import copy
+import pathlib
+import sys
+from functools import cached_property
 
 from motor.motor_asyncio import (AsyncIOMotorClient,
                                  AsyncIOMotorDatabase)
-from aiogram import Bot, Dispatcher
+from aiogram import Dispatcher
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.storage import BaseStorage
 from loguru import logger
 
-from app.data.config import TG_TOKEN, MONGO_URI, MONGO_RECIPE_DB_NAME
+from app.constants import (MEMORY_FSM_STORAGE, PER_USER_STORAGE_MODE, REDIS_FSM_STORAGE, SAMPLE_DRAW_ENGINE,
+                           SHARED_STORAGE_MODE, WEIGHTED_DRAW_ENGINE)
+from app.data import config
+from app.log_sampler import ExceptionLogSampler
+from app.log_writer import BackgroundLogWriter
+from app.metrics import MongoCommandMetricsListener, MongoPoolMetricsListener, register_gauge
+from app.middlewares import DeduplicationMiddleware, LoggingMiddleware, MetricsMiddleware
+from app.send_queue import SendScheduler, ThrottledBot
 
 
-def _connect_to_db() -> AsyncIOMotorDatabase:
-    """Connecting to db with recipes.
-
-    Returns:
-        AsyncIOMotorDatabase: Mongo database
+class AppContext:
+    """
+    Application objects built on first access.
+    Importing modules doesn't read required settings, connect to DB or open log file,
+    so tests and tools can import them without production environment.
+    Any object can be injected by assignment before its first use, e.g. `app_context.db_connection = ...`.
     """
-    client = AsyncIOMotorClient(MONGO_URI, io_loop=io_loop)
-    client.get_io_loop = asyncio.get_running_loop
-    db = client[MONGO_RECIPE_DB_NAME]
-    return db
 
+    @cached_property
+    def logger(self):
+        """Loguru logger with file and stderr sinks.
+        Records are formatted and written by background thread if `LOG_ENQUEUE` is set.
+        """
+        # Default sink formats and writes every record to stderr on the event loop.
+        logger.remove()
+        if config.LOG_ENQUEUE:
+            log_writer = BackgroundLogWriter(copy.deepcopy(logger))
+            sink_logger = log_writer.writer_logger
+        else:
+            sink_logger = logger
+        log_file = config.LOG_FILE
+        worker_number = config.WEBHOOK_WORKER_NUMBER
+        if worker_number is not None:
+            log_path = pathlib.Path(log_file)
+            log_file = str(log_path.with_name(f'{log_path.stem}.worker{worker_number}{log_path.suffix}'))
+        # Variables are not rendered in tracebacks, because it is slow and leaks user data to logs.
+        sink_logger.add(log_file, rotation=config.LOG_ROTATION, serialize=config.LOG_SERIALIZE, diagnose=False)
+        sink_logger.add(sys.stderr, level=config.LOG_STDERR_LEVEL, diagnose=False)
+        if config.LOG_ENQUEUE:
+            log_writer.start()
+            atexit.register(log_writer.stop)
+        return logger
+
+    @cached_property
+    def io_loop(self) -> asyncio.AbstractEventLoop:
+        return asyncio.get_event_loop()
+
+    @cached_property
+    def db_connection(self) -> AsyncIOMotorDatabase:
+        """Database with recipes.
+
+        Raises:
+            ValueError: raises if `MONGO_STORAGE_MODE` or `RANDOM_DRAW_ENGINE` is unknown.
+        """
+        if config.MONGO_STORAGE_MODE not in (PER_USER_STORAGE_MODE, SHARED_STORAGE_MODE):
+            raise ValueError(f'Unknown MONGO_STORAGE_MODE {config.MONGO_STORAGE_MODE!r}, '
+                             f'expected {PER_USER_STORAGE_MODE!r} or {SHARED_STORAGE_MODE!r}')
+        if config.RANDOM_DRAW_ENGINE not in (SAMPLE_DRAW_ENGINE, WEIGHTED_DRAW_ENGINE):
+            raise ValueError(f'Unknown RANDOM_DRAW_ENGINE {config.RANDOM_DRAW_ENGINE!r}, '
+                             f'expected {SAMPLE_DRAW_ENGINE!r} or {WEIGHTED_DRAW_ENGINE!r}')
+        options = {
+            'minPoolSize': config.MONGO_MIN_POOL_SIZE,
+            'maxPoolSize': config.MONGO_MAX_POOL_SIZE,
+            'maxIdleTimeMS': config.MONGO_MAX_IDLE_TIME_MS,
+            'waitQueueTimeoutMS': config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            'connectTimeoutMS': config.MONGO_CONNECT_TIMEOUT_MS,
+            'socketTimeoutMS': config.MONGO_SOCKET_TIMEOUT_MS,
+            'serverSelectionTimeoutMS': config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            'compressors': config.MONGO_COMPRESSORS,
+            'w': config.MONGO_WRITE_CONCERN_W,
+            'journal': config.MONGO_JOURNAL,
+        }
+        # Unset options keep driver and server defaults.
+        options = {name: value for name, value in options.items() if value is not None}
+        client = AsyncIOMotorClient(config.MONGO_URI, io_loop=self.io_loop,
+                                    event_listeners=[MongoCommandMetricsListener(), MongoPoolMetricsListener()],
+                                    **options)
+        client.get_io_loop = asyncio.get_running_loop
+        return client[config.MONGO_RECIPE_DB_NAME]
+
+    @cached_property
+    def send_scheduler(self) -> SendScheduler:
+        # Workers don't share rate limiter, so global rate is split between them.
+        # Updates of one chat can be handled by any worker, so chat rate is limited in each worker.
+        send_scheduler = SendScheduler(global_rate=config.SEND_GLOBAL_RATE / config.WEBHOOK_WORKERS,
+                                       chat_rate=config.SEND_CHAT_RATE, chat_burst=config.SEND_CHAT_BURST,
+                                       max_retries=config.SEND_MAX_RETRIES, retry_backoff=config.SEND_RETRY_BACKOFF)
+        register_gauge('bot_send_queue_depth', 'Count of requests waiting for rate limiter',
+                       lambda: send_scheduler.queue_depth)
+        register_gauge('bot_send_requests_sent', 'Count of sent Telegram requests',
+                       lambda: send_scheduler.sent_count)
+        register_gauge('bot_send_requests_retried', 'Count of retried Telegram requests',
+                       lambda: send_scheduler.retried_count)
+        register_gauge('bot_send_edits_coalesced', 'Count of message edits replaced by later ones',
+                       lambda: send_scheduler.coalesced_count)
+        return send_scheduler
+
+    @cached_property
+    def bot(self) -> ThrottledBot:
+        return ThrottledBot(config.TG_TOKEN, loop=self.io_loop, scheduler=self.send_scheduler)
+
+    @cached_property
+    def storage(self) -> BaseStorage:
+        """Storage of finite state machines.
+        Redis storage lets several bot processes serve the same users.
+
+        Raises:
+            ValueError: raises if `FSM_STORAGE` is unknown.
+        """
+        if config.FSM_STORAGE == REDIS_FSM_STORAGE:
+            # Redis driver is optional dependency, so import it only when it is used.
+            from aiogram.contrib.fsm_storage.redis import RedisStorage2
+            return RedisStorage2(host=config.REDIS_HOST, port=config.REDIS_PORT, db=config.REDIS_DB,
+                                 password=config.REDIS_PASSWORD, prefix=config.REDIS_FSM_PREFIX)
+        if config.FSM_STORAGE == MEMORY_FSM_STORAGE:
+            return MemoryStorage()
+        raise ValueError(f'Unknown FSM_STORAGE {config.FSM_STORAGE!r}, '
+                         f'expected {MEMORY_FSM_STORAGE!r} or {REDIS_FSM_STORAGE!r}')
+
+    @cached_property
+    def dp(self) -> Dispatcher:
+        # Handlers log to file, so it is opened with dispatcher.
+        self.logger
+        dp = Dispatcher(self.bot, storage=self.storage)
+        dp.middleware.setup(DeduplicationMiddleware(window=config.UPDATE_DEDUPLICATION_WINDOW,
+                                                    max_size=config.UPDATE_DEDUPLICATION_MAX_SIZE))
+        dp.middleware.setup(MetricsMiddleware())
+        dp.middleware.setup(LoggingMiddleware())
+        return dp
+
+    @cached_property
+    def exception_log_sampler(self) -> ExceptionLogSampler:
+        return ExceptionLogSampler(config.LOG_EXCEPTION_SAMPLE_INTERVAL)
+
+    @cached_property
+    def export_semaphore(self) -> asyncio.Semaphore:
+        """Bounds count of cursors and temporary files of concurrent exports.
+        Should be first accessed on the running loop, as semaphore is bound to loop on creation before Python 3.10.
+        """
+        return asyncio.Semaphore(config.MAXIMUM_CONCURRENT_EXPORTS)
 
-io_loop = asyncio.get_event_loop()
 
-db_connection = _connect_to_db()
+app_context = AppContext()
 
-bot = Bot(TG_TOKEN, loop=io_loop)
-storage = MemoryStorage()
-dp = Dispatcher(bot, storage=storage)
 
-logger.add("logs/recipe_bot.log", rotation="5 MB")
+def __getattr__(name: str):
+    """Let `from loader import bot` build objects of application context on demand."""
+    if isinstance(getattr(AppContext, name, None), cached_property):
+        return getattr(app_context, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,160 @@
+import argparse
+
+from bson.objectid import ObjectId
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReplaceOne
+
+from app import db
+from app.constants import MIGRATION_BATCH_SIZE, SHARED_STORAGE_MODE
+from app.data.config import MONGO_STORAGE_MODE, MONGO_RECIPES_COLLECTION_NAME
+from loader import app_context
+
+
+parser = argparse.ArgumentParser(description='Sync per user recipe collections into the shared one')
+parser.add_argument('-b', '--batch-size', type=int, default=MIGRATION_BATCH_SIZE,
+                    help='count of recipes synced by one bulk write')
+
+
+async def _copy_user_recipes(
+    user_id: int,
+    user_collection: AsyncIOMotorCollection,
+    recipes_collection: AsyncIOMotorCollection,
+    batch_size: int
+) -> int:
+    """Stream recipes of one user into the shared collection replacing copied ones by id,
+    so changes of recipes since the previous run are copied too.
+
+    Args:
+        user_id (int): id of user in db.
+        user_collection (AsyncIOMotorCollection): per user Mongo collection.
+        recipes_collection (AsyncIOMotorCollection): shared Mongo collection.
+        batch_size (int): count of recipes copied by one bulk write.
+
+    Returns:
+        int: count of new and changed recipes.
+    """
+    copied_count = 0
+    requests = []
+    async for document in user_collection.find().batch_size(batch_size):
+        document['user_id'] = user_id
+        requests.append(ReplaceOne({'_id': document['_id']}, document, upsert=True))
+        if len(requests) >= batch_size:
+            result = await recipes_collection.bulk_write(requests, ordered=False)
+            copied_count += result.upserted_count + result.modified_count
+            requests = []
+    if requests:
+        result = await recipes_collection.bulk_write(requests, ordered=False)
+        copied_count += result.upserted_count + result.modified_count
+    return copied_count
+
+
+async def _delete_removed_user_recipes(
+    user_id: int,
+    user_collection: AsyncIOMotorCollection,
+    recipes_collection: AsyncIOMotorCollection,
+    batch_size: int
+) -> int:
+    """Delete copied recipes of one user which are removed from per user collection since the previous run.
+    Ids are compared by batches, so memory usage doesn't depend on count of recipes.
+
+    Args:
+        user_id (int): id of user in db.
+        user_collection (AsyncIOMotorCollection): per user Mongo collection.
+        recipes_collection (AsyncIOMotorCollection): shared Mongo collection.
+        batch_size (int): count of recipes compared by one round trip.
+
+    Returns:
+        int: count of deleted recipes.
+    """
+    deleted_count = 0
+    copied_documents = recipes_collection.find(filter={'user_id': user_id}, projection={'_id': True})
+    copied_documents = copied_documents.sort('_id').batch_size(batch_size)
+    copied_ids = []
+    async for document in copied_documents:
+        copied_ids.append(document['_id'])
+        if len(copied_ids) < batch_size:
+            continue
+        deleted_count += await _delete_missing_recipes(user_id, copied_ids, user_collection, recipes_collection)
+        copied_ids = []
+    if copied_ids:
+        deleted_count += await _delete_missing_recipes(user_id, copied_ids, user_collection, recipes_collection)
+    return deleted_count
+
+
+async def _delete_missing_recipes(
+    user_id: int,
+    copied_ids: list[ObjectId],
+    user_collection: AsyncIOMotorCollection,
+    recipes_collection: AsyncIOMotorCollection
+) -> int:
+    """Delete copied recipes of user which are missing in per user collection.
+
+    Args:
+        user_id (int): id of user in db.
+        copied_ids (list[ObjectId]): ids of copied recipes.
+        user_collection (AsyncIOMotorCollection): per user Mongo collection.
+        recipes_collection (AsyncIOMotorCollection): shared Mongo collection.
+
+    Returns:
+        int: count of deleted recipes.
+    """
+    existing_documents = user_collection.find(filter={'_id': {'$in': copied_ids}}, projection={'_id': True})
+    existing_ids = {document['_id'] async for document in existing_documents}
+    missing_ids = [recipe_id for recipe_id in copied_ids if recipe_id not in existing_ids]
+    if not missing_ids:
+        return 0
+    result = await recipes_collection.delete_many({'user_id': user_id, '_id': {'$in': missing_ids}})
+    return result.deleted_count
+
+
+async def sync_user_collection(
+    user_collection: AsyncIOMotorCollection,
+    recipes_collection: AsyncIOMotorCollection,
+    batch_size: int
+) -> tuple[int, int]:
+    """Make recipes of one user in the shared collection equal to recipes of per user collection.
+    Per user collection is the source of truth, so it must be run before the switch to `shared` mode.
+    It is safe to run it again while the bot is working in `per_user` mode.
+
+    Args:
+        user_collection (AsyncIOMotorCollection): per user Mongo collection.
+        recipes_collection (AsyncIOMotorCollection): shared Mongo collection.
+        batch_size (int): count of recipes synced by one bulk write.
+
+    Returns:
+        tuple[int, int]: counts of copied and deleted recipes.
+    """
+    user_id = int(user_collection.name)
+    copied_count = await _copy_user_recipes(user_id, user_collection, recipes_collection, batch_size)
+    deleted_count = await _delete_removed_user_recipes(user_id, user_collection, recipes_collection, batch_size)
+    return copied_count, deleted_count
+
+
+async def migrate_to_shared_collection(batch_size: int) -> None:
+    """Sync all per user collections into the shared recipes collection.
+
+    Args:
+        batch_size (int): count of recipes synced by one bulk write.
+
+    Raises:
+        RuntimeError: raises in `shared` mode, because per user collections are stale then.
+    """
+    if MONGO_STORAGE_MODE == SHARED_STORAGE_MODE:
+        raise RuntimeError('Migration must be run before switching to shared storage mode. '
+                           'Per user collections are stale in shared mode and would overwrite newer recipes.')
+    db_connection = app_context.db_connection
+    recipes_collection = db_connection[MONGO_RECIPES_COLLECTION_NAME]
+    await db.create_shared_collection_indexes()
+    for collection_name in await db_connection.list_collection_names():
+        # Per user collections are named by telegram chat id, which can be negative.
+        if not collection_name.lstrip('-').isdigit():
+            continue
+        copied_count, deleted_count = await sync_user_collection(db_connection[collection_name],
+                                                                 recipes_collection, batch_size)
+        app_context.logger.info(f"synced user {collection_name}: "
+                                f"copied {copied_count}, deleted {deleted_count} recipes")
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    app_context.io_loop.run_until_complete(migrate_to_shared_collection(args.batch_size))
@@ -1,41 +1,137 @@
+import io
+import os
 import ssl
+import signal
+import asyncio
 import argparse
+import pathlib
+import multiprocessing
+from typing import Optional
 
 from aiogram import executor
+from aiogram.types import InputFile
+from aiohttp import web
+from prometheus_client import start_http_server
 
+from app.constants import REDIS_FSM_STORAGE
 from app.data.config import (WEBAPP_HOST, WEBAPP_PORT,
                              WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SSL_CERT,
-                             WEBHOOK_SSL_PRIV)
+                             WEBHOOK_SSL_PRIV, FSM_STORAGE, METRICS_HOST, METRICS_PORT,
+                             WEBHOOK_RESPONSE_TIMEOUT, WEBHOOK_DRAIN_TIMEOUT, WEBHOOK_WARM_UP_CONNECTIONS,
+                             SKIP_UPDATES)
+from app.metrics import register_gauge
+from app.webhook import BackgroundWebhookRequestHandler, setup_background_updates
 from loader import bot, logger
+from app import db
 from app.handlers import dp
 
 
 parser = argparse.ArgumentParser(description='Start bot via polling or webhook')
 parser.add_argument('-e', '--executor-type', type=str,
                     help='`polling` or `webhook`')
+parser.add_argument('-w', '--workers', type=int, default=1,
+                    help='count of webhook worker processes sharing the port')
+
+
+def start_metrics_server(port: Optional[int]):
+    """Serve metrics of this process by http server on METRICS_HOST, apart from the public webhook port.
+
+    Args:
+        port (Optional[int]): port of metrics server. Metrics are not served if it is None.
+    """
+    if port is not None:
+        start_http_server(port, addr=METRICS_HOST)
+        logger.info(f"Metrics are served on {METRICS_HOST}:{port}.")
 
 
 def start_polling():
     logger.info("Bot starts with polling.")
-    executor.start_polling(dp, skip_updates=True)
+    start_metrics_server(METRICS_PORT)
+    executor.start_polling(dp, skip_updates=SKIP_UPDATES, on_startup=on_startup)
 
 
-def start_webhook():
+def start_webhook(skip_updates: bool = SKIP_UPDATES, reuse_port: bool = False,
+                  metrics_port: Optional[int] = METRICS_PORT):
+    """Start webhook server.
+    Updates are answered after WEBHOOK_RESPONSE_TIMEOUT at most and the rest is processed in background.
+    On SIGTERM server stops accepting updates and drains background ones.
+
+    Args:
+        skip_updates (bool): skip updates received while bot was stopped.
+        reuse_port (bool): let several processes listen the same port.
+        metrics_port (Optional[int]): port of metrics server of this process.
+    """
     context = ssl.SSLContext(ssl.PROTOCOL_TLSv1_2)
     context.load_cert_chain(WEBHOOK_SSL_CERT, WEBHOOK_SSL_PRIV)
     logger.info("Bot starts with webhook.")
-    executor.start_webhook(dispatcher=dp, webhook_path=WEBHOOK_PATH, on_startup=on_webhook_startup,
-                           skip_updates=True, host=WEBAPP_HOST, port=WEBAPP_PORT, ssl_context=context)
+    start_metrics_server(metrics_port)
+    web_app = web.Application()
+    # Must be set up before executor, which closes bot session and storage on shutdown.
+    background_updates = setup_background_updates(web_app, response_timeout=WEBHOOK_RESPONSE_TIMEOUT,
+                                                  drain_timeout=WEBHOOK_DRAIN_TIMEOUT)
+    register_gauge('bot_webhook_background_updates', 'Count of updates processed after webhook response',
+                   lambda: len(background_updates))
+    webhook_executor = executor.Executor(dp, skip_updates=skip_updates)
+    webhook_executor.on_startup(on_webhook_startup, polling=False)
+    webhook_executor.set_webhook(WEBHOOK_PATH, request_handler=BackgroundWebhookRequestHandler, web_app=web_app)
+    webhook_executor.run_app(host=WEBAPP_HOST, port=WEBAPP_PORT, ssl_context=context, reuse_port=reuse_port)
+
+
+def start_webhook_workers(workers: int):
+    """Start webhook in several processes listening the same port.
+    Workers must share FSM storage, see `FSM_STORAGE` config.
+    Metrics of worker N are served on `METRICS_PORT` + N, its logs are written to its own file.
+    Each worker sends at most `SEND_GLOBAL_RATE` / `workers` requests per second.
+
+    Args:
+        workers (int): count of worker processes.
+    """
+    if FSM_STORAGE != REDIS_FSM_STORAGE:
+        logger.warning("Webhook workers don't share FSM state with memory storage.")
+    # Spawned workers create their own event loop and connections on import.
+    spawn_context = multiprocessing.get_context('spawn')
+    processes = []
+    for worker_number in range(workers):
+        # Pending updates are skipped only once, otherwise workers reset webhook of each other.
+        metrics_port = None if METRICS_PORT is None else METRICS_PORT + worker_number
+        process = spawn_context.Process(target=start_webhook,
+                                        kwargs=dict(skip_updates=SKIP_UPDATES and worker_number == 0,
+                                                    reuse_port=True, metrics_port=metrics_port))
+        # Spawned worker reads config on import, before its target is called.
+        os.environ['WEBHOOK_WORKER_NUMBER'] = str(worker_number)
+        os.environ['WEBHOOK_WORKERS'] = str(workers)
+        process.start()
+        processes.append(process)
+    del os.environ['WEBHOOK_WORKER_NUMBER']
+    del os.environ['WEBHOOK_WORKERS']
+
+    def stop_workers(signal_number, frame):
+        # Container runtime signals only the main process, workers drain their updates themselves.
+        for process in processes:
+            process.terminate()
+    signal.signal(signal.SIGTERM, stop_workers)
+    for process in processes:
+        process.join()
+
+
+async def on_startup(dispatcher):
+    await db.ensure_indexes()
 
 
-async def on_webhook_startup(app):
+async def on_webhook_startup(dispatcher):
+    # Web app starts accepting updates after startup callbacks.
+    await db.warm_up_connections(WEBHOOK_WARM_UP_CONNECTIONS)
+    await db.ensure_indexes()
     webhook = await bot.get_webhook_info()
 
     if webhook.url != WEBHOOK_URL:
         if not webhook.url:
             await bot.delete_webhook()
 
-        await bot.set_webhook(WEBHOOK_URL, certificate=open(WEBHOOK_SSL_CERT, 'rb'))
+        certificate_path = pathlib.Path(WEBHOOK_SSL_CERT)
+        certificate = await asyncio.get_running_loop().run_in_executor(None, certificate_path.read_bytes)
+        await bot.set_webhook(WEBHOOK_URL, certificate=InputFile(io.BytesIO(certificate),
+                                                                 filename=certificate_path.name))
 
 
 if __name__ == '__main__':
@@ -43,6 +139,8 @@ if __name__ == '__main__':
     executor_type = args.executor_type
     if executor_type == 'polling':
         start_polling()
+    elif executor_type == 'webhook' and args.workers > 1:
+        start_webhook_workers(args.workers)
     elif executor_type == 'webhook':
         start_webhook()
     else:
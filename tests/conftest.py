@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+
+class FakeTimer:
+    """Timer and sleep which advance virtual time instead of waiting."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def timer():
+    return FakeTimer()
@@ -0,0 +1,70 @@
+import asyncio
+import fnmatch
+from typing import Optional
+
+
+class FakeRedisServer:
+    """
+    In-memory TCP server speaking the subset of Redis protocol used by aiogram Redis storage:
+    GET, SET, DEL, KEYS and FLUSHDB. Expiration of keys is ignored.
+    Any Redis client can connect to it, so several storages can share it like bot processes share Redis.
+    """
+
+    def __init__(self):
+        self.values: dict[bytes, bytes] = {}
+        self.port: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve_client, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while (command := await self._read_command(reader)) is not None:
+                writer.write(self._execute(command))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[list[bytes]]:
+        header = await reader.readline()
+        if not header:
+            return None
+        # Commands are arrays of bulk strings: `*<count>\r\n` and `$<length>\r\n<bytes>\r\n` for each argument.
+        arguments = []
+        for _ in range(int(header[1:])):
+            length = int((await reader.readline())[1:])
+            arguments.append((await reader.readexactly(length + 2))[:-2])
+        return arguments
+
+    def _execute(self, command: list[bytes]) -> bytes:
+        name, arguments = command[0].upper(), command[1:]
+        if name == b'PING':
+            return b'+PONG\r\n'
+        if name in (b'SELECT', b'AUTH', b'CLIENT'):
+            return b'+OK\r\n'
+        if name == b'GET':
+            value = self.values.get(arguments[0])
+            return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+        if name == b'SET':
+            self.values[arguments[0]] = arguments[1]
+            return b'+OK\r\n'
+        if name == b'DEL':
+            deleted_count = sum(self.values.pop(key, None) is not None for key in arguments)
+            return b':%d\r\n' % deleted_count
+        if name == b'KEYS':
+            pattern = arguments[0].decode()
+            keys = [key for key in self.values if fnmatch.fnmatchcase(key.decode(), pattern)]
+            return b'*%d\r\n' % len(keys) + b''.join(b'$%d\r\n%s\r\n' % (len(key), key) for key in keys)
+        if name == b'FLUSHDB':
+            self.values.clear()
+            return b'+OK\r\n'
+        return b'-ERR unknown command\r\n'
@@ -0,0 +1,95 @@
+import pytest
+from bson.objectid import ObjectId
+
+from app.cache import RecipesCache
+from app.recipe_shema import RecipeRecord
+
+
+@pytest.fixture
+def cache(timer):
+    return RecipesCache(max_users=2, max_recipes_per_user=2, ttl=10, timer=timer)
+
+
+def make_recipe(name, is_used=False, tags=()):
+    return RecipeRecord(id=ObjectId(), name=name, is_used=is_used, tags=tags)
+
+
+def test_get_recipe_counts_hits_and_misses(cache):
+    recipe = make_recipe('soup')
+    assert cache.get_recipe(1, recipe.id) is None
+    cache.put_recipe(1, recipe)
+    assert cache.get_recipe(1, recipe.id) == recipe
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entry_expires(cache, timer):
+    recipe = make_recipe('soup')
+    cache.put_recipe(1, recipe)
+    assert cache.has_recipes(1) is True
+    timer.now = 10
+    assert cache.has_recipes(1) is False
+    assert cache.get_recipe(1, recipe.id) is None
+
+
+def test_writes_of_other_recipes_dont_prolong_recipe(cache, timer):
+    old_recipe = make_recipe('soup')
+    cache.put_recipe(1, old_recipe)
+    timer.now = 6
+    new_recipe = make_recipe('salad')
+    cache.put_recipe(1, new_recipe)
+    cache.update_recipe(1, old_recipe.id, {'is_used': True})
+    timer.now = 12
+    assert cache.get_recipe(1, old_recipe.id) is None
+    assert cache.get_recipe(1, new_recipe.id) == new_recipe
+    timer.now = 16
+    assert cache.has_recipes(1) is False
+
+
+def test_least_recently_used_user_is_evicted(cache):
+    recipes = [make_recipe(str(user_id)) for user_id in range(3)]
+    cache.put_recipe(0, recipes[0])
+    cache.put_recipe(1, recipes[1])
+    cache.get_recipe(0, recipes[0].id)
+    cache.put_recipe(2, recipes[2])
+    assert len(cache) == 2
+    assert cache.get_recipe(1, recipes[1].id) is None
+    assert cache.get_recipe(0, recipes[0].id) == recipes[0]
+
+
+def test_recipes_of_user_are_bounded(cache):
+    recipes = [make_recipe(str(number)) for number in range(3)]
+    cache.put_recipes(1, recipes)
+    assert cache.get_recipe(1, recipes[0].id) is None
+    assert cache.get_recipe(1, recipes[2].id) == recipes[2]
+
+
+def test_writes_update_cached_recipes(cache):
+    used_recipe = make_recipe('soup', is_used=True)
+    unused_recipe = make_recipe('salad', is_used=True, tags=('quick',))
+    cache.put_recipes(1, [used_recipe, unused_recipe])
+
+    cache.mark_all_unused(1, 'quick')
+    assert cache.get_recipe(1, used_recipe.id).is_used is True
+    assert cache.get_recipe(1, unused_recipe.id).is_used is False
+
+    cache.mark_all_unused(1)
+    assert cache.get_recipe(1, used_recipe.id).is_used is False
+
+    cache.update_recipe(1, unused_recipe.id, {'is_used': True})
+    assert cache.get_recipe(1, unused_recipe.id).is_used is True
+
+    cache.remove_recipe(1, unused_recipe.id)
+    assert cache.get_recipe(1, unused_recipe.id) is None
+
+    cache.invalidate(1)
+    assert cache.has_recipes(1) is False
+
+
+def test_put_missing_recipes_keeps_cached_recipes(cache):
+    written_recipe = make_recipe('soup', is_used=True)
+    cache.put_recipe(1, written_recipe)
+
+    new_recipe = make_recipe('salad')
+    cache.put_missing_recipes(1, [written_recipe._replace(is_used=False), new_recipe])
+    assert cache.get_recipe(1, written_recipe.id).is_used is True
+    assert cache.get_recipe(1, new_recipe.id) == new_recipe
@@ -1,26 +1,44 @@
-from aiogram.types.callback_query import CallbackQuery
 from bson.objectid import ObjectId
 
 from app.callback_data_schema import (DeleteRecipeCallbackData,
+                                      NextSearchPageCallbackData,
+                                      PreviousSearchPageCallbackData,
                                       RecipeDetailsCallbackData,
                                       UnuseRecipeCallbackData,
                                       UseRecipeCallbackData)
-from app.callback_data_schema import is_valid_schema_for_callback
+from app.callback_data_schema import decode_callback_data, encode_callback_data
 
 
 test_schema_classes = [
     DeleteRecipeCallbackData,
     RecipeDetailsCallbackData,
     UnuseRecipeCallbackData,
-    UseRecipeCallbackData
+    UseRecipeCallbackData,
+    NextSearchPageCallbackData,
+    PreviousSearchPageCallbackData
     ]
 
 
-def test_is_valid_schema_for_callback():
+def test_compact_callback_data_round_trip():
     random_object_id = ObjectId('666f6f2d6261722d71757578')
     id_data = {'id': random_object_id}
     for test_class in test_schema_classes:
         callback_data = test_class(**id_data)
-        json_callback_data = callback_data.json()
-        callback_query = CallbackQuery(data=json_callback_data)
-        assert is_valid_schema_for_callback(callback_query, test_class) is True
+        compact_callback_data = encode_callback_data(callback_data)
+        assert len(compact_callback_data) == 19
+        assert decode_callback_data(compact_callback_data) == callback_data.dict()
+        assert test_class.parse_obj(decode_callback_data(compact_callback_data)) == callback_data
+
+
+def test_decode_legacy_json_callback_data():
+    random_object_id = ObjectId('666f6f2d6261722d71757578')
+    callback_data = RecipeDetailsCallbackData(id=random_object_id)
+    assert decode_callback_data(callback_data.json()) == callback_data.dict()
+
+
+def test_decode_malformed_callback_data():
+    assert decode_callback_data(None) is None
+    assert decode_callback_data('') is None
+    assert decode_callback_data('not base64!') is None
+    assert decode_callback_data('AQE') is None
+    assert decode_callback_data('{"action": ') is None
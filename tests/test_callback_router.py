@@ -0,0 +1,43 @@
+from aiogram.types.callback_query import CallbackQuery
+from bson.objectid import ObjectId
+
+from app.callback_data_schema import (DeleteRecipeCallbackData,
+                                      RecipeDetailsCallbackData,
+                                      UseRecipeCallbackData)
+from app.callback_router import CallbackRouter
+
+
+async def test_callback_router_dispatch():
+    router = CallbackRouter()
+    handled = []
+
+    @router.handler(RecipeDetailsCallbackData)
+    async def details_handler(callback_query, callback_data):
+        handled.append(('detail', callback_data))
+
+    @router.handler(UseRecipeCallbackData)
+    async def use_handler(callback_query, callback_data):
+        handled.append(('use', callback_data))
+
+    random_object_id = ObjectId('666f6f2d6261722d71757578')
+    callback_data = UseRecipeCallbackData(id=random_object_id)
+    await router.dispatch(CallbackQuery(data=callback_data.json()))
+    assert handled == [('use', callback_data)]
+
+    # There is no handler for delete action.
+    delete_callback_data = DeleteRecipeCallbackData(id=random_object_id)
+    await router.dispatch(CallbackQuery(data=delete_callback_data.json()))
+    assert len(handled) == 1
+
+
+def test_callback_router_parse_malformed_data():
+    router = CallbackRouter()
+
+    @router.handler(RecipeDetailsCallbackData)
+    async def details_handler(callback_query, callback_data):
+        pass
+
+    assert router.parse('not a json') is None
+    assert router.parse('[]') is None
+    assert router.parse('{"action": "detail"}') is None
+    assert router.parse('{"action": "detail", "id": {"$oid": "bad"}}') is None
@@ -1,5 +1,9 @@
 import pytest
 
+from app.constants import MAXIMUM_RANDOM_DRAW_ATTEMPTS, SHARED_STORAGE_MODE, WEIGHTED_DRAW_ENGINE
+from app.exceptions import RandomRecipeDrawError, UserHasNoRecipesError, UserHasNoSelectedRecipeError
+from app.metrics import MONGO_ROUND_TRIPS
+
 
 @pytest.fixture
 def user_id():
@@ -17,7 +21,12 @@ def db():
     return db
 
 
-async def test_db_func(db, user_id, recipe_name):
+def count_round_trips(operation):
+    return sum(sample.value for metric in MONGO_ROUND_TRIPS.collect() for sample in metric.samples
+               if sample.name.endswith('_total') and sample.labels['operation'] == operation)
+
+
+async def test_db_func(db, user_id, recipe_name, monkeypatch):
     """
     So far, a temporary unified test function.
     The only one because pytest and my db code are difficult
@@ -48,9 +57,23 @@ async def test_db_func(db, user_id, recipe_name):
     finded_recipe = await db.find_recipe_by_id(user_id, recipe.id)
     assert finded_recipe == recipe
 
+    # test_get_user_stats
+    user_stats = await db.get_user_stats(user_id)
+    assert (user_stats.total, user_stats.used) == (1, 0)
+
     # test_take_recipe_by_id
+    # Recipe update and counters update, they are in different collections.
+    round_trips = count_round_trips('take_recipe_by_id')
     taken_recipe = await db.take_recipe_by_id(user_id, recipe.id)
     assert taken_recipe.is_used is True
+    assert count_round_trips('take_recipe_by_id') == round_trips + 2
+    user_stats = await db.get_user_stats(user_id)
+    assert (user_stats.total, user_stats.used) == (1, 1)
+    assert await db.does_user_have_used_recipes(user_id) is True
+    # Counters are not changed if recipe is already used.
+    round_trips = count_round_trips('take_recipe_by_id')
+    await db.take_recipe_by_id(user_id, recipe.id)
+    assert count_round_trips('take_recipe_by_id') == round_trips + 1
     finded_recipe = await db.find_recipe_by_id(user_id, recipe.id)
     assert finded_recipe.is_used is True
 
@@ -59,10 +82,30 @@ async def test_db_func(db, user_id, recipe_name):
     finded_recipe = await db.find_recipe_by_id(user_id, recipe.id)
     assert finded_recipe.is_used is False
 
+    # test_unuse_and_find_recipe_by_id
+    await db.take_recipe_by_id(user_id, recipe.id)
+    round_trips = count_round_trips('unuse_and_find_recipe_by_id')
+    unused_recipe = await db.unuse_and_find_recipe_by_id(user_id, recipe.id)
+    assert unused_recipe == recipe
+    assert count_round_trips('unuse_and_find_recipe_by_id') == round_trips + 2
+
     # test_take_random_recipe
     recipe_name2 = recipe_name + '2'
     await db.add_recipe_by_name(user_id, recipe_name2)
 
+    # test_list_user_recipes_page
+    first_page = await db.list_user_recipes_page(user_id, count=1)
+    assert [cur_recipe.name for cur_recipe in first_page.recipes] == [recipe_name]
+    assert first_page.has_previous is False
+    assert first_page.has_next is True
+    second_page = await db.list_user_recipes_page(user_id, after=first_page.recipes[-1].id, count=1)
+    assert [cur_recipe.name for cur_recipe in second_page.recipes] == [recipe_name2]
+    assert second_page.has_previous is True
+    assert second_page.has_next is False
+    previous_page = await db.list_user_recipes_page(user_id, before=second_page.recipes[0].id, count=1)
+    assert previous_page.recipes == first_page.recipes
+    assert previous_page.has_previous is False
+
     random_recipe1 = await db.take_random_recipe(user_id)
     assert random_recipe1.is_used is True
     recipes_with_one_used = await db.list_user_recipes(user_id)
@@ -76,11 +119,34 @@ async def test_db_func(db, user_id, recipe_name):
     assert number_of_used == 2
 
     # test_unuse_all_recipes
+    user_stats = await db.get_user_stats(user_id)
+    assert (user_stats.total, user_stats.used) == (2, 2)
+    round_trips = count_round_trips('unuse_all_recipes')
     await db.unuse_all_recipes(user_id)
+    assert count_round_trips('unuse_all_recipes') == round_trips + 2
+    round_trips = count_round_trips('unuse_all_recipes')
+    await db.unuse_all_recipes(user_id)
+    assert count_round_trips('unuse_all_recipes') == round_trips + 1
+    user_stats = await db.get_user_stats(user_id)
+    assert (user_stats.total, user_stats.used) == (2, 0)
     not_used_recipes = await db.list_user_recipes(user_id)
     number_of_used = sum(cur_recipe.is_used for cur_recipe in not_used_recipes)
     assert number_of_used == 0
 
+    # test_take_random_recipes
+    random_recipes = await db.take_random_recipes(user_id, 3)
+    assert sorted(cur_recipe.name for cur_recipe in random_recipes) == [recipe_name, recipe_name2]
+    assert all(cur_recipe.is_used for cur_recipe in random_recipes)
+    assert (await db.get_user_stats(user_id)).used == 2
+    random_recipes = await db.take_random_recipes(user_id, 1)
+    assert len(random_recipes) == 1
+    assert (await db.get_user_stats(user_id)).used == 1
+    # One unused recipe is left, so the second one is taken after the bag reset.
+    random_recipes = await db.take_random_recipes(user_id, 2)
+    assert sorted(cur_recipe.name for cur_recipe in random_recipes) == [recipe_name, recipe_name2]
+    assert (await db.get_user_stats(user_id)).used == 2
+    await db.unuse_all_recipes(user_id)
+
     # test_remove_recipe_by_id
     random_recipe = await db.take_random_recipe(user_id)
     await db.remove_recipe_by_id(user_id, random_recipe.id)
@@ -91,3 +157,206 @@ async def test_db_func(db, user_id, recipe_name):
     await db.remove_recipe_by_id(user_id, random_recipe.id)
     user_recipes = await db.list_user_recipes(user_id)
     assert len(user_recipes) == 0
+    assert await db.does_user_have_recipes(user_id) is False
+    user_stats = await db.get_user_stats(user_id)
+    assert (user_stats.total, user_stats.used) == (0, 0)
+
+    # test_state_transition_of_removed_recipe
+    round_trips = count_round_trips('take_recipe_by_id')
+    with pytest.raises(UserHasNoSelectedRecipeError):
+        await db.take_recipe_by_id(user_id, random_recipe.id)
+    assert count_round_trips('take_recipe_by_id') == round_trips + 1
+    with pytest.raises(UserHasNoSelectedRecipeError):
+        await db.unuse_and_find_recipe_by_id(user_id, random_recipe.id)
+
+    # test_add_recipes_by_names
+    added_count = await db.add_recipes_by_names(user_id, [recipe_name, recipe_name2, recipe_name])
+    assert added_count == 2
+    added_count = await db.add_recipes_by_names(user_id, [recipe_name2])
+    assert added_count == 0
+    user_recipes = await db.list_user_recipes(user_id)
+    assert sorted(cur_recipe.name for cur_recipe in user_recipes) == [recipe_name, recipe_name2]
+    user_stats = await db.get_user_stats(user_id)
+    assert user_stats.total == 2
+
+    # test_search_recipes
+    first_found_page = await db.search_recipes(user_id, ' test_recipe', count=1)
+    assert [cur_recipe.name for cur_recipe in first_found_page.recipes] == [recipe_name]
+    assert first_found_page.has_next is True
+    second_found_page = await db.search_recipes(user_id, 'Test_Recipe', after=first_found_page.recipes[-1].id,
+                                                count=1)
+    assert [cur_recipe.name for cur_recipe in second_found_page.recipes] == [recipe_name2]
+    assert second_found_page.has_next is False
+    previous_found_page = await db.search_recipes(user_id, 'test_recipe', before=second_found_page.recipes[0].id,
+                                                  count=1)
+    assert previous_found_page.recipes == first_found_page.recipes
+    assert previous_found_page.has_previous is False
+    assert (await db.search_recipes(user_id, 'test_recipe_name2')).recipes == second_found_page.recipes
+    assert (await db.search_recipes(user_id, 'other')).recipes == []
+
+    # test_take_random_recipe_with_tag
+    await db.add_recipe_by_name(user_id, 'TAGGED_RECIPE', ['quick'])
+    tagged_recipe = await db.take_random_recipe(user_id, 'quick')
+    assert tagged_recipe.name == 'TAGGED_RECIPE'
+    # Only recipes with tag are reset, other recipes stay unused.
+    assert (await db.take_random_recipe(user_id, 'quick')).id == tagged_recipe.id
+    assert (await db.get_user_stats(user_id)).used == 1
+    assert [cur_recipe.name for cur_recipe in await db.take_random_recipes(user_id, 2, 'quick')] == ['TAGGED_RECIPE']
+    with pytest.raises(UserHasNoRecipesError):
+        await db.take_random_recipe(user_id, 'unknown')
+    await db.remove_recipe_by_id(user_id, tagged_recipe.id)
+    assert (await db.get_user_stats(user_id)).used == 0
+
+    # test_take_random_recipe_after_bag_reset
+    await db.take_random_recipes(user_id, 2)
+    random_recipe = await db.take_random_recipe(user_id)
+    assert random_recipe.is_used is True
+    assert (await db.get_user_stats(user_id)).used == 1
+    await db.unuse_all_recipes(user_id)
+
+    # test_take_random_recipe_lost_to_concurrent_draws
+    taken_recipe = await db.take_recipe_by_id(user_id, user_recipes[0].id)
+    drawn_ids = iter([taken_recipe.id, user_recipes[1].id])
+
+    async def draw_recipe_id(user_id, tag=None):
+        return next(drawn_ids, taken_recipe.id)
+    draw_unused_recipe_id = db._draw_unused_recipe_id
+    monkeypatch.setattr(db, '_draw_unused_recipe_id', draw_recipe_id)
+    # Recipe taken concurrently is skipped and the next drawn one is taken.
+    assert (await db.take_random_recipe(user_id)).id == user_recipes[1].id
+    with pytest.raises(RandomRecipeDrawError):
+        await db.take_random_recipe(user_id)
+    monkeypatch.setattr(db, '_draw_unused_recipe_id', draw_unused_recipe_id)
+    await db.unuse_all_recipes(user_id)
+
+    # test_take_random_recipe_by_weighted_engine
+    monkeypatch.setattr(db, 'RANDOM_DRAW_ENGINE', WEIGHTED_DRAW_ENGINE)
+    taken_names = {(await db.take_random_recipe(user_id)).name for _ in range(2)}
+    assert taken_names == {recipe_name, recipe_name2}
+    assert len(db.recipe_samplers.get(user_id)) == 0
+    random_recipe = await db.take_random_recipe(user_id)
+    assert random_recipe.is_used is True
+    user_stats = await db.get_user_stats(user_id)
+    assert user_stats.used == 1
+
+    # test_weighted_engine_reloads_empty_sampler_before_bag_reset
+    reset_used_recipes = db._reset_used_recipes
+    reset_tags = []
+
+    async def count_reset_used_recipes(user_id, tag=None):
+        reset_tags.append(tag)
+        return await reset_used_recipes(user_id, tag)
+    monkeypatch.setattr(db, '_reset_used_recipes', count_reset_used_recipes)
+    for take_all_recipes in (lambda: db.take_random_recipe(user_id), lambda: db.take_random_recipes(user_id, 2)):
+        while len(db.recipe_samplers.get(user_id)):
+            await db.take_random_recipe(user_id)
+        # Other bot process resets the bag, so in-process sampler is stale.
+        await collection.update_many(db._user_filter(user_id), {'$set': {'is_used': False}})
+        await take_all_recipes()
+        assert reset_tags == []
+    monkeypatch.setattr(db, '_reset_used_recipes', reset_used_recipes)
+    for cur_recipe in user_recipes:
+        await db.remove_recipe_by_id(user_id, cur_recipe.id)
+    await db._user_stats_collection().delete_one({'_id': user_id})
+
+
+async def test_shared_storage_mode(db, recipe_name, monkeypatch):
+    monkeypatch.setattr(db, 'MONGO_STORAGE_MODE', SHARED_STORAGE_MODE)
+    monkeypatch.setattr(db, 'MONGO_RECIPES_COLLECTION_NAME', 'TEST_SHARED_RECIPES')
+    user_id, other_user_id = 'TEST_SHARED_USER', 'TEST_SHARED_OTHER_USER'
+    await db.ensure_indexes()
+    await db.add_recipe_by_name(user_id, recipe_name)
+    assert await db.add_recipes_by_names(other_user_id, [recipe_name, recipe_name + '2']) == 2
+    user_recipes = await db.list_user_recipes(user_id)
+    assert [cur_recipe.name for cur_recipe in user_recipes] == [recipe_name]
+    assert (await db.get_user_stats(other_user_id)).total == 2
+
+    # Draws and resets of the bag don't touch recipes of other users.
+    recipe = await db.take_random_recipe(user_id)
+    assert recipe.id == user_recipes[0].id
+    assert (await db.take_random_recipe(user_id)).id == recipe.id
+    assert len(await db.take_random_recipes(other_user_id, 2)) == 2
+    assert (await db.get_user_stats(user_id)).used == 1
+    assert (await db.get_user_stats(other_user_id)).used == 2
+    assert [cur_recipe.id for cur_recipe in (await db.search_recipes(user_id, recipe_name)).recipes] == [recipe.id]
+
+    # Recipe of other user can't be found or removed by id.
+    with pytest.raises(UserHasNoSelectedRecipeError):
+        await db.find_recipe_by_id(other_user_id, recipe.id)
+    await db.remove_recipe_by_id(other_user_id, recipe.id)
+    assert (await db.find_recipe_by_id(user_id, recipe.id)).id == recipe.id
+    await db.remove_recipe_by_id(user_id, recipe.id)
+    assert await db.does_user_have_recipes(user_id) is False
+
+    await db.app_context.db_connection['TEST_SHARED_RECIPES'].drop()
+    await db._user_stats_collection().delete_many({'_id': {'$in': [user_id, other_user_id]}})
+
+
+async def test_weighted_engine_reloads_sampler_after_missed_draw(db, recipe_name, monkeypatch):
+    monkeypatch.setattr(db, 'RANDOM_DRAW_ENGINE', WEIGHTED_DRAW_ENGINE)
+    user_id = 'TEST_STALE_SAMPLER_USER'
+    await db.add_recipes_by_names(user_id, [f'{recipe_name}{number}' for number in range(8)])
+    await db.take_random_recipe(user_id)
+    # Other bot process uses more recipes than there are draw attempts, sampler still holds them.
+    collection = db._dispatch_user_id(user_id)
+    await collection.update_many(db._user_filter(user_id), {'$set': {'is_used': True}})
+    assert len(db.recipe_samplers.get(user_id)) > MAXIMUM_RANDOM_DRAW_ATTEMPTS
+    assert (await db.take_random_recipe(user_id)).is_used is True
+
+    await collection.delete_many(db._user_filter(user_id))
+    await db._user_stats_collection().delete_one({'_id': user_id})
+    db.recipe_samplers.invalidate(user_id)
+
+
+async def test_user_stats_written_while_counted(db, recipe_name, monkeypatch):
+    user_id = 'TEST_STATS_USER'
+    await db.add_recipe_by_name(user_id, recipe_name)
+    await db._user_stats_collection().delete_one({'_id': user_id})
+    count_user_stats = db._count_user_stats
+    counted_user_stats = []
+
+    async def count_user_stats_with_concurrent_write(user_id):
+        user_stats = await count_user_stats(user_id)
+        if not counted_user_stats:
+            # Recipe is added after recipes were counted, but before counters were saved.
+            await db.add_recipe_by_name(user_id, recipe_name + '2')
+        counted_user_stats.append(user_stats)
+        return user_stats
+
+    monkeypatch.setattr(db, '_count_user_stats', count_user_stats_with_concurrent_write)
+    assert (await db.get_user_stats(user_id)).total == 2
+    assert [user_stats.total for user_stats in counted_user_stats] == [1, 2]
+    monkeypatch.setattr(db, '_count_user_stats', count_user_stats)
+    await db.add_recipe_by_name(user_id, recipe_name + '3')
+    assert (await db.get_user_stats(user_id)).total == 3
+    user_stats_document = await db._user_stats_collection().find_one({'_id': user_id}, projection={'_id': False})
+    assert user_stats_document == {'total': 3, 'used': 0}
+
+    for recipe in await db.list_user_recipes(user_id):
+        await db.remove_recipe_by_id(user_id, recipe.id)
+    await db._user_stats_collection().delete_one({'_id': user_id})
+
+
+async def test_add_recipes_with_tags(db, recipe_name):
+    user_id = 'TEST_TAGS_IMPORT_USER'
+    recipes = [(recipe_name, ['soup']), (recipe_name + '2', []), (recipe_name, ['salad'])]
+    assert await db.add_recipes_with_tags(user_id, recipes) == 2
+    db.recipes_cache.invalidate(user_id)
+    user_recipes = await db.list_user_recipes(user_id)
+    assert sorted((cur_recipe.name, cur_recipe.tags) for cur_recipe in user_recipes) == [
+        (recipe_name, ('soup',)), (recipe_name + '2', ())]
+    assert (await db.take_random_recipe(user_id, tag='soup')).name == recipe_name
+
+    await db._dispatch_user_id(user_id).delete_many(db._user_filter(user_id))
+    await db._user_stats_collection().delete_one({'_id': user_id})
+    db.recipes_cache.invalidate(user_id)
+    db.recipe_samplers.invalidate(user_id)
+
+
+@pytest.mark.parametrize('setting', ['MONGO_STORAGE_MODE', 'RANDOM_DRAW_ENGINE'])
+def test_unknown_db_setting_is_rejected(setting, monkeypatch):
+    from app.data import config
+    from loader import AppContext
+    monkeypatch.setattr(config, setting, 'unknown')
+    with pytest.raises(ValueError):
+        AppContext().db_connection
@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.handler import CancelHandler
+
+from app.middlewares import DeduplicationMiddleware
+
+
+class FakeCallbackQuery:
+    def __init__(self, message_id):
+        self.message = SimpleNamespace(chat=SimpleNamespace(id=1), message_id=message_id)
+        self.inline_message_id = None
+        self.answers_count = 0
+
+    async def answer(self):
+        self.answers_count += 1
+
+
+def test_update_id_is_duplicate_within_window(timer):
+    middleware = DeduplicationMiddleware(window=60, max_size=100, timer=timer)
+    assert middleware.is_duplicate_update(1) is False
+    assert middleware.is_duplicate_update(2) is False
+    timer.now = 59
+    assert middleware.is_duplicate_update(1) is True
+    timer.now = 61
+    assert middleware.is_duplicate_update(1) is False
+
+
+def test_remembered_update_ids_are_bounded(timer):
+    middleware = DeduplicationMiddleware(window=60, max_size=2, timer=timer)
+    for update_id in (1, 2, 3):
+        assert middleware.is_duplicate_update(update_id) is False
+    assert middleware.is_duplicate_update(1) is False
+    assert middleware.is_duplicate_update(3) is True
+
+
+async def test_duplicate_update_is_cancelled():
+    middleware = DeduplicationMiddleware(window=60, max_size=100)
+    await middleware.on_pre_process_update(SimpleNamespace(update_id=1), {})
+    with pytest.raises(CancelHandler):
+        await middleware.on_pre_process_update(SimpleNamespace(update_id=1), {})
+
+
+async def test_failed_update_is_processed_again():
+    middleware = DeduplicationMiddleware(window=60, max_size=100)
+    update = SimpleNamespace(update_id=1)
+    await middleware.on_pre_process_update(update, {})
+    # Dispatcher raised, so there are no results.
+    await middleware.on_post_process_update(update, [], {})
+    await middleware.on_pre_process_update(update, {})
+    await middleware.on_post_process_update(update, [[]], {})
+    with pytest.raises(CancelHandler):
+        await middleware.on_pre_process_update(update, {})
+
+
+async def test_redelivery_of_failed_update_is_handled_by_dispatcher():
+    bot = Bot('123456789:AAHdqTcvCH1vGWJxfSeofSAs0K5PALDsaw')
+    dispatcher = Dispatcher(bot)
+    dispatcher.middleware.setup(DeduplicationMiddleware(window=60, max_size=100))
+    handled_texts = []
+
+    @dispatcher.message_handler()
+    async def fail_once(message):
+        handled_texts.append(message.text)
+        if len(handled_texts) == 1:
+            raise RuntimeError('DB is unavailable')
+
+    update = types.Update(update_id=1, message={
+        'message_id': 1, 'date': 0, 'text': 'soup', 'chat': {'id': 1, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'Test'},
+    })
+    with pytest.raises(RuntimeError):
+        await dispatcher.updates_handler.notify(update)
+    await dispatcher.updates_handler.notify(update)
+    await dispatcher.updates_handler.notify(update)
+    assert handled_texts == ['soup', 'soup']
+
+
+async def test_callback_of_message_in_progress_is_cancelled():
+    middleware = DeduplicationMiddleware(window=60, max_size=100)
+    data = {}
+    await middleware.on_pre_process_callback_query(FakeCallbackQuery(10), data)
+    double_tap = FakeCallbackQuery(10)
+    with pytest.raises(CancelHandler):
+        await middleware.on_pre_process_callback_query(double_tap, {})
+    assert double_tap.answers_count == 1
+    await middleware.on_pre_process_callback_query(FakeCallbackQuery(11), {})
+    await middleware.on_post_process_callback_query(FakeCallbackQuery(10), [], data)
+    await middleware.on_pre_process_callback_query(FakeCallbackQuery(10), {})
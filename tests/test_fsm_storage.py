@@ -0,0 +1,80 @@
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from app.constants import MEMORY_FSM_STORAGE, REDIS_FSM_STORAGE, SEARCH_QUERY_BUCKET_KEY
+from app.data import config
+from tests.fake_redis import FakeRedisServer
+
+
+TEST_TOKEN = '123456789:AAHdqTcvCH1vGWJxfSeofSAs0K5PALDsaw'
+CHAT_ID = 42
+# State of `/add` conversation waiting for recipe name.
+ADD_RECIPE_NAME_STATE = 'AddNewRecipeStates:recipe_name'
+
+
+@pytest.fixture
+async def redis_server():
+    server = FakeRedisServer()
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+def redis_config(redis_server, monkeypatch):
+    monkeypatch.setattr(config, 'FSM_STORAGE', REDIS_FSM_STORAGE)
+    monkeypatch.setattr(config, 'REDIS_HOST', '127.0.0.1')
+    monkeypatch.setattr(config, 'REDIS_PORT', redis_server.port)
+
+
+def build_storage():
+    from loader import AppContext
+    return AppContext().storage
+
+
+def test_memory_storage_is_default(monkeypatch):
+    monkeypatch.setattr(config, 'FSM_STORAGE', MEMORY_FSM_STORAGE)
+    assert isinstance(build_storage(), MemoryStorage)
+
+
+async def test_search_query_is_kept_when_dialog_is_finished(monkeypatch):
+    monkeypatch.setattr(config, 'FSM_STORAGE', MEMORY_FSM_STORAGE)
+    storage = build_storage()
+    await storage.update_bucket(chat=CHAT_ID, user=CHAT_ID, bucket={SEARCH_QUERY_BUCKET_KEY: 'soup'})
+    await storage.set_state(chat=CHAT_ID, user=CHAT_ID, state=ADD_RECIPE_NAME_STATE)
+    await storage.finish(chat=CHAT_ID, user=CHAT_ID)
+    assert await storage.get_bucket(chat=CHAT_ID, user=CHAT_ID) == {SEARCH_QUERY_BUCKET_KEY: 'soup'}
+
+
+def test_unknown_storage_is_rejected(monkeypatch):
+    monkeypatch.setattr(config, 'FSM_STORAGE', 'memcached')
+    with pytest.raises(ValueError):
+        build_storage()
+
+
+async def test_add_state_is_shared_between_workers(redis_config):
+    pytest.importorskip('aiogram.contrib.fsm_storage.redis', reason='needs `redis` extra')
+    from aiogram.contrib.fsm_storage.redis import RedisStorage2
+    bot = Bot(TEST_TOKEN)
+    # Each worker process builds its own storage connected to the same Redis.
+    first_worker, second_worker = (Dispatcher(bot, storage=build_storage()) for _ in range(2))
+    assert isinstance(first_worker.storage, RedisStorage2)
+
+    await first_worker.current_state(chat=CHAT_ID, user=CHAT_ID).set_state(ADD_RECIPE_NAME_STATE)
+    await first_worker.current_state(chat=CHAT_ID, user=CHAT_ID).update_data({'recipe_name': 'soup'})
+    second_worker_state = second_worker.current_state(chat=CHAT_ID, user=CHAT_ID)
+    assert await second_worker_state.get_state() == ADD_RECIPE_NAME_STATE
+    assert await second_worker_state.get_data() == {'recipe_name': 'soup'}
+
+    # `/add` conversation finished by the second worker is finished for the first one too.
+    await second_worker.storage.update_bucket(chat=CHAT_ID, user=CHAT_ID, bucket={SEARCH_QUERY_BUCKET_KEY: 'soup'})
+    await second_worker_state.finish()
+    assert await first_worker.current_state(chat=CHAT_ID, user=CHAT_ID).get_state() is None
+    # Query of `/find` is kept, so its page buttons still work.
+    assert await first_worker.storage.get_bucket(chat=CHAT_ID, user=CHAT_ID) == {SEARCH_QUERY_BUCKET_KEY: 'soup'}
+
+    for worker in (first_worker, second_worker):
+        await worker.storage.close()
+        await worker.storage.wait_closed()
+    await (await bot.get_session()).close()
@@ -0,0 +1,33 @@
+import pytest
+from loguru import logger
+
+from app.log_sampler import ExceptionLogSampler
+
+
+@pytest.fixture
+def records():
+    records = []
+    handler_id = logger.add(lambda message: records.append(message.record), level='DEBUG')
+    yield records
+    logger.remove(handler_id)
+
+
+def test_traceback_is_logged_once_per_interval(records, timer):
+    sampler = ExceptionLogSampler(interval=60, timer=timer)
+    for now in (0, 10, 20, 61):
+        timer.now = now
+        sampler.exception(ValueError('boom'), 'failed', user_id=1)
+
+    assert [record['level'].name for record in records] == ['ERROR', 'WARNING', 'WARNING', 'ERROR']
+    assert records[0]['exception'] is not None
+    assert records[1]['exception'] is None
+    assert '2 tracebacks of ValueError suppressed' in records[3]['message']
+    assert all(record['extra'] == {'user_id': 1} for record in records)
+
+
+def test_exception_types_are_sampled_separately(records, timer):
+    sampler = ExceptionLogSampler(interval=60, timer=timer)
+    sampler.exception(ValueError('boom'), 'failed')
+    sampler.exception(KeyError('boom'), 'failed')
+
+    assert [record['level'].name for record in records] == ['ERROR', 'ERROR']
@@ -0,0 +1,48 @@
+import copy
+import threading
+
+import pytest
+from loguru import logger
+
+from app.log_writer import BackgroundLogWriter
+
+
+@pytest.fixture
+def log_writer():
+    # Copy of logger would get default stderr sink, as loader removes it.
+    logger.remove()
+    log_writer = BackgroundLogWriter(copy.deepcopy(logger))
+    yield log_writer
+    log_writer.stop()
+
+
+def test_records_are_formatted_by_writer_thread(log_writer):
+    written = []
+    log_writer.writer_logger.add(lambda message: written.append((threading.current_thread().name, message)),
+                                 format='{message} {extra[user_id]}\n{exception}', level='DEBUG')
+    log_writer.start()
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        logger.bind(user_id=1).exception('failed {}')
+    logger.bind(user_id=2).debug('handled')
+    log_writer.stop()
+
+    assert [thread_name for thread_name, _ in written] == ['log-writer', 'log-writer']
+    failed_message, handled_message = (message for _, message in written)
+    assert failed_message.startswith('failed {} 1\n')
+    assert 'ValueError: boom' in failed_message
+    assert failed_message.record['thread'].name == threading.current_thread().name
+    assert handled_message.startswith('handled 2')
+    assert handled_message.record['level'].name == 'DEBUG'
+
+
+def test_records_below_level_are_not_queued(log_writer):
+    written = []
+    log_writer.writer_logger.add(written.append, level='DEBUG')
+    log_writer.start(level='INFO')
+    logger.debug('handled')
+    logger.info('started')
+    log_writer.stop()
+
+    assert [message.record['message'] for message in written] == ['started']
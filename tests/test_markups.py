@@ -0,0 +1,27 @@
+from bson.objectid import ObjectId
+
+from app.callback_data_schema import decode_callback_data
+from app.keyboards.markups import recipe_details_markup, recipes_list_inline_keyboard_markup
+from app.recipe_shema import RecipeRecord
+
+
+def test_list_buttons_are_rendered_once():
+    recipe = RecipeRecord(id=ObjectId(), name='soup')
+    first_markup = recipes_list_inline_keyboard_markup([recipe])
+    second_markup = recipes_list_inline_keyboard_markup([recipe])
+    assert first_markup.inline_keyboard[0][0] is second_markup.inline_keyboard[0][0]
+    assert first_markup is not second_markup
+
+
+def test_rendered_buttons_follow_recipe_state():
+    recipe = RecipeRecord(id=ObjectId(), name='soup')
+    used_recipe = recipe._replace(is_used=True)
+    button = recipes_list_inline_keyboard_markup([recipe]).inline_keyboard[0][0]
+    used_button = recipes_list_inline_keyboard_markup([used_recipe]).inline_keyboard[0][0]
+    assert button.text == 'soup'
+    assert used_button.text == 'soup\U0001F373'
+
+    toggle_button = recipe_details_markup(recipe).inline_keyboard[0][0]
+    used_toggle_button = recipe_details_markup(used_recipe).inline_keyboard[0][0]
+    assert decode_callback_data(toggle_button.callback_data) == {'action': 'use', 'id': recipe.id}
+    assert decode_callback_data(used_toggle_button.callback_data) == {'action': 'unuse', 'id': recipe.id}
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+from pymongo import monitoring
+
+from app.metrics import MongoCommandMetricsListener, MongoPoolMetricsListener, instrument_db_operation
+
+
+listener = MongoCommandMetricsListener()
+
+
+def get_round_trips(operation, command):
+    labels = {'operation': operation, 'command': command}
+    return REGISTRY.get_sample_value('bot_mongo_round_trips_total', labels) or 0
+
+
+@instrument_db_operation
+async def fake_find_operation():
+    listener.started(SimpleNamespace(command_name='find'))
+
+
+@instrument_db_operation
+async def fake_outer_operation():
+    listener.started(SimpleNamespace(command_name='update'))
+    await fake_find_operation()
+
+
+@instrument_db_operation
+async def fake_failed_operation():
+    raise RuntimeError
+
+
+async def test_round_trips_are_accounted_to_outermost_operation():
+    await fake_outer_operation()
+    assert get_round_trips('fake_outer_operation', 'update') == 1
+    assert get_round_trips('fake_outer_operation', 'find') == 1
+    assert get_round_trips('fake_find_operation', 'find') == 0
+    await fake_find_operation()
+    assert get_round_trips('fake_find_operation', 'find') == 1
+
+
+async def test_failed_operation_is_counted():
+    with pytest.raises(RuntimeError):
+        await fake_failed_operation()
+    labels = {'operation': 'fake_failed_operation'}
+    assert REGISTRY.get_sample_value('bot_db_operation_errors_total', labels) == 1
+    assert REGISTRY.get_sample_value('bot_db_operation_latency_seconds_count', labels) == 1
+
+
+def test_pool_listener_reports_checkout_wait_and_usage():
+    pool_listener = MongoPoolMetricsListener()
+    address = ('localhost', 27017)
+    wait_count_before = REGISTRY.get_sample_value('bot_mongo_pool_wait_seconds_count')
+    checked_out_before = REGISTRY.get_sample_value('bot_mongo_pool_checked_out')
+    pool_listener.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+    assert REGISTRY.get_sample_value('bot_mongo_pool_waiting') == 1
+    pool_listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, 1))
+    assert REGISTRY.get_sample_value('bot_mongo_pool_waiting') == 0
+    assert REGISTRY.get_sample_value('bot_mongo_pool_checked_out') == checked_out_before + 1
+    assert REGISTRY.get_sample_value('bot_mongo_pool_wait_seconds_count') == wait_count_before + 1
+    pool_listener.connection_checked_in(monitoring.ConnectionCheckedInEvent(address, 1))
+    assert REGISTRY.get_sample_value('bot_mongo_pool_checked_out') == checked_out_before
+
+
+def test_pool_listener_counts_checkout_failures():
+    pool_listener = MongoPoolMetricsListener()
+    address = ('localhost', 27017)
+    pool_listener.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+    pool_listener.connection_check_out_failed(
+        monitoring.ConnectionCheckOutFailedEvent(address, monitoring.ConnectionCheckOutFailedReason.TIMEOUT))
+    labels = {'reason': monitoring.ConnectionCheckOutFailedReason.TIMEOUT}
+    assert REGISTRY.get_sample_value('bot_mongo_pool_checkout_failures_total', labels) == 1
+    assert REGISTRY.get_sample_value('bot_mongo_pool_waiting') == 0
@@ -0,0 +1,49 @@
+import pytest
+from bson.objectid import ObjectId
+
+from app.constants import SHARED_STORAGE_MODE
+
+
+USER_ID = 990000001
+OTHER_USER_ID = 990000002
+
+
+@pytest.fixture
+def migrate():
+    import migrate
+    return migrate
+
+
+@pytest.fixture
+async def collections():
+    from loader import app_context
+    user_collection = app_context.db_connection[str(USER_ID)]
+    recipes_collection = app_context.db_connection['TEST_MIGRATION_RECIPES']
+    yield user_collection, recipes_collection
+    await user_collection.drop()
+    await recipes_collection.drop()
+
+
+async def test_sync_user_collection(migrate, collections):
+    user_collection, recipes_collection = collections
+    first_id, second_id = ObjectId(), ObjectId()
+    await user_collection.insert_many([{'_id': first_id, 'name': 'first', 'is_used': False},
+                                       {'_id': second_id, 'name': 'second', 'is_used': False}])
+    other_user_recipe = {'_id': ObjectId(), 'name': 'other', 'is_used': False, 'user_id': OTHER_USER_ID}
+    await recipes_collection.insert_one(other_user_recipe)
+    assert await migrate.sync_user_collection(user_collection, recipes_collection, batch_size=1) == (2, 0)
+    assert await migrate.sync_user_collection(user_collection, recipes_collection, batch_size=1) == (0, 0)
+
+    # Changes and removals made after the previous run are synced.
+    await user_collection.update_one({'_id': first_id}, {'$set': {'is_used': True}})
+    await user_collection.delete_one({'_id': second_id})
+    assert await migrate.sync_user_collection(user_collection, recipes_collection, batch_size=1) == (1, 1)
+    copied_recipes = await recipes_collection.find({'user_id': USER_ID}).to_list(None)
+    assert copied_recipes == [{'_id': first_id, 'name': 'first', 'is_used': True, 'user_id': USER_ID}]
+    assert await recipes_collection.find_one({'_id': other_user_recipe['_id']}) == other_user_recipe
+
+
+async def test_migration_refuses_to_run_in_shared_mode(migrate, monkeypatch):
+    monkeypatch.setattr(migrate, 'MONGO_STORAGE_MODE', SHARED_STORAGE_MODE)
+    with pytest.raises(RuntimeError):
+        await migrate.migrate_to_shared_collection(batch_size=1)
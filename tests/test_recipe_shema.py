@@ -0,0 +1,18 @@
+from app.recipe_shema import Recipe, normalize_recipe_tag, recipe_name_key, split_recipe_tags
+
+
+def test_recipe_name_key_ignores_case_and_spaces():
+    assert recipe_name_key('  Ёжики  в Тумане ') == 'ежики в тумане'
+
+
+def test_recipe_document_has_search_key():
+    assert Recipe(name='Борщ', tags=['суп']).dict() == {'name': 'Борщ', 'is_used': False,
+                                                        'name_key': 'борщ', 'tags': ['суп']}
+
+
+def test_split_recipe_tags():
+    assert split_recipe_tags('Омлет #Завтрак #быстро #завтрак') == ('Омлет', ['завтрак', 'быстро'])
+    assert split_recipe_tags('Омлет #a #b #c', maximum_tags_count=2) == ('Омлет', ['a', 'b'])
+    assert split_recipe_tags('C# на ужин') == ('C# на ужин', [])
+    assert split_recipe_tags('#только #теги') == ('#только #теги', [])
+    assert normalize_recipe_tag(' #Завтрак') == 'завтрак'
@@ -0,0 +1,56 @@
+import io
+import json
+
+from bson import json_util
+from bson.objectid import ObjectId
+
+from app.recipe_shema import RecipeRecord
+from app.recipes_export import write_recipes_csv, write_recipes_json
+from app.recipes_import import parse_recipes_from_csv
+
+
+test_recipes = [
+    RecipeRecord(id=ObjectId('666f6f2d6261722d71757578'), name='Борщ', is_used=True, tags=('обед', 'суп')),
+    RecipeRecord(id=ObjectId('666f6f2d6261722d71757579'), name='Salad, green'),
+]
+
+
+async def iterate_test_recipes():
+    for recipe in test_recipes:
+        yield recipe
+
+
+async def test_write_recipes_json():
+    export_file = io.StringIO()
+    written_count = await write_recipes_json(iterate_test_recipes(), export_file)
+    assert written_count == 2
+    exported_documents = json_util.loads(export_file.getvalue())
+    assert [RecipeRecord.from_document(document) for document in exported_documents] == test_recipes
+
+
+async def test_write_empty_recipes_json():
+    async def iterate_no_recipes():
+        return
+        yield
+
+    export_file = io.StringIO()
+    assert await write_recipes_json(iterate_no_recipes(), export_file) == 0
+    assert json.loads(export_file.getvalue()) == []
+
+
+async def test_write_recipes_csv():
+    export_file = io.StringIO(newline='')
+    written_count = await write_recipes_csv(iterate_test_recipes(), export_file)
+    assert written_count == 2
+    assert export_file.getvalue().splitlines() == [
+        'name,is_used,id,tags',
+        'Борщ,1,666f6f2d6261722d71757578,#обед #суп',
+        '"Salad, green",0,666f6f2d6261722d71757579,',
+    ]
+
+
+async def test_exported_csv_is_imported_with_tags():
+    export_file = io.StringIO(newline='')
+    await write_recipes_csv(iterate_test_recipes(), export_file)
+    export_file.seek(0)
+    assert list(parse_recipes_from_csv(export_file)) == [(recipe.name, list(recipe.tags)) for recipe in test_recipes]
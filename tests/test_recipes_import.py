@@ -0,0 +1,28 @@
+from app.recipes_import import is_csv_file_name, parse_recipe_names, parse_recipe_tags, parse_recipes_from_csv
+
+
+def test_parse_recipe_names():
+    lines = ['Borscht\n', '  \n', '  Pancakes  \r\n', '']
+    assert list(parse_recipe_names(lines)) == ['Borscht', 'Pancakes']
+
+
+def test_parse_recipes_from_csv():
+    lines = ['"Soup, chicken",30\r\n', '\r\n', 'Salad,5\r\n', ',1\r\n']
+    assert list(parse_recipes_from_csv(lines)) == [('Soup, chicken', []), ('Salad', [])]
+
+
+def test_parse_recipes_with_tags_from_exported_csv():
+    lines = ['name,is_used,id,tags\r\n', 'Soup,1,666f6f2d6261722d71757578,#Обед #суп #обед\r\n',
+             'Salad,0\r\n']
+    assert list(parse_recipes_from_csv(lines)) == [('Soup', ['обед', 'суп']), ('Salad', [])]
+
+
+def test_parse_recipe_tags():
+    assert parse_recipe_tags(' #Обед  # суп ') == ['обед', 'суп']
+    assert len(parse_recipe_tags(' '.join(f'#{number}' for number in range(20)))) == 10
+
+
+def test_is_csv_file_name():
+    assert is_csv_file_name('recipes.CSV') is True
+    assert is_csv_file_name('recipes.txt') is False
+    assert is_csv_file_name(None) is False
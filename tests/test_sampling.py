@@ -0,0 +1,83 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.sampling import FenwickTree, UserSamplers, WeightedSampler, recency_weight
+
+
+def test_fenwick_tree_appended_slots_match_built_tree():
+    weights = [random.Random(0).random() for _ in range(37)]
+    appended_tree = FenwickTree()
+    for weight in weights:
+        appended_tree.append(weight)
+    built_tree = FenwickTree(weights)
+    for count in range(len(weights) + 1):
+        assert appended_tree.prefix_sum(count) == pytest.approx(built_tree.prefix_sum(count))
+        assert appended_tree.prefix_sum(count) == pytest.approx(sum(weights[:count]))
+
+
+def test_fenwick_tree_finds_slot_by_cumulative_weight():
+    tree = FenwickTree([1, 0, 2, 3])
+    assert [tree.find(value) for value in (0, 0.5, 1, 2.9, 3, 5.9)] == [0, 0, 2, 2, 3, 3]
+    tree.set(2, 0)
+    assert tree.find(1) == 3
+
+
+def test_sampler_draws_proportionally_to_weights():
+    sampler = WeightedSampler(random.Random(0))
+    for key, weight in {'a': 1, 'b': 3, 'c': 6, 'd': 5}.items():
+        sampler.put(key, weight)
+    sampler.remove('d')
+    draws = Counter(sampler.draw() for _ in range(20000))
+    assert set(draws) == {'a', 'b', 'c'}
+    assert draws['a'] / 20000 == pytest.approx(0.1, abs=0.02)
+    assert draws['c'] / 20000 == pytest.approx(0.6, abs=0.02)
+
+
+def test_sampler_reuses_slots_of_removed_keys():
+    sampler = WeightedSampler(random.Random(0))
+    sampler.put('a', 1)
+    sampler.put('b', 1)
+    sampler.remove('a')
+    sampler.put('c', 1)
+    assert len(sampler) == 2 and 'a' not in sampler
+    assert sampler.total_weight == 2
+    assert {sampler.draw() for _ in range(100)} == {'b', 'c'}
+    sampler.remove('b')
+    sampler.remove('c')
+    assert sampler.draw() is None
+
+
+def test_sampler_built_from_weights_supports_updates():
+    sampler = WeightedSampler.from_weights([('a', 1), ('b', 0.5)], random.Random(0))
+    assert sampler.total_weight == 1.5
+    sampler.remove('a')
+    sampler.put('c', 2)
+    assert len(sampler) == 2
+    assert sampler.total_weight == 2.5
+    assert {sampler.draw() for _ in range(100)} == {'b', 'c'}
+
+
+def test_recency_weight_grows_with_time_since_use():
+    now = datetime(2022, 1, 15)
+    day = 24 * 60 * 60
+    assert recency_weight(None, now, 10 * day, 0.1) == 1
+    assert recency_weight(now, now, 10 * day, 0.1) == 0.1
+    assert recency_weight(now - timedelta(days=5), now, 10 * day, 0.1) == pytest.approx(0.5)
+    assert recency_weight(now - timedelta(days=30), now, 10 * day, 0.1) == 1
+
+
+def test_user_samplers_ignore_updates_of_users_without_sampler():
+    current_time = 0
+    samplers = UserSamplers(max_users=1, ttl=10, timer=lambda: current_time)
+    samplers.put(1, 'a', 1)
+    assert samplers.get(1) is None
+    samplers.set(1, WeightedSampler())
+    samplers.put(1, 'a', 1)
+    assert 'a' in samplers.get(1)
+    samplers.set(2, WeightedSampler())
+    assert samplers.get(1) is None
+    current_time = 10
+    assert samplers.get(2) is None
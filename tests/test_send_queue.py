@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from aiogram.bot.api import TelegramAPIServer
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.send_queue import SendScheduler, ThrottledBot, TokenBucket
+
+
+TEST_TOKEN = '123456789:AAHdqTcvCH1vGWJxfSeofSAs0K5PALDsaw'
+
+
+@pytest.fixture
+def scheduler(timer):
+    return SendScheduler(global_rate=30, chat_rate=1, chat_burst=2, max_retries=2, retry_backoff=1,
+                         timer=timer, sleep=timer.sleep)
+
+
+def test_token_bucket_delays(timer):
+    bucket = TokenBucket(rate=2, capacity=2, timer=timer)
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1]
+    timer.now = 10
+    assert bucket.reserve() == 0
+
+
+def test_requests_sent_outside_take_only_free_tokens(scheduler, timer):
+    assert scheduler.try_acquire(None) is True
+    assert [scheduler.try_acquire(1) for _ in range(3)] == [True, True, False]
+    assert scheduler.try_acquire(2) is True
+    timer.now = 1
+    assert scheduler.try_acquire(1) is True
+    assert scheduler.sent_count == 4
+
+
+async def test_chat_rate_limit(scheduler, timer):
+    sent = []
+
+    async def send(data):
+        sent.append((timer.now, data['text']))
+
+    for number in range(3):
+        await scheduler.schedule('sendMessage', {'chat_id': 1, 'text': str(number)}, send)
+    await scheduler.schedule('sendMessage', {'chat_id': 2, 'text': 'other'}, send)
+    assert sent == [(0, '0'), (0, '1'), (1, '2'), (1, 'other')]
+
+
+async def test_waiting_edits_are_coalesced(scheduler, timer):
+    sent = []
+
+    async def send(data):
+        sent.append(data['text'])
+        return data['text']
+
+    # Exhaust the chat bucket so that edits have to wait.
+    for _ in range(2):
+        await scheduler.schedule('sendMessage', {'chat_id': 1, 'text': ''}, send)
+    sent.clear()
+    edits = [scheduler.schedule('editMessageText', {'chat_id': 1, 'message_id': 7, 'text': text}, send)
+             for text in ('first', 'second', 'third')]
+    results = await asyncio.gather(*edits)
+    assert sent == ['third']
+    assert results == ['third'] * 3
+    assert scheduler.coalesced_count == 2
+    assert scheduler.queue_depth == 0
+
+
+async def fake_bot_api(request):
+    """Fake Telegram Bot API which floods the first sendMessage."""
+    app = request.app
+    app['requests'].append(request.match_info['method'])
+    if len(app['requests']) == 1:
+        return web.json_response({'ok': False, 'error_code': 429,
+                                  'description': 'Too Many Requests: retry after 3',
+                                  'parameters': {'retry_after': 3}}, status=429)
+    payload = await request.post()
+    return web.json_response({'ok': True, 'result': {
+        'message_id': 1, 'date': 0, 'chat': {'id': int(payload['chat_id']), 'type': 'private'},
+        'text': payload['text']}})
+
+
+async def test_throttled_bot_retries_after_flood_control(scheduler, timer):
+    app = web.Application()
+    app['requests'] = []
+    app.router.add_post('/bot{token}/{method}', fake_bot_api)
+    async with TestServer(app) as server:
+        bot = ThrottledBot(TEST_TOKEN, scheduler=scheduler,
+                           server=TelegramAPIServer.from_base(str(server.make_url(''))))
+        try:
+            message = await bot.send_message(chat_id=1, text='hello')
+        finally:
+            await (await bot.get_session()).close()
+    assert message.text == 'hello'
+    assert app['requests'] == ['sendMessage', 'sendMessage']
+    assert timer.sleeps == [3]
+    assert scheduler.retried_count == 1
@@ -0,0 +1,114 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.webhook import BOT_DISPATCHER_KEY, SendMessage
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.send_queue import SendScheduler, ThrottledBot
+from app.webhook import (BACKGROUND_UPDATES_KEY, BackgroundUpdates, BackgroundWebhookRequestHandler,
+                         setup_background_updates)
+
+
+async def test_drain_waits_for_background_updates():
+    background_updates = BackgroundUpdates(response_timeout=0.1)
+    finished = []
+
+    async def process_update():
+        await asyncio.sleep(0.01)
+        finished.append(True)
+
+    background_updates.start(process_update())
+    assert len(background_updates) == 1
+    assert await background_updates.drain(timeout=1) == 0
+    assert finished == [True]
+    assert len(background_updates) == 0
+
+
+async def test_drain_cancels_updates_after_timeout():
+    background_updates = BackgroundUpdates(response_timeout=0.1)
+    task = background_updates.start(asyncio.sleep(10))
+    assert await background_updates.drain(timeout=0.01) == 1
+    await asyncio.sleep(0)
+    assert task.cancelled()
+
+
+class RecordingRequestsBot(Bot):
+    """Bot which records API requests instead of sending them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = []
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        self.requests.append((method, data['text']))
+        return {'message_id': 1, 'date': 0, 'chat': {'id': data['chat_id'], 'type': 'private'}, 'text': data['text']}
+
+
+class RecordingBot(ThrottledBot, RecordingRequestsBot):
+    """Bot with rate limiter which records API requests instead of sending them."""
+
+
+def make_update(update_id, text):
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': text,
+        'chat': {'id': 1, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': False, 'first_name': 'Test'},
+    }}
+
+
+async def test_webhook_answers_fast_updates_inline_and_slow_updates_in_background():
+    bot = Bot('123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA')
+    dispatcher = Dispatcher(bot)
+    slow_update_finished = asyncio.Event()
+
+    @dispatcher.message_handler(commands=['fast'])
+    async def fast(message):
+        return SendMessage(message.chat.id, 'fast')
+
+    @dispatcher.message_handler(commands=['slow'])
+    async def slow(message):
+        await asyncio.sleep(0.2)
+        slow_update_finished.set()
+
+    web_app = web.Application()
+    setup_background_updates(web_app, response_timeout=0.05, drain_timeout=1)
+    web_app.router.add_route('*', '/webhook', BackgroundWebhookRequestHandler)
+    web_app[BOT_DISPATCHER_KEY] = dispatcher
+
+    async with TestClient(TestServer(web_app)) as client:
+        response = await client.post('/webhook', json=make_update(1, '/fast'))
+        assert (await response.json())['method'] == 'sendMessage'
+        response = await client.post('/webhook', json=make_update(2, '/slow'))
+        assert await response.text() == 'ok'
+        assert not slow_update_finished.is_set()
+        assert len(web_app[BACKGROUND_UPDATES_KEY]) == 1
+    # Shutdown of test server drains background updates.
+    assert slow_update_finished.is_set()
+    await (await bot.get_session()).close()
+
+
+async def test_inline_responses_over_rate_limit_are_sent_by_request():
+    scheduler = SendScheduler(global_rate=30, chat_rate=10, chat_burst=1, max_retries=0, retry_backoff=1)
+    bot = RecordingBot('123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA', scheduler=scheduler)
+    dispatcher = Dispatcher(bot)
+
+    @dispatcher.message_handler(commands=['fast'])
+    async def fast(message):
+        return SendMessage(message.chat.id, message.text)
+
+    web_app = web.Application()
+    background_updates = setup_background_updates(web_app, response_timeout=0.05, drain_timeout=1)
+    web_app.router.add_route('*', '/webhook', BackgroundWebhookRequestHandler)
+    web_app[BOT_DISPATCHER_KEY] = dispatcher
+
+    async with TestClient(TestServer(web_app)) as client:
+        response = await client.post('/webhook', json=make_update(1, '/fast 1'))
+        assert (await response.json())['text'] == '/fast 1'
+        response = await client.post('/webhook', json=make_update(2, '/fast 2'))
+        assert await response.text() == 'ok'
+        # Response waits for the next token of chat in background.
+        assert len(background_updates) == 1
+        assert bot.requests == []
+    assert bot.requests == [('sendMessage', '/fast 2')]
+    await (await bot.get_session()).close()